@@ -2,7 +2,7 @@ from flask import Flask, render_template, redirect, url_for
 from flask_login import LoginManager, login_required, current_user
 import os
 
-from Conexoes import ObterSessaoSqlServer
+from Conexoes import ObterSessaoRequisicao, EncerrarSessaoRequisicao
 from Models.SQL_SERVER.Usuario import Usuario, UsuarioGrupo
 from Models.UsuarioModel import UsuarioSistema
 from Configuracoes import ConfiguracaoAtual # Importação da Configuração
@@ -41,6 +41,10 @@ GerenciadorLogin = LoginManager()
 GerenciadorLogin.init_app(app)
 GerenciadorLogin.login_view = 'Auth.Login' # Nome da rota para redirecionar quem não tá logado
 
+# Sessão SQL Server por requisição: todos os services que usam ObterSessaoRequisicao
+# compartilham a mesma conexão, devolvida ao pool ao final da requisição.
+app.teardown_appcontext(EncerrarSessaoRequisicao)
+
 @app.context_processor
 def InjetarDadosGlobais():
     """Disponibiliza a versão para todos os templates HTML"""
@@ -49,7 +53,7 @@ def InjetarDadosGlobais():
 
 @GerenciadorLogin.user_loader
 def CarregarUsuario(UserId):
-    Sessao = ObterSessaoSqlServer()
+    Sessao = ObterSessaoRequisicao()
     UsuarioEncontrado = None
 
     try:
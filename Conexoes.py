@@ -1,51 +1,175 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool
+import threading
+import weakref
+from flask import g, has_app_context
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import NullPool, QueuePool
 from Configuracoes import ConfiguracaoAtual
 
 # Carrega as URLs das configurações
 URL_BANCO_SQL = ConfiguracaoAtual.ObterUrlSqlServer()
 URL_BANCO_PG  = ConfiguracaoAtual.ObterUrlPostgres()
 
+# --- REGISTRO DE ENGINES (Único por processo) ---
+# Criar uma Engine é caro (dialeto, pool, handshake ODBC). Antes cada sessão criava a sua,
+# agora as Engines são criadas na primeira chamada e reaproveitadas por todas as threads.
+_Engines = {}
+_Fabricas = {}
+_TravaRegistro = threading.Lock()
+
+def _ObterOuCriar(Chave, Construtor):
+    Engine = _Engines.get(Chave)
+    if Engine is not None:
+        return Engine
+    with _TravaRegistro:
+        # Double-check: outra thread pode ter criado enquanto esperávamos a trava
+        if Chave not in _Engines:
+            _Engines[Chave] = Construtor()
+            _Fabricas[Chave] = sessionmaker(bind=_Engines[Chave])
+        return _Engines[Chave]
+
+def DescartarEngines():
+    """
+    Fecha todas as conexões dos pools e limpa o registro.
+    Útil em scripts de manutenção ou após fork de processo.
+    """
+    with _TravaRegistro:
+        for Engine in _Engines.values():
+            Engine.dispose()
+        _Engines.clear()
+        _Fabricas.clear()
+
 # --- SQL SERVER ---
-def ObterEngineSqlServer():
+def _CriarEngineSqlServer():
     """
-    Cria e retorna a Engine de conexão com o SQL Server (ERP).
-    Usa NullPool para evitar travamentos de sessão no servidor legado.
+    Monta a Engine do SQL Server conforme o modo de pool configurado.
+    - 'queue': QueuePool limitado (tamanho + overflow), com pre-ping e reciclagem.
+    - 'null' : modo legado com NullPool, cada sessão abre/fecha sua própria conexão.
+    Com SQL_FAST_EXECUTEMANY o pyodbc envia cada executemany (cargas em lote) de uma só vez.
     """
-    try:
-        Engine = create_engine(
-            URL_BANCO_SQL, 
-            poolclass=NullPool, 
+    # fast_executemany só existe no dialeto pyodbc
+    Extras = {}
+    if URL_BANCO_SQL.startswith('mssql+pyodbc') and ConfiguracaoAtual.SQL_FAST_EXECUTEMANY:
+        Extras['fast_executemany'] = True
+
+    if ConfiguracaoAtual.SQL_POOL_MODO == 'null':
+        return create_engine(
+            URL_BANCO_SQL,
+            poolclass=NullPool,
             # echo=ConfiguracaoAtual.MOSTRAR_LOGS_DB
-            echo=False
+            echo=False,
+            **Extras
         )
-        return Engine
+
+    return create_engine(
+        URL_BANCO_SQL,
+        poolclass=QueuePool,
+        pool_size=ConfiguracaoAtual.SQL_POOL_TAMANHO,
+        max_overflow=ConfiguracaoAtual.SQL_POOL_OVERFLOW,
+        pool_timeout=ConfiguracaoAtual.SQL_POOL_TIMEOUT,
+        pool_recycle=ConfiguracaoAtual.SQL_POOL_RECYCLE,
+        pool_pre_ping=ConfiguracaoAtual.SQL_POOL_PRE_PING,
+        pool_reset_on_return=ConfiguracaoAtual.SQL_POOL_RESET,
+        # echo=ConfiguracaoAtual.MOSTRAR_LOGS_DB
+        echo=False,
+        **Extras
+    )
+
+# Conexões cuja transação teve um comando com erro (ver SessaoRequisicao.close)
+_ConexoesComErro = weakref.WeakSet()
+
+def _MarcarErro(Contexto):
+    if Contexto.connection is not None and Contexto.connection.in_transaction():
+        _ConexoesComErro.add(Contexto.connection)
+
+def _CriarEngineSqlServerMonitorada():
+    Engine = _CriarEngineSqlServer()
+    event.listen(Engine, 'handle_error', _MarcarErro)
+    return Engine
+
+def ObterEngineSqlServer():
+    """
+    Retorna a Engine de conexão com o SQL Server (ERP), compartilhada pelo processo.
+    O modo de pool é definido em Configuracoes (SQL_POOL_MODO).
+    """
+    try:
+        return _ObterOuCriar('sqlserver', _CriarEngineSqlServerMonitorada)
     except Exception as Erro:
         print(f"❌ Erro crítico ao criar engine do SQL Server: {Erro}")
         return None
 
 def ObterSessaoSqlServer():
-    Engine = ObterEngineSqlServer()
-    if Engine:
-        return sessionmaker(bind=Engine)()
+    if ObterEngineSqlServer():
+        return _Fabricas['sqlserver']()
     return None
 
+# --- SESSÃO POR REQUISIÇÃO (Unit of Work) ---
+class SessaoRequisicao(Session):
+    """
+    Sessão compartilhada por todos os services durante uma mesma requisição HTTP.
+    O close() chamado pelos services no 'finally' não fecha a sessão: a conexão continua aberta
+    até o teardown do Flask (EncerrarSessaoRequisicao). Mas se algum comando falhou dentro da
+    transação (ou ela foi invalidada por um flush com erro), faz rollback: os except dos services
+    só registram o erro, e os próximos services da requisição não podem herdar a transação condenada.
+    """
+    def close(self):
+        Transacao = self.get_transaction()
+        if Transacao is None:
+            return
+        Conexao = self.connection() if Transacao.is_active else None
+        if not Transacao.is_active or Conexao in _ConexoesComErro:
+            if Conexao is not None:
+                _ConexoesComErro.discard(Conexao)
+            self.rollback()
+
+    def Encerrar(self):
+        super().close()
+
+def ObterSessaoRequisicao():
+    """
+    Retorna a sessão do SQL Server vinculada à requisição atual (flask.g).
+    Vários services chamados na mesma requisição reaproveitam a mesma conexão/transação.
+    Fora de um contexto Flask (scripts, threads de background) devolve uma sessão comum,
+    que deve ser fechada pelo chamador como de costume.
+    """
+    if not has_app_context():
+        return ObterSessaoSqlServer()
+
+    Sessao = g.get('_SessaoSqlServer')
+    if Sessao is None:
+        Engine = ObterEngineSqlServer()
+        if not Engine:
+            return None
+        Sessao = SessaoRequisicao(bind=Engine)
+        g._SessaoSqlServer = Sessao
+    return Sessao
+
+def EncerrarSessaoRequisicao(Excecao=None):
+    """
+    Registrado no teardown_appcontext: devolve a conexão da requisição ao pool.
+    Alterações não commitadas pelos services são descartadas (rollback).
+    """
+    Sessao = g.pop('_SessaoSqlServer', None)
+    if Sessao is not None:
+        try:
+            Sessao.rollback()
+        finally:
+            Sessao.Encerrar()
+
 # --- POSTGRESQL ---
 def ObterEnginePostgres():
     """
-    Cria e retorna a Engine do PostgreSQL (Banco da Aplicação).
+    Retorna a Engine do PostgreSQL (Banco da Aplicação), compartilhada pelo processo.
     Aqui usamos o pool padrão do SQLAlchemy (mais eficiente para a App Web).
     'pool_pre_ping=True' testa a conexão antes de usar, evitando erros de queda.
     """
     try:
-        Engine = create_engine(
-            URL_BANCO_PG, 
+        return _ObterOuCriar('postgres', lambda: create_engine(
+            URL_BANCO_PG,
             pool_pre_ping=True, # Verifica se o banco tá vivo antes de tentar query
             # echo=ConfiguracaoAtual.MOSTRAR_LOGS_DB
             echo=False
-        )
-        return Engine
+        ))
     except Exception as Erro:
         print(f"❌ Erro crítico ao criar engine do PostgreSQL: {Erro}")
         return None
@@ -55,7 +179,6 @@ def ObterSessaoPostgres():
     Fábrica de sessões para o PostgreSQL.
     Use esta função para manipular os dados da Malha Aérea.
     """
-    Engine = ObterEnginePostgres()
-    if Engine:
-        return sessionmaker(bind=Engine)()
-    return None
\ No newline at end of file
+    if ObterEnginePostgres():
+        return _Fabricas['postgres']()
+    return None
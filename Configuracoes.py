@@ -20,7 +20,37 @@ class ConfiguracaoBase:
     SQL_DB   = os.getenv("SQL_DB")
     SQL_USER = os.getenv("SQL_USER")
     SQL_PASS = os.getenv("SQL_PASS")
-    
+
+    # --- Pool de Conexões do SQL SERVER ---
+    # 'queue' = pool compartilhado pelo processo (padrão).
+    # 'null'  = modo legado: abre e fecha uma conexão física a cada sessão (NullPool).
+    #           Usar apenas em servidores que derrubam conexões ociosas ou travam sessões.
+    SQL_POOL_MODO     = os.getenv("SQL_POOL_MODO", "queue").lower()
+    SQL_POOL_TAMANHO  = int(os.getenv("SQL_POOL_TAMANHO", "6"))       # Conexões mantidas abertas (1 por thread do Waitress)
+    SQL_POOL_OVERFLOW = int(os.getenv("SQL_POOL_OVERFLOW", "4"))      # Conexões extras em pico
+    SQL_POOL_TIMEOUT  = int(os.getenv("SQL_POOL_TIMEOUT", "30"))      # Segundos aguardando conexão livre
+    SQL_POOL_RECYCLE  = int(os.getenv("SQL_POOL_RECYCLE", "1800"))    # Recicla conexões com mais de N segundos
+    SQL_POOL_PRE_PING = os.getenv("SQL_POOL_PRE_PING", "True").lower() == "true"
+    SQL_POOL_RESET    = os.getenv("SQL_POOL_RESET", "rollback").lower() # 'rollback' ou 'commit' ao devolver ao pool
+
+    # --- Carga em Massa (importação de remessas) ---
+    SQL_FAST_EXECUTEMANY = os.getenv("SQL_FAST_EXECUTEMANY", "True").lower() == "true" # pyodbc envia o lote inteiro de uma vez
+    SQL_BULK_LOTE        = int(os.getenv("SQL_BULK_LOTE", "5000"))                      # Linhas por executemany
+
+    # Importações em segundo plano (ImportacaoJobService). 1 = uma remessa por vez
+    IMPORTACAO_WORKERS = int(os.getenv("IMPORTACAO_WORKERS", "1"))
+
+    # Fila do planejamento: blocos Diário/Reversa/Backlog consultados em paralelo
+    PLANEJAMENTO_WORKERS       = int(os.getenv("PLANEJAMENTO_WORKERS", "4"))        # Threads (e conexões) para os blocos + mapa de planejamentos
+    PLANEJAMENTO_TIMEOUT_BLOCO = int(os.getenv("PLANEJAMENTO_TIMEOUT_BLOCO", "90")) # Segundos até um bloco ser entregue vazio com erro
+    PLANEJAMENTO_FILA_INTERVALO = int(os.getenv("PLANEJAMENTO_FILA_INTERVALO", "60")) # Segundos entre atualizações da fila compartilhada
+    PLANEJAMENTO_FILA_OCIOSO    = int(os.getenv("PLANEJAMENTO_FILA_OCIOSO", "600"))   # Para de atualizar após N segundos sem acessos
+
+    # Monitor de status de AWB (Server-Sent Events do painel de acompanhamento)
+    MONITOR_AWB_INTERVALO = int(os.getenv("MONITOR_AWB_INTERVALO", "15"))  # Segundos entre consultas ao TB_AWB_STATUS
+    MONITOR_AWB_OCIOSO    = int(os.getenv("MONITOR_AWB_OCIOSO", "300"))    # Para a consulta após N segundos sem painel conectado
+    MONITOR_AWB_JANELA    = int(os.getenv("MONITOR_AWB_JANELA", "120"))    # Segundos relidos antes da marca d'água (commits atrasados)
+
     # --- Configurações do POSTGRESQL (Banco da Aplicação/Malha) ---
     PG_HOST = os.getenv("PGDB_HOST", "localhost")
     PG_PORT = os.getenv("PGDB_PORT", "5432")
@@ -28,6 +58,10 @@ class ConfiguracaoBase:
     PG_PASS = os.getenv("PGDB_PASSWORD", "")
     PG_DRIVER = os.getenv("PGDB_DRIVER", "psycopg") # Ex: psycopg2 ou psycopg (v3)
 
+    # Motor de busca de rotas: 'classico' (all_simple_paths, padrão), 'pareto' (fronteira multicritério),
+    # 'csa' (Connection Scan) ou 'comparar' (roda os três, registra no log as diferenças e devolve o clássico)
+    MOTOR_ROTAS = os.getenv("MOTOR_ROTAS", "classico").lower()
+
     AD_SERVER = os.getenv("LDAP_SERVER")
     AD_DOMAIN = os.getenv("LDAP_DOMAIN")
     
@@ -69,6 +103,9 @@ class ConfiguracaoDesenvolvimento(ConfiguracaoBase):
     DEBUG = True
     # Define o nome do banco específico para DEV
     PG_DB_NAME = os.getenv("PGDB_NAME_DEV", "Luft-ConnectAir_DEV")
+    # Em DEV o servidor roda single-thread (app.run), pool pequeno é suficiente
+    SQL_POOL_TAMANHO  = int(os.getenv("SQL_POOL_TAMANHO", "2"))
+    SQL_POOL_OVERFLOW = int(os.getenv("SQL_POOL_OVERFLOW", "2"))
 
 class ConfiguracaoHomologacao(ConfiguracaoBase):
     DEBUG = False
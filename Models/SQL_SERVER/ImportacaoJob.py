@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from datetime import datetime
+from Models.SQL_SERVER.Base import Base
+
+class ImportacaoJob(Base):
+    """Importação de remessa (Malha, Frete, Cidades, Aeroportos) executada em segundo plano."""
+    __tablename__ = 'Tb_PLN_ImportacaoJob'
+    __table_args__ = {'schema': 'intec.dbo'}
+
+    Id = Column(Integer, primary_key=True, autoincrement=True)
+    Tipo = Column(String(20), nullable=False, index=True)       # Malha | Frete | Cidades | Aeroportos
+    Status = Column(String(20), nullable=False, default='Pendente') # Pendente | Processando | Concluido | Erro
+    Fase = Column(String(100))
+    LinhasProcessadas = Column(Integer, default=0)
+    Mensagem = Column(String(1000))
+    NomeArquivo = Column(String(255))
+    Usuario = Column(String(100))
+    DataCriacao = Column(DateTime, default=datetime.now)
+    DataInicio = Column(DateTime)
+    DataFim = Column(DateTime)
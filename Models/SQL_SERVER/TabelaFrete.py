@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime, Boolean, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, Date, DateTime, Boolean, ForeignKey, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from Models.SQL_SERVER.Base import Base
@@ -18,7 +18,12 @@ class RemessaFrete(Base):
 
 class TabelaFrete(Base):
     __tablename__ = 'Tb_PLN_Frete'
-    __table_args__ = {'schema': 'intec.dbo'}
+    __table_args__ = (
+        # Busca de tarifa por igualdade nas chaves normalizadas (ver SQL/TabelaFreteChaves.sql)
+        Index('IX_PLN_Frete_Chave', 'OrigemChave', 'DestinoChave', 'CiaChave', 'IdRemessa',
+              mssql_include=['Tarifa', 'Servico']),
+        {'schema': 'intec.dbo'}
+    )
 
     Id = Column(Integer, primary_key=True, autoincrement=True)
     IdRemessa = Column(Integer, ForeignKey('intec.dbo.Tb_PLN_RemessaFrete.Id'), nullable=False, index=True)
@@ -28,5 +33,10 @@ class TabelaFrete(Base):
     CiaAerea = Column(String(20), nullable=False)
     Servico = Column(String(100), nullable=False)
     Tarifa = Column(Float)
+
+    # Chaves normalizadas na importação (UPPER/TRIM e Cia padronizada)
+    OrigemChave = Column(String(5))
+    DestinoChave = Column(String(5))
+    CiaChave = Column(String(20))
     
     Remessa = relationship("RemessaFrete", back_populates="Itens")
\ No newline at end of file
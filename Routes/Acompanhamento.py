@@ -1,6 +1,7 @@
 from datetime import datetime
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, render_template, request, jsonify, Response
 from Services.AcompanhamentoService import AcompanhamentoService
+from Services.MonitorStatusAwbService import MonitorStatusAwbService
 from Services.LogService import LogService
 from Services.PermissaoService import RequerPermissao
 
@@ -39,6 +40,16 @@ def ApiListarAwbs():
     dados = AcompanhamentoService.ListarAwbs(filtros)
     return jsonify(dados)
 
+@AcompanhamentoBP.route('/Api/StreamStatus', methods=['GET'])
+def ApiStreamStatus():
+    # EventSource reenvia o último id recebido no cabeçalho Last-Event-ID ao reconectar.
+    # A resposta é curta (não prende uma thread do Waitress): o 'retry' agenda a próxima conexão.
+    return Response(
+        MonitorStatusAwbService.MontarEventos(request.headers.get('Last-Event-ID')),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @AcompanhamentoBP.route('/Api/Historico/<path:numero_awb>', methods=['GET'])
 def ApiHistorico(numero_awb):
     LogService.Debug("AcompanhamentoRoute", f"API /Historico chamada para {numero_awb}")
@@ -1,10 +1,13 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+import os
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
 from flask_login import login_required, current_user
 from datetime import datetime
 # Importa a CLASSE do Serviço agora, não as funções soltas
-from Services.AeroportosService import AeroportoService
+from Services.AeroportosService import AeroportoService, DIR_TEMP as DIR_TEMP_AEROPORTOS
+from Services.ImportacaoJobService import ImportacaoJobService
 from Services.LogService import LogService
 from Services.PermissaoService import RequerPermissao # <--- Import Log
+from Utils.Snapshot import ResolverUpload
 
 AeroportoBp = Blueprint('Aeroporto', __name__)
 
@@ -45,49 +48,57 @@ def Gerenciar():
                     if Info['conflito']:
                         ModalConfirmacao = True
                         DadosConfirmacao = Info
+                        # O arquivo analisado fica na sessão: o formulário de confirmação não informa caminhos
+                        session['upload_aeroportos'] = os.path.basename(Info['caminho_temp'])
                         LogService.Info("Route.Aeroportos", "Conflito detectado, solicitando confirmação ao usuário.")
                     else:
-                        # Chamada corrigida
-                        Ok, Msg = AeroportoService.ProcessarAeroportosFinal(
+                        IdJob = ImportacaoJobService.Enfileirar(
+                            'Aeroportos', Info['nome_arquivo'], current_user.Login,
+                            AeroportoService.ProcessarAeroportosFinal,
                             Info['caminho_temp'], 
                             Info['mes_ref'], 
                             Info['nome_arquivo'], 
                             current_user.Login, 
                             'Importacao'
                         )
-                        if Ok: flash(Msg, 'success')
-                        else: flash(Msg, 'danger')
-                        return redirect(url_for('Aeroporto.Gerenciar'))
+                        if IdJob: flash(f'Importação enviada para processamento (Job #{IdJob}).', 'info')
+                        else: flash('Não foi possível iniciar a importação.', 'danger')
+                        return redirect(url_for('Aeroporto.Gerenciar', job=IdJob))
 
         # --- Confirmação do Modal ---
         elif 'confirmar_substituicao' in request.form:
             LogService.Info("Route.Aeroportos", f"Usuário {current_user.Login} confirmou substituição de base.")
-            CaminhoTemp = request.form.get('caminho_temp')
+            CaminhoTemp = ResolverUpload(DIR_TEMP_AEROPORTOS, session.pop('upload_aeroportos', None))
             NomeOriginal = request.form.get('nome_arquivo')
+            if not CaminhoTemp:
+                flash('O arquivo analisado não está mais disponível. Envie o CSV novamente.', 'warning')
+                return redirect(url_for('Aeroporto.Gerenciar'))
             MesStr = request.form.get('mes_ref') # Vem como 'YYYY-MM-DD'
             
             # Limpeza de segurança da data
             if MesStr and ' ' in MesStr: MesStr = MesStr.split(' ')[0]
             DataRef = datetime.strptime(MesStr, '%Y-%m-%d').date()
 
-            # Chamada corrigida
-            Ok, Msg = AeroportoService.ProcessarAeroportosFinal(
+            IdJob = ImportacaoJobService.Enfileirar(
+                'Aeroportos', NomeOriginal, current_user.Login,
+                AeroportoService.ProcessarAeroportosFinal,
                 CaminhoTemp, 
                 DataRef, 
                 NomeOriginal, 
                 current_user.Login, 
                 'Substituicao'
             )
-            if Ok: flash(Msg, 'success')
-            else: flash(Msg, 'danger')
-            return redirect(url_for('Aeroporto.Gerenciar'))
+            if IdJob: flash(f'Substituição enviada para processamento (Job #{IdJob}).', 'info')
+            else: flash('Não foi possível iniciar a substituição.', 'danger')
+            return redirect(url_for('Aeroporto.Gerenciar', job=IdJob))
 
     # Chamada corrigida
     Historico = AeroportoService.ListarRemessasAeroportos()
     return render_template('Aeroportos/Manager.html', 
                            ListaRemessas=Historico, 
                            ExibirModal=ModalConfirmacao, 
-                           DadosModal=DadosConfirmacao)
+                           DadosModal=DadosConfirmacao,
+                           JobImportacao=request.args.get('job', type=int))
 
 @AeroportoBp.route('/Aeroportos/Excluir/<int:id_remessa>')
 @login_required
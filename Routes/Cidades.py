@@ -1,9 +1,12 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+import os
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from flask_login import login_required, current_user
 from datetime import datetime
 from Services.CidadesService import CidadesService
+from Services.ImportacaoJobService import ImportacaoJobService
 from Services.LogService import LogService
 from Services.PermissaoService import RequerPermissao # <--- Import Log
+from Utils.Snapshot import ResolverUpload
 
 CidadeBp = Blueprint('Cidade', __name__)
 
@@ -31,27 +34,41 @@ def Gerenciar():
                     if Info['conflito']:
                         ModalConfirmacao = True
                         DadosConfirmacao = Info
+                        # O arquivo analisado fica na sessão: o formulário de confirmação não informa caminhos
+                        session['upload_cidades'] = os.path.basename(Info['caminho_temp'])
                         LogService.Info("Route.Cidades", "Conflito detectado. Aguardando confirmação.")
                     else:
-                        Ok, Msg = CidadesService.ProcessarArquivoFinal(Info['caminho_temp'], Info['mes_ref'], Info['nome_arquivo'], current_user.Login, 'Importacao')
-                        if Ok: flash(Msg, 'success')
-                        else: flash(Msg, 'danger')
-                        return redirect(url_for('Cidade.Gerenciar'))
+                        IdJob = ImportacaoJobService.Enfileirar(
+                            'Cidades', Info['nome_arquivo'], current_user.Login,
+                            CidadesService.ProcessarArquivoFinal,
+                            Info['caminho_temp'], Info['mes_ref'], Info['nome_arquivo'], current_user.Login, 'Importacao'
+                        )
+                        if IdJob: flash(f'Importação enviada para processamento (Job #{IdJob}).', 'info')
+                        else: flash('Não foi possível iniciar a importação.', 'danger')
+                        return redirect(url_for('Cidade.Gerenciar', job=IdJob))
 
         # Confirmação do Modal
         elif 'confirmar_substituicao' in request.form:
             LogService.Info("Route.Cidades", f"Usuário {current_user.Login} confirmou substituição de cidades.")
-            Caminho = request.form.get('caminho_temp')
+            Caminho = ResolverUpload(CidadesService.DIR_TEMP, session.pop('upload_cidades', None))
             Nome = request.form.get('nome_arquivo')
+            if not Caminho:
+                flash('O arquivo analisado não está mais disponível. Envie o arquivo novamente.', 'warning')
+                return redirect(url_for('Cidade.Gerenciar'))
             DataRef = datetime.strptime(request.form.get('mes_ref'), '%Y-%m-%d').date()
             
-            Ok, Msg = CidadesService.ProcessarArquivoFinal(Caminho, DataRef, Nome, current_user.Login, 'Substituicao')
-            if Ok: flash(Msg, 'success')
-            else: flash(Msg, 'danger')
-            return redirect(url_for('Cidade.Gerenciar'))
+            IdJob = ImportacaoJobService.Enfileirar(
+                'Cidades', Nome, current_user.Login,
+                CidadesService.ProcessarArquivoFinal,
+                Caminho, DataRef, Nome, current_user.Login, 'Substituicao'
+            )
+            if IdJob: flash(f'Substituição enviada para processamento (Job #{IdJob}).', 'info')
+            else: flash('Não foi possível iniciar a substituição.', 'danger')
+            return redirect(url_for('Cidade.Gerenciar', job=IdJob))
 
     Historico = CidadesService.ListarRemessas()
-    return render_template('Cidades/Manager.html', ListaRemessas=Historico, ExibirModal=ModalConfirmacao, DadosModal=DadosConfirmacao)
+    return render_template('Cidades/Manager.html', ListaRemessas=Historico, ExibirModal=ModalConfirmacao, DadosModal=DadosConfirmacao,
+                           JobImportacao=request.args.get('job', type=int))
 
 @CidadeBp.route('/Cidades/Excluir/<int:id_remessa>')
 @login_required
@@ -29,6 +29,7 @@ def ApiOtimizarRotas():
         origem = request.args.get('origem', '').upper()
         destino = request.args.get('destino', '').upper()
         peso_str = request.args.get('peso', '100')
+        motor = request.args.get('motor') # Opcional: 'pareto', 'classico', 'csa' ou 'comparar'
 
         # 2. Validações Básicas
         if not (data_inicio_str and data_fim_str and origem and destino):
@@ -49,7 +50,8 @@ def ApiOtimizarRotas():
             data_fim=dt_fim,
             lista_origens=origem,   # Antes era origem_iata
             lista_destinos=destino, # Antes era destino_iata
-            peso_total=peso
+            peso_total=peso,
+            motor=motor
         )
 
         # Verifica se alguma rota foi encontrada
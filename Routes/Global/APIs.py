@@ -6,6 +6,7 @@ from Services.Shared.AwbService import AwbService
 from Services.Shared.CtcService import CtcService
 from Services.LogService import LogService
 from Services.Shared.VoosDataService import ObterTotalVoosData
+from Services.ImportacaoJobService import ImportacaoJobService
 
 GlobalBp = Blueprint('Global', __name__)
 
@@ -46,4 +47,13 @@ def ApiVoosHoje():
     Hoje = datetime.now()
     # Chama a função do Service que aceita a data
     Quantidade = ObterTotalVoosData(Hoje)
-    return jsonify(Quantidade)  
\ No newline at end of file
+    return jsonify(Quantidade)  
+
+@GlobalBp.route('/API/Importacao/<int:id_job>')
+@login_required
+def ApiImportacaoStatus(id_job):
+    """Progresso de uma importação em segundo plano (fase, linhas processadas, erro)."""
+    Dados = ImportacaoJobService.ObterJob(id_job)
+    if not Dados:
+        return jsonify({'erro': 'Job não encontrado'}), 404
+    return jsonify(Dados)
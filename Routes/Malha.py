@@ -1,9 +1,12 @@
-from flask import Blueprint, jsonify, render_template, request, redirect, url_for, flash
+import os
+from flask import Blueprint, jsonify, render_template, request, redirect, url_for, flash, session
 from flask_login import login_required, current_user
 from datetime import datetime
 from Services.MalhaService import MalhaService
+from Services.ImportacaoJobService import ImportacaoJobService
 from Services.LogService import LogService
 from Services.PermissaoService import RequerPermissao # <--- Import Adicionado
+from Utils.Snapshot import ResolverUpload
 MalhaBp = Blueprint('Malha', __name__)
 
 @MalhaBp.route('/Malha/API/Rotas')
@@ -61,23 +64,30 @@ def Gerenciar():
                         LogService.Info("Routes.Malha", "Conflito de malha detectado. Aguardando confirmação do usuário.")
                         ModalConfirmacao = True
                         DadosConfirmacao = Info
+                        # O arquivo analisado fica na sessão: o formulário de confirmação não informa caminhos
+                        session['upload_malha'] = os.path.basename(Info['caminho_temp'])
                     else:
-                        # Se NÃO tem conflito, processa direto como 'Importação'
-                        Ok, Msg = MalhaService.ProcessarMalhaFinal(
+                        # Se NÃO tem conflito, processa direto como 'Importação' (em segundo plano)
+                        IdJob = ImportacaoJobService.Enfileirar(
+                            'Malha', Info['nome_arquivo'], current_user.Login,
+                            MalhaService.ProcessarMalhaFinal,
                             Info['caminho_temp'], 
                             Info['mes_ref'], 
                             Info['nome_arquivo'], 
                             current_user.Login, 
                             'Importacao'
                         )
-                        if Ok: flash(Msg, 'success')
-                        else: flash(Msg, 'danger')
-                        return redirect(url_for('Malha.Gerenciar'))
+                        if IdJob: flash(f'Importação enviada para processamento (Job #{IdJob}).', 'info')
+                        else: flash('Não foi possível iniciar a importação.', 'danger')
+                        return redirect(url_for('Malha.Gerenciar', job=IdJob))
 
         # --- FLUXO 2: Confirmação de Substituição (Vem do Modal) ---
         elif 'confirmar_substituicao' in request.form:
-            CaminhoTemp = request.form.get('caminho_temp')
+            CaminhoTemp = ResolverUpload(MalhaService.DIR_TEMP, session.pop('upload_malha', None))
             NomeOriginal = request.form.get('nome_arquivo')
+            if not CaminhoTemp:
+                flash('O arquivo analisado não está mais disponível. Envie a malha novamente.', 'warning')
+                return redirect(url_for('Malha.Gerenciar'))
             
             # Recupera a data do formulário (Ex: "2026-01-01" ou "2026-01-01 00:00:00")
             MesStr = request.form.get('mes_ref')
@@ -86,20 +96,26 @@ def Gerenciar():
             if MesStr and ' ' in MesStr:
                 MesStr = MesStr.split(' ')[0]
             
+            # 'Diferencial' grava só o que mudou na remessa ativa; o padrão arquiva a anterior
+            TipoAcao = 'Diferencial' if request.form.get('tipo_acao') == 'Diferencial' else 'Substituicao'
+            
             try:
-                LogService.Info("Routes.Malha", f"Usuário {current_user.Login} confirmou substituição de malha.")
+                LogService.Info("Routes.Malha", f"Usuário {current_user.Login} confirmou substituição de malha ({TipoAcao}).")
                 # Converte string para objeto date
                 DataRef = datetime.strptime(MesStr, '%Y-%m-%d').date()
                 
-                Ok, Msg = MalhaService.ProcessarMalhaFinal(
+                IdJob = ImportacaoJobService.Enfileirar(
+                    'Malha', NomeOriginal, current_user.Login,
+                    MalhaService.ProcessarMalhaFinal,
                     CaminhoTemp, 
                     DataRef, 
                     NomeOriginal, 
                     current_user.Login, 
-                    'Substituicao'
+                    TipoAcao
                 )
-                if Ok: flash(Msg, 'success')
-                else: flash(Msg, 'danger')
+                if IdJob: flash(f'Substituição enviada para processamento (Job #{IdJob}).', 'info')
+                else: flash('Não foi possível iniciar a substituição.', 'danger')
+                return redirect(url_for('Malha.Gerenciar', job=IdJob))
                 
             except Exception as e:
                 LogService.Error("Routes.Malha", "Erro ao processar data na confirmação", e)
@@ -112,7 +128,8 @@ def Gerenciar():
     return render_template('Malha/Manager.html', 
                            ListaRemessas=Historico, 
                            ExibirModal=ModalConfirmacao, 
-                           DadosModal=DadosConfirmacao)
+                           DadosModal=DadosConfirmacao,
+                           JobImportacao=request.args.get('job', type=int))
 
 @MalhaBp.route('/Malha/Excluir/<int:id_remessa>')
 @login_required
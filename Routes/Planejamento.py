@@ -1,10 +1,12 @@
-from flask import Blueprint, render_template, jsonify, request
+import zlib
+from flask import Blueprint, render_template, jsonify, request, Response
 from flask_login import login_required, current_user
 from datetime import timedelta, datetime, date
 
 # Import dos Serviços
 from Services.PermissaoService import RequerPermissao
 from Services.PlanejamentoService import PlanejamentoService
+from Services.FilaPlanejamentoService import FilaPlanejamentoService
 # CORREÇÃO: Importação atualizada para a nova lógica estratégica
 from Services.Shared.GeoService import BuscarCoordenadasCidade, BuscarAeroportoEstrategico, BuscarTopAeroportos
 from Services.MalhaService import MalhaService
@@ -36,14 +38,55 @@ def Dashboard():
     LogService.Info("Routes.Planejamento", f"Usuário {current_user.id} acessou Dashboard Planejamento.")
     return render_template('Planejamento/Index.html')
 
+def _LerFiltrosFila():
+    """Parâmetros da consulta paginada da fila (valores vazios ou 'TODOS' não filtram)."""
+    def Texto(Nome):
+        Valor = request.args.get(Nome, '').strip()
+        return None if not Valor or Valor.upper() == 'TODOS' else Valor
+    return {
+        'Bloco': Texto('bloco'),
+        'Uf': Texto('uf'),
+        'Filial': Texto('filial'),
+        'Motivo': Texto('motivo'),
+        'Prioridade': Texto('prioridade'),
+        'TipoCarga': Texto('tipo_carga'),
+        'Texto': Texto('q'),
+        'Ordem': request.args.get('ordem', 'data_raw'),
+        'Direcao': 'asc' if request.args.get('dir') == 'asc' else 'desc',
+        'Pagina': request.args.get('pagina', 1, type=int),
+        'TamanhoPagina': request.args.get('tamanho', None, type=int)
+    }
+
 @PlanejamentoBp.route('/API/Listar')
 @login_required
 @RequerPermissao('planejamento.visualizar')
 def ApiCtcsHoje():
     # Log de Debug para não poluir o histórico principal com chamadas de API frequentes
     LogService.Debug("Routes.Planejamento", "API Listar CTCs requisitada.")
-    Dados = PlanejamentoService.BuscarCtcsPlanejamento()
-    return jsonify(Dados)
+    # ?atualizar=1 refaz a fila na hora em vez de esperar o próximo ciclo
+    Forcar = request.args.get('atualizar') == '1'
+    Fila = FilaPlanejamentoService.ObterFila(Forcar)
+    if Fila.get('erro'):
+        return jsonify(Fila), 503
+
+    # ?pagina=N: filtros, ordenação e totais no servidor (a ETag inclui os parâmetros)
+    Paginado = 'pagina' in request.args
+    Etag = f"{Fila['versao']}-{zlib.crc32(request.query_string):08x}" if Paginado else Fila['versao']
+
+    # Cliente já tem esta versão: nada a transferir
+    if request.if_none_match.contains(Etag):
+        Resposta = Response(status=304)
+    elif Paginado:
+        Resposta = jsonify(FilaPlanejamentoService.ConsultarPagina(Fila, **_LerFiltrosFila()))
+    else:
+        # ?since=<versao> devolve só adicionados/alterados/removidos desde a versão informada
+        Desde = request.args.get('since')
+        Diferenca = FilaPlanejamentoService.ObterDiferenca(Fila, Desde) if Desde else None
+        Resposta = jsonify(Diferenca or dict(Fila, completo=True))
+
+    Resposta.set_etag(Etag)
+    Resposta.headers['Cache-Control'] = 'no-cache'
+    return Resposta
 
 @PlanejamentoBp.route('/Montar/<string:filial>/<string:serie>/<string:ctc>')
 @login_required
@@ -172,11 +215,12 @@ def SalvarPlanejamento():
 def MapaGlobal():
     try:
         LogService.Debug("Routes.Planejamento", "Gerando Mapa Global...")
-        ListaCtcs = PlanejamentoService.BuscarCtcsPlanejamento()
+        Fila = FilaPlanejamentoService.ObterFila()
         Agrupamento = {}
 
-        for c in ListaCtcs:
+        for c in Fila['ctcs']:
             try:
+                c = dict(c) # Os itens da fila são compartilhados: 'eh_urgente' vai só na cópia
                 _, UfOrig = c['origem'].split('/')
                 UfOrig = UfOrig.strip().upper()
                 
@@ -213,7 +257,7 @@ def MapaGlobal():
                 continue
         
         DadosMapa = list(Agrupamento.values())
-        return render_template('Planejamento/Map.html', Dados=DadosMapa)
+        return render_template('Planejamento/Map.html', Dados=DadosMapa, GeradoEm=Fila['gerado_em'])
     except Exception as e:
         LogService.Error("Routes.Planejamento", "Erro fatal ao renderizar Mapa Global", e)
         return "Erro interno", 500
\ No newline at end of file
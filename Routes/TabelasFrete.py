@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from Services.PermissaoService import RequerPermissao
 from Services.TabelaFreteService import TabelaFreteService
+from Services.ImportacaoJobService import ImportacaoJobService
 from Services.LogService import LogService
 
 FreteBp = Blueprint('Frete', __name__)
@@ -17,15 +18,25 @@ def Gerenciar():
                 flash('Selecione um arquivo válido.', 'warning')
             else:
                 LogService.Info("Routes.Frete", f"Upload iniciado por {current_user.Login}")
-                Sucesso, Msg = TabelaFreteService.ProcessarArquivo(Arquivo, current_user.Login)
+                IdJob = None
+                try:
+                    Caminho = TabelaFreteService.SalvarArquivoTemp(Arquivo)
+                    IdJob = ImportacaoJobService.Enfileirar(
+                        'Frete', Arquivo.filename, current_user.Login,
+                        TabelaFreteService.ProcessarArquivoSalvo,
+                        Caminho, Arquivo.filename, current_user.Login
+                    )
+                except Exception as e:
+                    LogService.Error("Routes.Frete", "Erro ao salvar arquivo de tarifas", e)
                 
-                if Sucesso: flash(Msg, 'success')
-                else: flash(Msg, 'danger')
+                if IdJob: flash(f'Tabela enviada para processamento (Job #{IdJob}).', 'info')
+                else: flash('Não foi possível iniciar a importação.', 'danger')
                 
-                return redirect(url_for('Frete.Gerenciar'))
+                return redirect(url_for('Frete.Gerenciar', job=IdJob))
 
     Historico = TabelaFreteService.ListarRemessas()
-    return render_template('TabelasFrete/Manager.html', ListaRemessas=Historico)
+    return render_template('TabelasFrete/Manager.html', ListaRemessas=Historico,
+                           JobImportacao=request.args.get('job', type=int))
 
 @FreteBp.route('/Fretes/Excluir/<int:id_remessa>')
 @login_required
@@ -0,0 +1,20 @@
+-- Fila de importações em segundo plano (ImportacaoJobService).
+IF OBJECT_ID('intec.dbo.Tb_PLN_ImportacaoJob', 'U') IS NULL
+    CREATE TABLE intec.dbo.Tb_PLN_ImportacaoJob (
+        Id                INT IDENTITY(1,1) PRIMARY KEY,
+        Tipo              VARCHAR(20)   NOT NULL,
+        Status            VARCHAR(20)   NOT NULL DEFAULT 'Pendente',
+        Fase              VARCHAR(100)  NULL,
+        LinhasProcessadas INT           NULL DEFAULT 0,
+        Mensagem          VARCHAR(1000) NULL,
+        NomeArquivo       VARCHAR(255)  NULL,
+        Usuario           VARCHAR(100)  NULL,
+        DataCriacao       DATETIME      NULL DEFAULT GETDATE(),
+        DataInicio        DATETIME      NULL,
+        DataFim           DATETIME      NULL
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_PLN_ImportacaoJob_Tipo' AND object_id = OBJECT_ID('intec.dbo.Tb_PLN_ImportacaoJob'))
+    CREATE NONCLUSTERED INDEX IX_PLN_ImportacaoJob_Tipo ON intec.dbo.Tb_PLN_ImportacaoJob (Tipo, Id DESC);
+GO
@@ -0,0 +1,10 @@
+-- Índice de apoio ao status de planejamento da fila (StatusPlanejamentoService).
+-- A fila consulta só os CTCs retornados pelos blocos (Ctc IN (...)) em vez de ler
+-- o Tb_PLN_PlanejamentoItem inteiro; o seek por Ctc mantém o custo estável com o histórico.
+-- Executar uma única vez.
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_PLN_PlanejamentoItem_Ctc' AND object_id = OBJECT_ID('intec.dbo.Tb_PLN_PlanejamentoItem'))
+    CREATE NONCLUSTERED INDEX IX_PLN_PlanejamentoItem_Ctc
+        ON intec.dbo.Tb_PLN_PlanejamentoItem (Ctc, Filial, Serie)
+        INCLUDE (IdPlanejamento);
+GO
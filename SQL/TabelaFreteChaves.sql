@@ -0,0 +1,24 @@
+-- Chaves normalizadas da tabela de frete (Tb_PLN_Frete).
+-- Permite que a busca de tarifa use igualdade (index seek) em vez de UPPER(TRIM(...)) e LIKE '%cia%'.
+-- Executar uma única vez; as novas importações já gravam as chaves.
+
+IF COL_LENGTH('intec.dbo.Tb_PLN_Frete', 'OrigemChave') IS NULL
+    ALTER TABLE intec.dbo.Tb_PLN_Frete ADD
+        OrigemChave  VARCHAR(5)  NULL,
+        DestinoChave VARCHAR(5)  NULL,
+        CiaChave     VARCHAR(20) NULL;
+GO
+
+-- Preenche as remessas já importadas (a Cia já é gravada normalizada pelo TabelaFreteService)
+UPDATE intec.dbo.Tb_PLN_Frete
+SET OrigemChave  = UPPER(LTRIM(RTRIM(Origem))),
+    DestinoChave = UPPER(LTRIM(RTRIM(Destino))),
+    CiaChave     = UPPER(LTRIM(RTRIM(CiaAerea)))
+WHERE OrigemChave IS NULL;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_PLN_Frete_Chave' AND object_id = OBJECT_ID('intec.dbo.Tb_PLN_Frete'))
+    CREATE NONCLUSTERED INDEX IX_PLN_Frete_Chave
+        ON intec.dbo.Tb_PLN_Frete (OrigemChave, DestinoChave, CiaChave, IdRemessa)
+        INCLUDE (Tarifa, Servico);
+GO
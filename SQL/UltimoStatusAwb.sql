@@ -0,0 +1,18 @@
+-- Índice de apoio ao "último status por AWB" do painel de acompanhamento.
+-- O ROW_NUMBER() OVER (PARTITION BY CODAWB ORDER BY DATAHORA_STATUS DESC) lê cada AWB
+-- já na ordem certa (index seek por CODAWB), sem ordenar o histórico inteiro.
+-- Executar uma única vez.
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_AWB_STATUS_Ultimo' AND object_id = OBJECT_ID('intec.dbo.TB_AWB_STATUS'))
+    CREATE NONCLUSTERED INDEX IX_AWB_STATUS_Ultimo
+        ON intec.dbo.TB_AWB_STATUS (CODAWB, DATAHORA_STATUS DESC, DATA_INSERT DESC)
+        INCLUDE (STATUS_AWB, VOO);
+GO
+
+-- Leitura incremental do MonitorStatusAwbService: DATA_INSERT >= marca d'água - janela
+-- e o MAX(DATA_INSERT) viram seeks no índice, que já devolve os CODAWB sem tocar na tabela.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_AWB_STATUS_DataInsert' AND object_id = OBJECT_ID('intec.dbo.TB_AWB_STATUS'))
+    CREATE NONCLUSTERED INDEX IX_AWB_STATUS_DataInsert
+        ON intec.dbo.TB_AWB_STATUS (DATA_INSERT)
+        INCLUDE (CODAWB);
+GO
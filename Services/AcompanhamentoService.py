@@ -1,3 +1,4 @@
+from collections import namedtuple
 from datetime import datetime, timedelta
 from sqlalchemy import func, case, and_, or_, Date, cast, desc, text # Adicionado text
 from sqlalchemy.orm import sessionmaker
@@ -18,6 +19,11 @@ from Conexoes import ObterSessaoSqlServer
 
 # --- SERVICES ---
 from Services.AeroportosService import AeroportoService
+from Services.Logic.IndiceVoosService import IndiceVoosService
+from Utils.Formatadores import LimparNumeroVoo
+
+# Linha do histórico da AWB já enriquecida com o trecho da malha
+_LinhaHistorico = namedtuple('_LinhaHistorico', 'Data Hora Status Voo Origem Destino Companhia Usuario')
 
 class AcompanhamentoService:
     
@@ -26,6 +32,11 @@ class AcompanhamentoService:
         Engine = ObterEngineSqlServer()
         return sessionmaker(bind=Engine)()
 
+    @staticmethod
+    def _Geo(MapaAeroportos, Sigla):
+        """Aeroporto do mapa devolvido por AeroportoService.BuscarPorSiglas (ou None)."""
+        return MapaAeroportos.get(Sigla.strip().upper()) if Sigla else None
+
     # --- KPI DO PAINEL ---
     @staticmethod
     def BuscarResumoPainel():
@@ -87,27 +98,14 @@ class AcompanhamentoService:
             # Executa a query limitando a 300 resultados para performance
             resultados_awb = query.order_by(Awb.data.desc()).limit(300).all()
             
-            # --- OTIMIZAÇÃO: BUSCA DE STATUS EM LOTE ---
+            # --- OTIMIZAÇÃO: ÚLTIMO STATUS EM LOTE (uma linha por AWB) ---
             lista_numeros = [r[0].awb for r in resultados_awb if r[0].awb]
-            dicionario_status = {}
-            
-            if lista_numeros:
-                st_q = session.query(
-                    AwbStatus.CODAWB, 
-                    AwbStatus.STATUS_AWB, 
-                    AwbStatus.DATAHORA_STATUS, 
-                    AwbStatus.DATA_INSERT, 
-                    AwbStatus.VOO
-                ).filter(AwbStatus.CODAWB.in_(lista_numeros))\
-                 .order_by(AwbStatus.DATAHORA_STATUS.asc()).all()
-                
-                for st in st_q:
-                    dicionario_status[st.CODAWB] = {
-                        'Status': st.STATUS_AWB, 
-                        'Data': st.DATAHORA_STATUS, 
-                        'Voo': st.VOO, 
-                        'DataInsert': st.DATA_INSERT
-                    }
+            dicionario_status = AcompanhamentoService.BuscarUltimosStatus(session, lista_numeros)
+
+            # --- COORDENADAS EM LOTE (base de aeroportos em memória) ---
+            MapaAeroportos = AeroportoService.BuscarPorSiglas(
+                [r[0].siglaorigem for r in resultados_awb] + [r[0].siglades for r in resultados_awb]
+            )
 
             # --- MONTAGEM DA LISTA FINAL ---
             lista_final = []
@@ -119,8 +117,8 @@ class AcompanhamentoService:
                     'DataInsert': None
                 })
                 
-                geo_o = AeroportoService.BuscarPorSigla(awb_obj.siglaorigem)
-                geo_d = AeroportoService.BuscarPorSigla(awb_obj.siglades)
+                geo_o = AcompanhamentoService._Geo(MapaAeroportos, awb_obj.siglaorigem)
+                geo_d = AcompanhamentoService._Geo(MapaAeroportos, awb_obj.siglades)
 
                 lista_final.append({
                     "CodigoId": awb_obj.codawb,
@@ -135,8 +133,8 @@ class AcompanhamentoService:
                     "DataInsert": d_st['DataInsert'].strftime('%d/%m/%Y %H:%M') if d_st['DataInsert'] else '',
                     "Voo": d_st['Voo'] or '',
                     "RotaMap": {
-                        "Origem": [geo_o.Latitude, geo_o.Longitude] if geo_o and geo_o.Latitude else None,
-                        "Destino": [geo_d.Latitude, geo_d.Longitude] if geo_d and geo_d.Latitude else None
+                        "Origem": [geo_o['lat'], geo_o['lon']] if geo_o and geo_o['lat'] else None,
+                        "Destino": [geo_d['lat'], geo_d['lon']] if geo_d and geo_d['lat'] else None
                     }
                 })
             
@@ -149,15 +147,43 @@ class AcompanhamentoService:
         finally:
             session.close()
 
+    @staticmethod
+    def BuscarUltimosStatus(session, lista_numeros):
+        """
+        Último status (maior DATAHORA_STATUS) de cada AWB, resolvido no banco com ROW_NUMBER():
+        trafega uma linha por AWB em vez do histórico inteiro. Índice de apoio em SQL/UltimoStatusAwb.sql.
+        """
+        if not lista_numeros:
+            return {}
+
+        Ordem = func.row_number().over(
+            partition_by=AwbStatus.CODAWB,
+            order_by=(AwbStatus.DATAHORA_STATUS.desc(), AwbStatus.DATA_INSERT.desc())
+        ).label('Ordem')
+
+        Sub = session.query(
+            AwbStatus.CODAWB,
+            AwbStatus.STATUS_AWB,
+            AwbStatus.DATAHORA_STATUS,
+            AwbStatus.DATA_INSERT,
+            AwbStatus.VOO,
+            Ordem
+        ).filter(AwbStatus.CODAWB.in_(set(lista_numeros))).subquery()
+
+        return {
+            st.CODAWB: {
+                'Status': st.STATUS_AWB,
+                'Data': st.DATAHORA_STATUS,
+                'Voo': st.VOO,
+                'DataInsert': st.DATA_INSERT
+            }
+            for st in session.query(Sub).filter(Sub.c.Ordem == 1).all()
+        }
+
     # --- HELPER: LIMPEZA DE NÚMERO DE VOO ---
     @staticmethod
     def _LimparNumeroVoo(numero_voo):
-        if not numero_voo: return ""
-        base = numero_voo.split('/')[0].upper().strip()
-        prefixos = ['G3', 'JJ', 'LA', 'AD', 'TP', 'QR', 'H2', 'CM', 'AC', 'AF', 'UX']
-        for p in prefixos:
-            base = base.replace(p, '')
-        return "".join(filter(str.isdigit, base))
+        return LimparNumeroVoo(numero_voo)
 
     # --- HISTÓRICO PARA O MAPA/TIMELINE (REFATORADO COM RAW SQL) ---
     @staticmethod
@@ -170,45 +196,46 @@ class AcompanhamentoService:
             destino_final_esperado = awb_master.siglades if awb_master else None
             origem_inicial = awb_master.siglaorigem if awb_master else None
 
-            # 2. Query SQL Otimizada fornecida (elimina duplicatas e traz malha SQL Server)
+            # 2. Histórico agrupado por status/voo; só o TB_AWB_STATUS é consultado
             sql_query = text("""
-                WITH xVOO (Cia, Voo, Orig, Dest) AS (
-                    SELECT 
-                        CiaAerea,
-                        CASE 
-                            WHEN ciaaerea = 'LATAM' THEN LEFT(numerovoo, 2) + RIGHT(numerovoo, 4) 
-                            ELSE numerovoo 
-                        END AS Voo, 
-                        aeroportoorigem, 
-                        aeroportodestino 
-                    FROM intec..Tb_VooMalha
-                    GROUP BY ciaaerea, numerovoo, aeroportoorigem, aeroportodestino
-                )
                 SELECT  
                     CONVERT(VARCHAR, MAX(s.DATAHORA_STATUS), 103) AS Data,
                     CONVERT(VARCHAR, MAX(s.DATAHORA_STATUS), 108) AS Hora,
                     s.STATUS_AWB AS Status,
                     s.VOO AS Voo,
-                    xVOO.Orig AS Origem,
-                    xVOO.Dest AS Destino,
-                    xVOO.Cia AS Companhia,
                     MAX(s.Usuario) as Usuario
                 FROM
                     intec.dbo.TB_AWB_STATUS s
-                LEFT JOIN xVOO ON s.VOO = xVOO.voo
                 WHERE
                     s.CODAWB = :cod_awb
                 GROUP BY
                     s.STATUS_AWB,
-                    s.VOO,
-                    xVOO.Orig,
-                    xVOO.Dest,
-                    xVOO.Cia
+                    s.VOO
                 ORDER BY
                     MAX(s.DATAHORA_STATUS) ASC;
             """)
 
-            resultado_sql = session.execute(sql_query, {'cod_awb': numero_awb}).fetchall()
+            linhas_status = session.execute(sql_query, {'cod_awb': numero_awb}).fetchall()
+
+            # 3. Enriquecimento com o Tb_VooMalha via dicionário de números de voo (em memória).
+            # Um voo com mais de um trecho gera uma linha por trecho, como o antigo JOIN.
+            try:
+                RotasVoos = IndiceVoosService.ObterRotas()
+            except Exception as e:
+                LogService.Error("AcompanhamentoService", "Rotas de voos indisponíveis. Histórico sem trechos.", e)
+                RotasVoos = None
+
+            resultado_sql = []
+            for st in linhas_status:
+                Rotas = (RotasVoos.RotasDoVoo(st.Voo) if RotasVoos and st.Voo else None) or [(None, None, None)]
+                for Cia, Origem, Destino in Rotas:
+                    resultado_sql.append(_LinhaHistorico(st.Data, st.Hora, st.Status, st.Voo, Origem, Destino, Cia, st.Usuario))
+
+            # Coordenadas de todos os aeroportos envolvidos numa única consulta ao cache
+            MapaAeroportos = AeroportoService.BuscarPorSiglas(
+                [row.Origem for row in resultado_sql] + [row.Destino for row in resultado_sql] +
+                [origem_inicial, destino_final_esperado]
+            )
 
             dados_retorno = []
             trajeto_consolidado = []
@@ -226,8 +253,8 @@ class AcompanhamentoService:
                 if row.Origem and row.Destino:
                     
                     # Precisamos das coordenadas (Lat/Lon) para o mapa, buscamos no Service de Aeroportos
-                    go = AeroportoService.BuscarPorSigla(row.Origem)
-                    gd = AeroportoService.BuscarPorSigla(row.Destino)
+                    go = AcompanhamentoService._Geo(MapaAeroportos, row.Origem)
+                    gd = AcompanhamentoService._Geo(MapaAeroportos, row.Destino)
                     
                     if go and gd:
                         detalhes_voo = {
@@ -235,8 +262,8 @@ class AcompanhamentoService:
                             "VooNumerico": AcompanhamentoService._LimparNumeroVoo(row.Voo),
                             "Origem": row.Origem, 
                             "Destino": row.Destino,
-                            "CoordOrigem": [go.Latitude, go.Longitude], 
-                            "CoordDestino": [gd.Latitude, gd.Longitude],
+                            "CoordOrigem": [go['lat'], go['lon']], 
+                            "CoordDestino": [gd['lat'], gd['lon']],
                             "HorarioPartida": '--:--', # SQL agrupado não traz horário exato do voo, apenas status
                             "HorarioChegada": '--:--'
                         }
@@ -273,15 +300,15 @@ class AcompanhamentoService:
 
             # Se temos onde estamos e para onde devemos ir, e eles são diferentes
             if ultimo_local_mapa and destino_final_esperado and ultimo_local_mapa != destino_final_esperado:
-                geo_atual = AeroportoService.BuscarPorSigla(ultimo_local_mapa)
-                geo_final = AeroportoService.BuscarPorSigla(destino_final_esperado)
+                geo_atual = AcompanhamentoService._Geo(MapaAeroportos, ultimo_local_mapa)
+                geo_final = AcompanhamentoService._Geo(MapaAeroportos, destino_final_esperado)
                 
                 if geo_atual and geo_final:
                     rota_pendente = {
                         "Origem": ultimo_local_mapa,
                         "Destino": destino_final_esperado,
-                        "CoordOrigem": [geo_atual.Latitude, geo_atual.Longitude],
-                        "CoordDestino": [geo_final.Latitude, geo_final.Longitude]
+                        "CoordOrigem": [geo_atual['lat'], geo_atual['lon']],
+                        "CoordDestino": [geo_final['lat'], geo_final['lon']]
                     }
 
             # Inverte para mostrar o mais recente primeiro na lista (timeline)
@@ -300,7 +327,6 @@ class AcompanhamentoService:
     # --- MODAL VOO (MALHA PREVISTA) ---
     @staticmethod
     def BuscarDetalhesVooModal(numero_voo, data_ref_str):
-        session = ObterSessaoSqlServer()
         try:
             voo_numerico = AcompanhamentoService._LimparNumeroVoo(numero_voo)
             if not voo_numerico: return None
@@ -310,39 +336,31 @@ class AcompanhamentoService:
                 try: data_busca = datetime.strptime(data_ref_str, '%Y-%m-%d').date()
                 except: data_busca = datetime.now().date()
 
-            def query_voo(data):
-                # FIX: Substituido regexp_replace (Postgres) por LIKE (SQL Server)
-                # Como voo_numerico contem apenas digitos, buscamos se o campo contem esses digitos
-                return session.query(VooMalha).join(RemessaMalha)\
-                    .filter(
-                        RemessaMalha.Ativo == True,
-                        cast(VooMalha.DataPartida, Date) == data,
-                        VooMalha.NumeroVoo.like(f"%{voo_numerico}")
-                    ).first()
-
-            voo = query_voo(data_busca)
-            if not voo: voo = query_voo(data_busca - timedelta(days=1))
+            # Número (só dígitos) + data no índice da malha ativa, em vez de LIKE '%digitos'
+            IndiceVoos = IndiceVoosService.ObterIndice()
+            voo = IndiceVoos.BuscarVoo(voo_numerico, data_busca)
+            if not voo: voo = IndiceVoos.BuscarVoo(voo_numerico, data_busca - timedelta(days=1))
 
             if not voo: 
                 LogService.Debug("AcompanhamentoService", f"Voo {numero_voo} não encontrado na malha para a data {data_ref_str}")
                 return None
 
-            origem = AeroportoService.BuscarPorSigla(voo.AeroportoOrigem)
-            destino = AeroportoService.BuscarPorSigla(voo.AeroportoDestino)
+            MapaAeroportos = AeroportoService.BuscarPorSiglas([voo.AeroportoOrigem, voo.AeroportoDestino])
+            origem = AcompanhamentoService._Geo(MapaAeroportos, voo.AeroportoOrigem)
+            destino = AcompanhamentoService._Geo(MapaAeroportos, voo.AeroportoDestino)
 
             return {
                 "Cia": voo.CiaAerea,
                 "Numero": voo.NumeroVoo,
                 "Data": voo.DataPartida.strftime('%d/%m/%Y'),
                 "OrigemIata": voo.AeroportoOrigem,
-                "OrigemNome": origem.NomeAeroporto if origem else "Aeroporto de Origem",
+                "OrigemNome": origem['nome'] if origem else "Aeroporto de Origem",
                 "DestinoIata": voo.AeroportoDestino,
-                "DestinoNome": destino.NomeAeroporto if destino else "Aeroporto de Destino",
+                "DestinoNome": destino['nome'] if destino else "Aeroporto de Destino",
                 "HorarioSaida": voo.HorarioSaida.strftime('%H:%M'),
                 "HorarioChegada": voo.HorarioChegada.strftime('%H:%M'),
                 "Status": "PROGRAMADO"
             }
         except Exception as e:
             LogService.Error("AcompanhamentoService", f"Erro ao buscar detalhes do voo modal {numero_voo}", e)
-            return None
-        finally: session.close()
\ No newline at end of file
+            return None
\ No newline at end of file
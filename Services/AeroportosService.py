@@ -6,12 +6,17 @@ from sqlalchemy import desc
 # AJUSTE 1: Importar a conexão correta (se você renomeou no Conexoes.py, ajuste aqui)
 # Se você manteve o nome da função mas mudou o conteúdo, pode manter. 
 # Recomendado: Usar a conexão do SQL Server explicitamente.
-from Conexoes import ObterSessaoSqlServer as ObterSessao 
+from Conexoes import ObterSessaoSqlServer as ObterSessao, ObterSessaoRequisicao
 # AJUSTE 2: Importar os modelos da pasta SQL_SERVER
 from Models.SQL_SERVER.Aeroporto import RemessaAeroportos, Aeroporto
 from Configuracoes import ConfiguracaoBase
 from Models.SQL_SERVER.Planejamento import RankingAeroportos
 from Services.LogService import LogService
+from Services.Shared.CargaEmLoteService import CargaEmLoteService
+from Utils.Snapshot import SalvarUpload, SalvarSnapshot, CarregarSnapshot, RemoverArquivoESnapshot
+from Utils.Formatadores import UfDaRegiao
+from Services.Logic.IndiceAeroportosService import IndiceAeroportosService
+from Services.Logic.AtribuicaoAeroportosService import AtribuicaoAeroportosService
 
 DIR_TEMP = ConfiguracaoBase.DIR_TEMP
 
@@ -22,7 +27,7 @@ class AeroportoService:
         """
         Busca um aeroporto pelo código IATA (ex: GRU, JFK).
         """
-        Sessao = ObterSessao()
+        Sessao = ObterSessaoRequisicao()
         try:
             if not Sigla: return None
             Sigla = Sigla.upper().strip()
@@ -33,6 +38,18 @@ class AeroportoService:
         finally:
             Sessao.close()
 
+    @staticmethod
+    def BuscarPorSiglas(Siglas):
+        """
+        Busca vários aeroportos de uma vez na base ativa em memória (sem abrir sessão).
+        Retorna {SIGLA: {'iata', 'nome', 'lat', 'lon'}}; siglas não encontradas ficam fora.
+        """
+        try:
+            return IndiceAeroportosService.ObterIndice().BuscarPorSiglas(set(Siglas))
+        except Exception as e:
+            LogService.Error("AeroportoService", "Erro ao buscar aeroportos em lote", e)
+            return {}
+
     @staticmethod
     def ListarRemessasAeroportos():
         Sessao = ObterSessao()
@@ -53,6 +70,8 @@ class AeroportoService:
             if Remessa:
                 Sessao.delete(Remessa)
                 Sessao.commit()
+                IndiceAeroportosService.Invalidar()
+                AtribuicaoAeroportosService.Invalidar()
                 LogService.Info("AeroportoService", f"Remessa de aeroportos {IdRemessa} excluída.")
                 return True, "Versão da base de aeroportos excluída."
             
@@ -65,13 +84,76 @@ class AeroportoService:
         finally:
             Sessao.close()
 
+    @staticmethod
+    def _LerAeroportos(CaminhoArquivo):
+        """
+        Lê o CSV de aeroportos e devolve (Df, Erro) com as colunas do modelo Aeroporto (sem IdRemessa),
+        strings limpas, coordenadas numéricas e NaN convertido em None.
+        """
+        # 1. Ler CSV
+        try:
+            Df = pd.read_csv(CaminhoArquivo, sep=',', engine='python')
+        except UnicodeDecodeError:
+            LogService.Warning("AeroportoService", "Falha com UTF-8, tentando Latin1.")
+            Df = pd.read_csv(CaminhoArquivo, sep=',', engine='python', encoding='latin1')
+        except Exception as e:
+            LogService.Warning("AeroportoService", f"Falha na leitura padrão: {e}. Tentando sem aspas.")
+            import csv
+            Df = pd.read_csv(CaminhoArquivo, sep=',', quoting=csv.QUOTE_NONE, engine='python')
+        
+        if len(Df.columns) < 2:
+             import csv
+             Df = pd.read_csv(CaminhoArquivo, sep=',', quoting=csv.QUOTE_NONE, engine='python')
+
+        # 2. Limpeza dos Nomes das Colunas
+        Df.columns = [c.replace('"', '').replace("'", "").strip().lower() for c in Df.columns]
+        
+        Mapa = {
+            'country_code': 'CodigoPais',
+            'region_name': 'NomeRegiao',
+            'iata': 'CodigoIata',
+            'icao': 'CodigoIcao',
+            'airport': 'NomeAeroporto',
+            'latitude': 'Latitude',
+            'longitude': 'Longitude'
+        }
+        
+        ColunasUteis = [c for c in Mapa.keys() if c in Df.columns]
+        
+        if not ColunasUteis:
+            LogService.Error("AeroportoService", f"Colunas não identificadas. Headers encontrados: {list(Df.columns)}")
+            return None, f"Colunas não identificadas. Encontradas: {list(Df.columns)}"
+
+        Df = Df[ColunasUteis].rename(columns=Mapa).astype(object)
+
+        # 3. Limpeza extra de strings caso tenha sobrado aspas
+        for Coluna in Df.columns:
+            if Coluna in ('Latitude', 'Longitude'):
+                # Garantia de numéricos: o que não converter vira NULL
+                Df[Coluna] = pd.to_numeric(Df[Coluna], errors='coerce')
+            else:
+                Df[Coluna] = Df[Coluna].map(lambda v: v.replace('"', '').strip() if isinstance(v, str) else v)
+
+        # --- CORREÇÃO PRINCIPAL: Substituir NaN por None ---
+        # SQL Server não aceita float('nan'). Deve ser None (NULL no banco).
+        Df = Df.astype(object).where(pd.notnull(Df), None)
+        return Df, None
+
     @staticmethod
     def AnalisarArquivoAeroportos(FileStorage):
+        """
+        Salva o upload, interpreta o CSV uma única vez (snapshot para o processamento final)
+        e verifica se já existe base para o mês.
+        """
         try:
             LogService.Info("AeroportoService", f"Iniciando análise do arquivo: {FileStorage.filename}")
             
-            CaminhoTemp = os.path.join(DIR_TEMP, FileStorage.filename)
-            FileStorage.save(CaminhoTemp)
+            CaminhoTemp = SalvarUpload(FileStorage, DIR_TEMP)
+
+            Df, Erro = AeroportoService._LerAeroportos(CaminhoTemp)
+            if Df is None:
+                return False, Erro
+            SalvarSnapshot(Df, CaminhoTemp)
             
             Hoje = date.today()
             DataRef = date(Hoje.year, Hoje.month, 1)
@@ -97,57 +179,27 @@ class AeroportoService:
             return False, f"Erro ao analisar arquivo: {e}"
 
     @staticmethod
-    def ProcessarAeroportosFinal(CaminhoArquivo, DataRef, NomeOriginal, Usuario, TipoAcao):
+    def ProcessarAeroportosFinal(CaminhoArquivo, DataRef, NomeOriginal, Usuario, TipoAcao, Progresso=None):
         LogService.Info("AeroportoService", f"Processando arquivo {NomeOriginal} (Ação: {TipoAcao})")
+        Progresso = Progresso or (lambda Fase, Linhas=None: None)
         Sessao = ObterSessao()
         try:
-            # 1. Ler CSV
-            try:
-                Df = pd.read_csv(CaminhoArquivo, sep=',', engine='python')
-            except UnicodeDecodeError:
-                LogService.Warning("AeroportoService", "Falha com UTF-8, tentando Latin1.")
-                Df = pd.read_csv(CaminhoArquivo, sep=',', engine='python', encoding='latin1')
-            except Exception as e:
-                LogService.Warning("AeroportoService", f"Falha na leitura padrão: {e}. Tentando sem aspas.")
-                import csv
-                Df = pd.read_csv(CaminhoArquivo, sep=',', quoting=csv.QUOTE_NONE, engine='python')
-            
-            if len(Df.columns) < 2:
-                 import csv
-                 Df = pd.read_csv(CaminhoArquivo, sep=',', quoting=csv.QUOTE_NONE, engine='python')
-
-            # 2. Limpeza dos Nomes das Colunas
-            Df.columns = [c.replace('"', '').replace("'", "").strip().lower() for c in Df.columns]
-            
-            Mapa = {
-                'country_code': 'CodigoPais',
-                'region_name': 'NomeRegiao',
-                'iata': 'CodigoIata',
-                'icao': 'CodigoIcao',
-                'airport': 'NomeAeroporto',
-                'latitude': 'Latitude',
-                'longitude': 'Longitude'
-            }
-            
-            ColunasUteis = [c for c in Mapa.keys() if c in Df.columns]
-            
-            if not ColunasUteis:
-                LogService.Error("AeroportoService", f"Colunas não identificadas. Headers encontrados: {list(Df.columns)}")
-                return False, f"Colunas não identificadas. Encontradas: {list(Df.columns)}"
+            # 1. Aeroportos já interpretados na análise (relê o CSV só se o snapshot sumiu)
+            Progresso("Carregando aeroportos analisados")
+            Df = CarregarSnapshot(CaminhoArquivo)
+            if Df is None:
+                Progresso("Lendo arquivo")
+                Df, Erro = AeroportoService._LerAeroportos(CaminhoArquivo)
+                if Df is None:
+                    return False, Erro
 
-            Df = Df[ColunasUteis].rename(columns=Mapa)
-            
-            # --- CORREÇÃO PRINCIPAL: Substituir NaN por None ---
-            # SQL Server não aceita float('nan'). Deve ser None (NULL no banco).
-            Df = Df.where(pd.notnull(Df), None)
-
-            # 3. Gerenciar Histórico
+            # 2. Gerenciar Histórico
             Anterior = Sessao.query(RemessaAeroportos).filter_by(MesReferencia=DataRef, Ativo=True).first()
             if Anterior:
                 Anterior.Ativo = False
                 LogService.Info("AeroportoService", f"Remessa anterior {Anterior.Id} desativada.")
 
-            # 4. Criar Nova Remessa
+            # 3. Criar Nova Remessa
             NovaRemessa = RemessaAeroportos(
                 MesReferencia=DataRef,
                 NomeArquivoOriginal=NomeOriginal,
@@ -158,32 +210,18 @@ class AeroportoService:
             Sessao.add(NovaRemessa)
             Sessao.flush()
 
-            # 5. Preparar Dados para Inserção
-            ListaAeroportos = Df.to_dict(orient='records')
-            
-            for Aero in ListaAeroportos:
-                Aero['IdRemessa'] = NovaRemessa.Id
-                
-                # Limpeza extra de strings caso tenha sobrado aspas
-                for key, val in Aero.items():
-                    if isinstance(val, str):
-                        Aero[key] = val.replace('"', '').strip()
-                
-                # Garantia final de numéricos (redundante mas segura)
-                if Aero.get('Latitude') is not None:
-                     try: Aero['Latitude'] = float(Aero['Latitude'])
-                     except: Aero['Latitude'] = None
-                     
-                if Aero.get('Longitude') is not None:
-                     try: Aero['Longitude'] = float(Aero['Longitude'])
-                     except: Aero['Longitude'] = None
-
-            Sessao.bulk_insert_mappings(Aeroporto, ListaAeroportos)
+            # 4. Preparar Dados para Inserção
+            ListaAeroportos = Df.assign(IdRemessa=NovaRemessa.Id).to_dict(orient='records')
+
+            CargaEmLoteService.Inserir(Sessao, Aeroporto, ListaAeroportos, "AeroportoService", Progresso=Progresso)
             Sessao.commit()
 
             LogService.Info("AeroportoService", f"Sucesso! {len(ListaAeroportos)} aeroportos importados na Remessa {NovaRemessa.Id}.")
+            Progresso("Reconstruindo índice de aeroportos", len(ListaAeroportos))
+            IndiceAeroportosService.Reconstruir()
+            AtribuicaoAeroportosService.Reconstruir()
 
-            if os.path.exists(CaminhoArquivo): os.remove(CaminhoArquivo)
+            RemoverArquivoESnapshot(CaminhoArquivo)
 
             return True, f"Base atualizada! {len(ListaAeroportos)} aeroportos importados."
 
@@ -228,19 +266,6 @@ class AeroportoService:
         """
         Sessao = ObterSessao()
         try:
-            # Mapa de De-Para (NomeRegiao do Banco -> Sigla UF)
-            MapaRegiaoUf = {
-                'SAO PAULO': 'SP', 'RIO DE JANEIRO': 'RJ', 'MINAS GERAIS': 'MG',
-                'ESPIRITO SANTO': 'ES', 'PARANA': 'PR', 'SANTA CATARINA': 'SC',
-                'RIO GRANDE DO SUL': 'RS', 'BAHIA': 'BA', 'PERNAMBUCO': 'PE',
-                'CEARA': 'CE', 'DISTRITO FEDERAL': 'DF', 'GOIAS': 'GO',
-                'AMAZONAS': 'AM', 'PARA': 'PA', 'MATO GROSSO': 'MT',
-                'MATO GROSSO DO SUL': 'MS', 'ACRE': 'AC', 'ALAGOAS': 'AL',
-                'AMAPA': 'AP', 'MARANHAO': 'MA', 'PARAIBA': 'PB',
-                'PIAUI': 'PI', 'RIO GRANDE DO NORTE': 'RN', 'RONDONIA': 'RO',
-                'RORAIMA': 'RR', 'SERGIPE': 'SE', 'TOCANTINS': 'TO'
-            }
-
             # 1. Busca Aeroportos BR
             Aeroportos = Sessao.query(Aeroporto).filter(
                 Aeroporto.CodigoPais == 'BR'
@@ -255,10 +280,8 @@ class AeroportoService:
             for aero in Aeroportos:
                 if not aero.NomeRegiao: continue
                 
-                regiao_upper = str(aero.NomeRegiao).upper().strip()
-                
                 # Tenta converter, senão usa as 2 primeiras letras como fallback
-                uf_sigla = MapaRegiaoUf.get(regiao_upper, regiao_upper[:2])
+                uf_sigla = UfDaRegiao(aero.NomeRegiao)
 
                 if uf_sigla not in DadosAgrupados:
                     DadosAgrupados[uf_sigla] = []
@@ -318,6 +341,7 @@ class AeroportoService:
                     Sessao.add(Novo)
             
             Sessao.commit()
+            AtribuicaoAeroportosService.Reconstruir()
             return True, "Rankings atualizados com sucesso."
         except Exception as e:
             Sessao.rollback()
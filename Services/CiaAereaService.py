@@ -1,4 +1,4 @@
-from Conexoes import ObterSessaoSqlServer
+from Conexoes import ObterSessaoSqlServer, ObterSessaoRequisicao
 from Models.SQL_SERVER.CiaConfig import CiaConfig
 from Models.SQL_SERVER.MalhaAerea import VooMalha, RemessaMalha
 from Services.LogService import LogService
@@ -71,7 +71,7 @@ class CiaAereaService:
     @staticmethod
     def ObterDicionarioScores():
         """Retorna um dict simples {'LATAM': 100, 'GOL': 20} para uso rápido no algoritmo."""
-        Sessao = ObterSessaoSqlServer()
+        Sessao = ObterSessaoRequisicao()
         try:
             Configs = Sessao.query(CiaConfig).filter(CiaConfig.Ativo == True).all()
             return {c.CiaAerea: c.ScoreParceria for c in Configs}
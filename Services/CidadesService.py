@@ -6,6 +6,10 @@ from Conexoes import ObterSessaoSqlServer
 from Configuracoes import ConfiguracaoBase
 from Models.SQL_SERVER.Cidade import RemessaCidade, Cidade
 from Services.LogService import LogService  # <--- Import do Log
+from Services.Shared.CargaEmLoteService import CargaEmLoteService
+from Services.Logic.IndiceCidadesService import IndiceCidadesService
+from Services.Logic.AtribuicaoAeroportosService import AtribuicaoAeroportosService
+from Utils.Snapshot import SalvarUpload, SalvarSnapshot, CarregarSnapshot, RemoverArquivoESnapshot
 
 DIR_TEMP = ConfiguracaoBase.DIR_TEMP
 
@@ -51,6 +55,8 @@ class CidadesService:
             if Remessa:
                 Sessao.delete(Remessa)
                 Sessao.commit()
+                IndiceCidadesService.Invalidar()
+                AtribuicaoAeroportosService.Invalidar()
                 LogService.Info("CidadesService", f"Remessa {id_remessa} excluída com sucesso.")
                 return True, "Base de cidades excluída com sucesso."
             
@@ -63,18 +69,70 @@ class CidadesService:
         finally:
             Sessao.close()
 
+    @staticmethod
+    def _LerCidades(Caminho):
+        """
+        Lê o Excel (que na verdade é um CSV disfarçado) e faz o parsing manual das linhas.
+        Retorna um DataFrame com as colunas do modelo Cidade (sem IdRemessa).
+        """
+        # header=None pois o arquivo parece não ter cabeçalho padrão ou é processado bruto
+        DfRaw = pd.read_excel(Caminho, header=None, engine='openpyxl')
+        
+        # Pega a primeira coluna (índice 0) que contém o texto concatenado
+        SerieDados = DfRaw.iloc[:, 0].astype(str)
+        LogService.Debug("CidadesService", f"Arquivo lido. Total de linhas brutas: {len(SerieDados)}")
+
+        ListaCidades = []
+        for Linha in SerieDados:
+            # Limpeza: Remove aspas e espaços extras
+            LinhaLimpa = Linha.replace('"', '').replace("'", "").strip()
+            
+            # Quebra pelo ponto e vírgula
+            Partes = LinhaLimpa.split(';')
+            
+            # Validação básica: Precisa ter pelo menos 5 colunas
+            # id_municipio; uf; municipio; longitude; latitude
+            if len(Partes) < 5:
+                continue
+
+            # Pula o cabeçalho se encontrar a palavra 'municipio' ou 'uf'
+            if 'municipio' in Partes[2].lower() or 'uf' in Partes[1].lower():
+                continue
+
+            try:
+                # Tratamento de erro na conversão de decimais (virgula para ponto)
+                Lat = float(Partes[4].replace(',', '.')) if Partes[4] else 0.0
+                Lon = float(Partes[3].replace(',', '.')) if Partes[3] else 0.0
+                
+                ListaCidades.append({
+                    'CodigoIbge': int(Partes[0]),
+                    'Uf': Partes[1].strip(),
+                    'NomeCidade': Partes[2].strip(),
+                    'Longitude': Lon,
+                    'Latitude': Lat
+                })
+            except ValueError:
+                continue # Pula linha se falhar a conversão
+
+        return pd.DataFrame(ListaCidades, columns=['CodigoIbge', 'Uf', 'NomeCidade', 'Longitude', 'Latitude'])
+
     @staticmethod
     def AnalisarArquivo(file_storage):
         """
         Recebe o upload, salva no temp e verifica se já existe carga para este mês.
-        Não processa ainda, só dá uma olhadinha. 👀
+        O arquivo já é interpretado aqui e guardado num snapshot para o processamento final. 👀
         """
         try:
             LogService.Info("CidadesService", f"Iniciando análise do arquivo: {file_storage.filename}")
             CidadesService._GarantirDiretorio()
             
-            CaminhoTemp = os.path.join(CidadesService.DIR_TEMP, file_storage.filename)
-            file_storage.save(CaminhoTemp)
+            CaminhoTemp = SalvarUpload(file_storage, CidadesService.DIR_TEMP)
+
+            Cidades = CidadesService._LerCidades(CaminhoTemp)
+            if Cidades.empty:
+                LogService.Warning("CidadesService", "Arquivo rejeitado: nenhuma cidade válida encontrada.")
+                return False, "Nenhuma cidade válida encontrada no arquivo."
+            SalvarSnapshot(Cidades, CaminhoTemp)
             
             # Data de Referência é Hoje (Cadastro Estático: Mês Atual)
             Hoje = date.today()
@@ -102,25 +160,25 @@ class CidadesService:
             return False, f"Erro na análise do arquivo: {e}"
 
     @staticmethod
-    def ProcessarArquivoFinal(caminho_arquivo, data_ref, nome_original, usuario, tipo_acao):
+    def ProcessarArquivoFinal(caminho_arquivo, data_ref, nome_original, usuario, tipo_acao, Progresso=None):
         """
         O Motorzão V8:
-        1. Lê o Excel (que na verdade é um CSV disfarçado).
+        1. Carrega o snapshot da análise (ou relê o Excel se ele não existir).
         2. Desativa a remessa anterior.
         3. Cria a nova remessa.
-        4. Faz o parsing manual linha a linha.
-        5. Bulk Insert no banco.
+        4. Bulk Insert no banco.
+        'Progresso(Fase, Linhas=None)' é informado pelo ImportacaoJobService.
         """
         LogService.Info("CidadesService", f"Iniciando processamento final (Ação: {tipo_acao}) - Arquivo: {nome_original}")
+        Progresso = Progresso or (lambda Fase, Linhas=None: None)
         Sessao = ObterSessaoSqlServer()
         try:
-            # 1. Ler Excel (engine openpyxl para .xlsx)
-            # header=None pois o arquivo parece não ter cabeçalho padrão ou é processado bruto
-            DfRaw = pd.read_excel(caminho_arquivo, header=None, engine='openpyxl')
-            
-            # Pega a primeira coluna (índice 0) que contém o texto concatenado
-            SerieDados = DfRaw.iloc[:, 0].astype(str)
-            LogService.Debug("CidadesService", f"Arquivo lido. Total de linhas brutas: {len(SerieDados)}")
+            # 1. Cidades já interpretadas na análise
+            Progresso("Carregando cidades analisadas")
+            Cidades = CarregarSnapshot(caminho_arquivo)
+            if Cidades is None:
+                Progresso("Lendo arquivo")
+                Cidades = CidadesService._LerCidades(caminho_arquivo)
 
             # 2. Desativar remessa anterior (se houver)
             Anterior = Sessao.query(RemessaCidade).filter_by(MesReferencia=data_ref, Ativo=True).first()
@@ -139,51 +197,19 @@ class CidadesService:
             Sessao.add(NovaRemessa)
             Sessao.flush() # Garante que NovaRemessa ganhe um ID
 
-            # 4. Processar Linha a Linha (Parsing Manual da string concatenada)
-            ListaCidades = []
-            
-            for Linha in SerieDados:
-                # Limpeza: Remove aspas e espaços extras
-                LinhaLimpa = Linha.replace('"', '').replace("'", "").strip()
-                
-                # Quebra pelo ponto e vírgula
-                Partes = LinhaLimpa.split(';')
-                
-                # Validação básica: Precisa ter pelo menos 5 colunas
-                # id_municipio; uf; municipio; longitude; latitude
-                if len(Partes) < 5:
-                    continue
-
-                # Pula o cabeçalho se encontrar a palavra 'municipio' ou 'uf'
-                if 'municipio' in Partes[2].lower() or 'uf' in Partes[1].lower():
-                    continue
-
-                try:
-                    # Tratamento de erro na conversão de decimais (virgula para ponto)
-                    Lat = float(Partes[4].replace(',', '.')) if Partes[4] else 0.0
-                    Lon = float(Partes[3].replace(',', '.')) if Partes[3] else 0.0
-                    
-                    CidadeObj = Cidade(
-                        IdRemessa=NovaRemessa.Id,
-                        CodigoIbge=int(Partes[0]),
-                        Uf=Partes[1].strip(),
-                        NomeCidade=Partes[2].strip(),
-                        Longitude=Lon,
-                        Latitude=Lat
-                    )
-                    ListaCidades.append(CidadeObj)
-                except ValueError:
-                    continue # Pula linha se falhar a conversão
-
-            # 5. Bulk Insert (Performance Extrema)
-            Sessao.bulk_save_objects(ListaCidades)
+            ListaCidades = Cidades.assign(IdRemessa=NovaRemessa.Id).to_dict('records')
+
+            # 4. Carga em lote (fast_executemany, mesma transação da remessa)
+            CargaEmLoteService.Inserir(Sessao, Cidade, ListaCidades, "CidadesService", Progresso=Progresso)
             Sessao.commit()
             
             LogService.Info("CidadesService", f"Processamento concluído. {len(ListaCidades)} cidades importadas na Remessa {NovaRemessa.Id}.")
+            Progresso("Reconstruindo índice de cidades", len(ListaCidades))
+            IndiceCidadesService.Reconstruir()
+            AtribuicaoAeroportosService.Reconstruir()
 
-            # Limpa o arquivo temporário
-            if os.path.exists(caminho_arquivo): 
-                os.remove(caminho_arquivo)
+            # Limpa o arquivo temporário e o snapshot
+            RemoverArquivoESnapshot(caminho_arquivo)
                 
             return True, f"Base de Cidades processada! {len(ListaCidades)} registros importados."
 
@@ -192,4 +218,4 @@ class CidadesService:
             LogService.Error("CidadesService", "Falha crítica no processamento de cidades.", e)
             return False, f"Falha crítica no processamento: {e}"
         finally:
-            Sessao.close()
\ No newline at end of file
+            Sessao.close()
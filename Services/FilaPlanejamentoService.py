@@ -0,0 +1,302 @@
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from Configuracoes import ConfiguracaoAtual
+from Services.LogService import LogService
+from Services.PlanejamentoService import PlanejamentoService
+from Services.Logic.StatusPlanejamentoService import StatusPlanejamentoService, ChavePlanejamento
+
+class FilaPlanejamentoService:
+    """
+    Fila de CTCs do planejamento (Diário + Reversa + Backlog) materializada em memória.
+    Uma thread por processo refaz a fila a cada PLANEJAMENTO_FILA_INTERVALO segundos e todos
+    os usuários (Dashboard e Mapa Global) leem o mesmo retrato: N usuários custam um ciclo de
+    consultas por intervalo, não um por acesso. A thread para após PLANEJAMENTO_FILA_OCIOSO sem acessos.
+    Planejamentos gravados neste processo entram no retrato na hora (sem reconsultar os blocos).
+    Cada retrato com CTCs diferentes do anterior ganha uma versão ('<instancia>-<n>', usada na ETag).
+    O painel consulta páginas filtradas (ConsultarPagina) e recebe 304 se nada mudou; clientes da fila
+    completa podem pedir só a diferença desde uma das últimas HISTORICO_VERSOES (ObterDiferenca).
+    """
+    HISTORICO_VERSOES = 10
+
+    _Retrato = None
+    _IniciadoEm = None # Início do ciclo de consultas que gerou o retrato
+    _VersaoStatus = 0
+    _Instancia = uuid.uuid4().hex[:8] # Versões de outro processo (ou antes de reiniciar) não se confundem
+    _Versao = 0
+    _Historico = deque(maxlen=HISTORICO_VERSOES) # (Versao, {chave: ctc})
+    _Trava = threading.Lock()          # Protege o retrato e a thread
+    _TravaAtualizacao = threading.Lock() # Um ciclo de consultas por vez
+    _Thread = None
+    _UltimoAcesso = 0.0
+
+    @staticmethod
+    def _Garantir():
+        """Registra o acesso e sobe a thread de atualização se ela não estiver rodando."""
+        FilaPlanejamentoService._UltimoAcesso = time.monotonic()
+        if FilaPlanejamentoService._Thread is not None and FilaPlanejamentoService._Thread.is_alive():
+            return
+        with FilaPlanejamentoService._Trava:
+            if FilaPlanejamentoService._Thread is None or not FilaPlanejamentoService._Thread.is_alive():
+                FilaPlanejamentoService._Thread = threading.Thread(
+                    target=FilaPlanejamentoService._Executar, name='FilaPlanejamento', daemon=True
+                )
+                FilaPlanejamentoService._Thread.start()
+                LogService.Info("FilaPlanejamentoService", "Atualização da fila de planejamento iniciada.")
+
+    @staticmethod
+    def _Executar():
+        while time.monotonic() - FilaPlanejamentoService._UltimoAcesso < ConfiguracaoAtual.PLANEJAMENTO_FILA_OCIOSO:
+            time.sleep(ConfiguracaoAtual.PLANEJAMENTO_FILA_INTERVALO)
+            try:
+                FilaPlanejamentoService._Atualizar()
+            except Exception as e:
+                LogService.Error("FilaPlanejamentoService", "Erro ao atualizar fila de planejamento", e)
+        LogService.Info("FilaPlanejamentoService", "Atualização da fila de planejamento parada (nenhum acesso).")
+
+    @staticmethod
+    def _Atualizar(SolicitadoEm=None):
+        """
+        Refaz a fila. Se outro ciclo começou depois de 'SolicitadoEm' (quem pediu ficou
+        esperando a trava), aproveita o resultado dele em vez de consultar de novo.
+        Vale o início do ciclo: um ciclo que só terminou depois do pedido pode ter lido o banco antes dele.
+        """
+        with FilaPlanejamentoService._TravaAtualizacao:
+            IniciadoEm = FilaPlanejamentoService._IniciadoEm
+            if SolicitadoEm is not None and IniciadoEm is not None and IniciadoEm >= SolicitadoEm:
+                return
+
+            IniciadoEm = datetime.now()
+            VersaoStatus = StatusPlanejamentoService.Versao
+            Fila = PlanejamentoService.BuscarFilaPlanejamento()
+            Fila['gerado_em'] = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+
+            with FilaPlanejamentoService._Trava:
+                FilaPlanejamentoService._Publicar(Fila)
+                FilaPlanejamentoService._IniciadoEm = IniciadoEm
+                FilaPlanejamentoService._VersaoStatus = VersaoStatus
+
+    @staticmethod
+    def _Publicar(Fila):
+        """Troca o retrato (chamado com a _Trava). A versão só avança se algum CTC mudou."""
+        Mapa = {c['chave']: c for c in Fila['ctcs']}
+        Historico = FilaPlanejamentoService._Historico
+        if not Historico or Historico[-1][1] != Mapa:
+            FilaPlanejamentoService._Versao += 1
+            Historico.append((FilaPlanejamentoService._Versao, Mapa))
+        Fila['versao'] = f"{FilaPlanejamentoService._Instancia}-{FilaPlanejamentoService._Versao}"
+        FilaPlanejamentoService._Retrato = Fila
+
+    @staticmethod
+    def _FilaIndisponivel():
+        """Resposta quando ainda não existe retrato (a primeira consulta da fila falhou)."""
+        return {
+            'ctcs': [],
+            'blocos': {b: {'qtd': 0, 'tempo_ms': None, 'erro': 'Fila indisponível'} for b in PlanejamentoService.BLOCOS},
+            'parcial': True,
+            'gerado_em': None,
+            'versao': None,
+            'erro': 'Fila de planejamento indisponível no momento. Tente novamente em instantes.'
+        }
+
+    @staticmethod
+    def _ReaplicarStatus():
+        """Planejamento gravado depois do retrato: atualiza só o status dos CTCs, sem ir ao banco."""
+        with FilaPlanejamentoService._Trava:
+            if FilaPlanejamentoService._Retrato is None:
+                return FilaPlanejamentoService._FilaIndisponivel()
+            Versao = StatusPlanejamentoService.Versao
+            if Versao == FilaPlanejamentoService._VersaoStatus:
+                return FilaPlanejamentoService._Retrato
+
+            Ctcs = []
+            for c in FilaPlanejamentoService._Retrato['ctcs']:
+                Info = StatusPlanejamentoService.ObterEmMemoria(ChavePlanejamento(c['filial'], c['serie'], c['ctc']))
+                if (Info['id_plan'] if Info else None) != c['id_planejamento']:
+                    # Cópia: o retrato anterior pode estar sendo serializado por outra requisição
+                    c = dict(c,
+                        tem_planejamento=bool(Info),
+                        status_planejamento=Info['status'] if Info else None,
+                        id_planejamento=Info['id_plan'] if Info else None
+                    )
+                Ctcs.append(c)
+
+            FilaPlanejamentoService._Publicar(dict(FilaPlanejamentoService._Retrato, ctcs=Ctcs))
+            FilaPlanejamentoService._VersaoStatus = Versao
+            return FilaPlanejamentoService._Retrato
+
+    @staticmethod
+    def ObterFila(Forcar=False):
+        """
+        Retorna o retrato atual {'ctcs', 'blocos', 'parcial', 'gerado_em', 'versao'}.
+        Na primeira chamada (ou com Forcar) consulta na hora; as demais leem a memória.
+        Se a consulta falha e ainda não há retrato, devolve a fila vazia com 'erro' preenchido.
+        Não altere os itens devolvidos: eles são compartilhados entre as requisições.
+        """
+        FilaPlanejamentoService._Garantir()
+        if Forcar or FilaPlanejamentoService._Retrato is None:
+            LogService.Debug("FilaPlanejamentoService", "Atualização da fila solicitada.")
+            try:
+                FilaPlanejamentoService._Atualizar(datetime.now())
+            except Exception as e:
+                # Com retrato anterior segue servindo ele; sem retrato, _ReaplicarStatus informa o erro
+                LogService.Error("FilaPlanejamentoService", "Erro ao atualizar fila de planejamento", e)
+        return FilaPlanejamentoService._ReaplicarStatus()
+
+    @staticmethod
+    def ObterDiferenca(Fila, Desde):
+        """
+        Diferença entre a versão 'Desde' (a que o cliente já tem) e a da fila informada:
+        {'versao', 'base', 'completo': False, 'adicionados', 'alterados', 'removidos' (chaves), ...}.
+        Retorna None se 'Desde' não está mais no histórico: o cliente precisa da fila completa.
+        """
+        Instancia, _, Numero = (Desde or '').rpartition('-')
+        if Instancia != FilaPlanejamentoService._Instancia or not Numero.isdigit():
+            return None
+
+        Atual = int(Fila['versao'].rpartition('-')[2])
+        with FilaPlanejamentoService._Trava:
+            Mapas = {v: m for v, m in FilaPlanejamentoService._Historico if v in (int(Numero), Atual)}
+        Antigo, Novo = Mapas.get(int(Numero)), Mapas.get(Atual)
+        if Antigo is None or Novo is None:
+            return None
+
+        Adicionados, Alterados = [], []
+        for Chave, Ctc in Novo.items():
+            Anterior = Antigo.get(Chave)
+            if Anterior is None:
+                Adicionados.append(Ctc)
+            elif Anterior is not Ctc and Anterior != Ctc:
+                Alterados.append(Ctc)
+
+        return {
+            'versao': Fila['versao'],
+            'base': Desde,
+            'completo': False,
+            'adicionados': Adicionados,
+            'alterados': Alterados,
+            'removidos': [Chave for Chave in Antigo if Chave not in Novo],
+            'blocos': Fila['blocos'],
+            'parcial': Fila['parcial'],
+            'gerado_em': Fila['gerado_em']
+        }
+
+    # -------------------------------------------------------------------------
+    # CONSULTA PAGINADA (filtros, ordenação e totais calculados sobre o retrato)
+    # -------------------------------------------------------------------------
+    # Colunas aceitas na ordenação: as mesmas da tabela do painel
+    COLUNAS_ORDENACAO = (
+        'status_planejamento', 'prioridade', 'origem_dados', 'ctc', 'unid_lastmile', 'data_raw',
+        'remetente', 'qtd_notas', 'volumes', 'peso_taxado', 'raw_val_mercadoria'
+    )
+    TAMANHO_PAGINA_PADRAO = 50
+    TAMANHO_PAGINA_MAXIMO = 500
+
+    _Preparado = None # (versao, itens com campos derivados, opcoes dos filtros)
+
+    @staticmethod
+    def _ClassePrioridade(Prioridade):
+        """URGENTE, AGENDADA ou NORMAL (tudo que não é urgente nem agendado), como no filtro do painel."""
+        p = (Prioridade or 'NORMAL').upper()
+        if p in ('S', 'URGENTE'): return 'URGENTE'
+        if p == 'AGENDADA': return 'AGENDADA'
+        return 'NORMAL'
+
+    @staticmethod
+    def _DataRaw(c):
+        """Emissão como número YYYYMMDDHHMM, para ordenar."""
+        Partes = c['data_emissao'].split('/')
+        if len(Partes) != 3: return 0
+        Hora = c['hora_emissao'].replace(':', '') if c['hora_emissao'] and c['hora_emissao'] != '--:--' else '0000'
+        try: return int(f"{Partes[2]}{Partes[1]}{Partes[0]}{Hora}")
+        except ValueError: return 0
+
+    @staticmethod
+    def _Preparar(Fila):
+        """Campos derivados de cada CTC (texto de busca, UF, classe de prioridade...), uma vez por versão."""
+        Preparado = FilaPlanejamentoService._Preparado
+        if Preparado is not None and Preparado[0] == Fila['versao']:
+            return Preparado
+
+        Itens = []
+        for c in Fila['ctcs']:
+            Itens.append((c, {
+                'busca': ' '.join(str(c[k] or '') for k in (
+                    'ctc', 'remetente', 'destinatario', 'origem', 'destino', 'filial', 'tipo_carga', 'motivodoc', 'prioridade'
+                )).lower(),
+                'uf': c['origem'].rpartition('/')[2].strip().upper(),
+                'prioridade': FilaPlanejamentoService._ClassePrioridade(c['prioridade']),
+                'tipo_carga': (c['tipo_carga'] or '').upper(),
+                'data_raw': FilaPlanejamentoService._DataRaw(c)
+            }))
+
+        Opcoes = {
+            'filiais': sorted({c['filial'] for c, _ in Itens if c['filial']}),
+            'motivos': sorted({c['motivodoc'] for c, _ in Itens if c['motivodoc']}),
+            'ufs': sorted({d['uf'] for _, d in Itens if d['uf']}),
+            'tipos_carga': sorted({c['tipo_carga'] for c, _ in Itens if c['tipo_carga']})
+        }
+        Preparado = (Fila['versao'], Itens, Opcoes)
+        FilaPlanejamentoService._Preparado = Preparado
+        return Preparado
+
+    @staticmethod
+    def ConsultarPagina(Fila, Bloco=None, Uf=None, Filial=None, Motivo=None, Prioridade=None, TipoCarga=None,
+                        Texto=None, Ordem='data_raw', Direcao='desc', Pagina=1, TamanhoPagina=None):
+        """
+        Uma página da fila já filtrada e ordenada, com os totais do conjunto filtrado
+        (quantidade, peso, valor, notas e quantidade por bloco) e as opções dos filtros.
+        A contagem por bloco ignora o filtro de bloco, para as abas mostrarem seus totais.
+        """
+        _, Itens, Opcoes = FilaPlanejamentoService._Preparar(Fila)
+        Texto = (Texto or '').strip().lower()
+        Uf, TipoCarga = (Uf or '').upper(), (TipoCarga or '').upper()
+        Prioridade = (Prioridade or '').upper()
+
+        Filtrados = []
+        PorBloco = {b: 0 for b in PlanejamentoService.BLOCOS}
+        for c, d in Itens:
+            if Texto and Texto not in d['busca']: continue
+            if Uf and d['uf'] != Uf: continue
+            if Filial and c['filial'] != Filial: continue
+            if Motivo and c['motivodoc'] != Motivo: continue
+            if Prioridade and d['prioridade'] != Prioridade: continue
+            if TipoCarga and d['tipo_carga'] != TipoCarga: continue
+            PorBloco[c['origem_dados']] = PorBloco.get(c['origem_dados'], 0) + 1
+            if Bloco and c['origem_dados'] != Bloco: continue
+            Filtrados.append((c, d))
+
+        if Ordem not in FilaPlanejamentoService.COLUNAS_ORDENACAO:
+            Ordem = 'data_raw'
+        if Ordem == 'data_raw':
+            Chave = lambda i: i[1]['data_raw']
+        else:
+            Chave = lambda i: i[0][Ordem].lower() if isinstance(i[0][Ordem], str) else (i[0][Ordem] if i[0][Ordem] is not None else '')
+        Filtrados.sort(key=Chave, reverse=(Direcao == 'desc'))
+
+        TamanhoPagina = min(max(TamanhoPagina or FilaPlanejamentoService.TAMANHO_PAGINA_PADRAO, 1), FilaPlanejamentoService.TAMANHO_PAGINA_MAXIMO)
+        Total = len(Filtrados)
+        TotalPaginas = max((Total + TamanhoPagina - 1) // TamanhoPagina, 1)
+        Pagina = min(max(Pagina or 1, 1), TotalPaginas)
+        Inicio = (Pagina - 1) * TamanhoPagina
+
+        return {
+            'versao': Fila['versao'],
+            'gerado_em': Fila['gerado_em'],
+            'blocos': Fila['blocos'],
+            'parcial': Fila['parcial'],
+            'ctcs': [c for c, _ in Filtrados[Inicio:Inicio + TamanhoPagina]],
+            'pagina': Pagina,
+            'tamanho_pagina': TamanhoPagina,
+            'total': Total,
+            'total_paginas': TotalPaginas,
+            'agregados': {
+                'peso_taxado': round(sum(c['peso_taxado'] for c, _ in Filtrados), 3),
+                'valor': round(sum(c['raw_val_mercadoria'] for c, _ in Filtrados), 2),
+                'notas': sum(c['qtd_notas'] for c, _ in Filtrados),
+                'por_bloco': PorBloco
+            },
+            'opcoes': Opcoes
+        }
@@ -0,0 +1,139 @@
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from Conexoes import ObterSessaoSqlServer
+from Configuracoes import ConfiguracaoAtual
+from Models.SQL_SERVER.ImportacaoJob import ImportacaoJob
+from Services.LogService import LogService
+
+class ImportacaoJobService:
+    """
+    Executa as importações de remessas fora das threads do Waitress.
+    Cada importação vira uma linha em Tb_PLN_ImportacaoJob (fase, linhas processadas, erro),
+    que a tela consulta via API enquanto o job roda em um pool de threads dedicado.
+    As funções de processamento recebem o callback 'Progresso(Fase, Linhas=None)'.
+    """
+    _Executor = None
+    _Trava = threading.Lock()
+    _InicioProcesso = datetime.now() # Jobs criados a partir daqui pertencem a este processo
+
+    @staticmethod
+    def _ObterExecutor():
+        if ImportacaoJobService._Executor is None:
+            with ImportacaoJobService._Trava:
+                if ImportacaoJobService._Executor is None:
+                    # Jobs que ficaram abertos pertencem a um processo que já morreu
+                    ImportacaoJobService._EncerrarOrfaos()
+                    ImportacaoJobService._Executor = ThreadPoolExecutor(
+                        max_workers=ConfiguracaoAtual.IMPORTACAO_WORKERS,
+                        thread_name_prefix='Importacao'
+                    )
+        return ImportacaoJobService._Executor
+
+    @staticmethod
+    def _EncerrarOrfaos():
+        """Marca como erro os jobs abertos criados antes deste processo subir (nunca os que ele mesmo enfileirou)."""
+        Sessao = ObterSessaoSqlServer()
+        try:
+            Total = Sessao.query(ImportacaoJob).filter(
+                ImportacaoJob.Status.in_(['Pendente', 'Processando']),
+                ImportacaoJob.DataCriacao < ImportacaoJobService._InicioProcesso
+            ).update({
+                ImportacaoJob.Status: 'Erro',
+                ImportacaoJob.Mensagem: 'Interrompido: o servidor foi reiniciado durante a importação.',
+                ImportacaoJob.DataFim: datetime.now()
+            }, synchronize_session=False)
+            Sessao.commit()
+            if Total:
+                LogService.Warning("ImportacaoJobService", f"{Total} job(s) de importação interrompido(s) marcado(s) como erro.")
+        except Exception as e:
+            Sessao.rollback()
+            LogService.Error("ImportacaoJobService", "Erro ao encerrar jobs órfãos", e)
+        finally:
+            Sessao.close()
+
+    @staticmethod
+    def _Atualizar(IdJob, **Campos):
+        Sessao = ObterSessaoSqlServer()
+        try:
+            Sessao.query(ImportacaoJob).filter(ImportacaoJob.Id == IdJob).update(
+                {getattr(ImportacaoJob, k): v for k, v in Campos.items()}, synchronize_session=False
+            )
+            Sessao.commit()
+        except Exception as e:
+            Sessao.rollback()
+            LogService.Error("ImportacaoJobService", f"Erro ao atualizar job {IdJob}", e)
+        finally:
+            Sessao.close()
+
+    @staticmethod
+    def Enfileirar(Tipo, NomeArquivo, Usuario, Funcao, *Argumentos):
+        """
+        Registra o job e agenda 'Funcao(*Argumentos, Progresso=...)', que deve retornar (Ok, Mensagem).
+        Retorna o Id do job, ou None se não foi possível registrá-lo.
+        """
+        # O pool (e a limpeza dos órfãos) sobe antes de o job existir, para não pegar o job recém-criado
+        Executor = ImportacaoJobService._ObterExecutor()
+        Sessao = ObterSessaoSqlServer()
+        try:
+            Job = ImportacaoJob(Tipo=Tipo, Status='Pendente', Fase='Na fila', LinhasProcessadas=0,
+                                NomeArquivo=NomeArquivo, Usuario=Usuario)
+            Sessao.add(Job)
+            Sessao.commit()
+            IdJob = Job.Id
+        except Exception as e:
+            Sessao.rollback()
+            LogService.Error("ImportacaoJobService", f"Erro ao registrar job de {Tipo}", e)
+            return None
+        finally:
+            Sessao.close()
+
+        Executor.submit(ImportacaoJobService._Executar, IdJob, Tipo, Funcao, Argumentos)
+        LogService.Info("ImportacaoJobService", f"Job {IdJob} ({Tipo}) enfileirado por {Usuario}: {NomeArquivo}")
+        return IdJob
+
+    @staticmethod
+    def _Executar(IdJob, Tipo, Funcao, Argumentos):
+        ImportacaoJobService._Atualizar(IdJob, Status='Processando', Fase='Iniciando', DataInicio=datetime.now())
+
+        def Progresso(Fase, Linhas=None):
+            Campos = {'Fase': Fase}
+            if Linhas is not None:
+                Campos['LinhasProcessadas'] = Linhas
+            ImportacaoJobService._Atualizar(IdJob, **Campos)
+
+        try:
+            Ok, Mensagem = Funcao(*Argumentos, Progresso=Progresso)
+            ImportacaoJobService._Atualizar(
+                IdJob, Status='Concluido' if Ok else 'Erro', Fase='Finalizado',
+                Mensagem=str(Mensagem)[:1000], DataFim=datetime.now()
+            )
+            LogService.Info("ImportacaoJobService", f"Job {IdJob} ({Tipo}) finalizado. Sucesso={Ok}")
+        except Exception as e:
+            LogService.Error("ImportacaoJobService", f"Falha no job {IdJob} ({Tipo})", e)
+            ImportacaoJobService._Atualizar(IdJob, Status='Erro', Mensagem=f"Erro técnico: {e}"[:1000], DataFim=datetime.now())
+
+    @staticmethod
+    def ObterJob(IdJob):
+        """Situação do job para a API de acompanhamento (dict) ou None se não existir."""
+        Sessao = ObterSessaoSqlServer()
+        try:
+            Job = Sessao.query(ImportacaoJob).get(IdJob)
+            if not Job:
+                return None
+            return {
+                'id': Job.Id,
+                'tipo': Job.Tipo,
+                'status': Job.Status,
+                'fase': Job.Fase,
+                'linhas_processadas': Job.LinhasProcessadas or 0,
+                'mensagem': Job.Mensagem,
+                'arquivo': Job.NomeArquivo,
+                'usuario': Job.Usuario,
+                'criado_em': Job.DataCriacao.strftime('%d/%m/%Y %H:%M:%S') if Job.DataCriacao else None,
+                'inicio': Job.DataInicio.strftime('%d/%m/%Y %H:%M:%S') if Job.DataInicio else None,
+                'fim': Job.DataFim.strftime('%d/%m/%Y %H:%M:%S') if Job.DataFim else None,
+                'finalizado': Job.Status in ('Concluido', 'Erro')
+            }
+        finally:
+            Sessao.close()
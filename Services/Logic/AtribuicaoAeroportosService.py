@@ -0,0 +1,144 @@
+import threading
+import numpy as np
+from datetime import datetime, timedelta
+from Conexoes import ObterSessaoSqlServer
+from Models.SQL_SERVER.Aeroporto import Aeroporto, RemessaAeroportos
+from Models.SQL_SERVER.Planejamento import RankingAeroportos
+from Services.LogService import LogService
+from Services.Logic.IndiceCidadesService import IndiceCidadesService
+from Utils.Geometria import MatrizDistancias
+from Utils.Texto import NormalizarTexto
+
+# Configuração de Inteligência
+# Quanto maior este número, mais o sistema ignora a distância para priorizar o Ranking.
+# Ex: 3.5 significa que 1 ponto de ranking equivale a percorrer 3.5km a mais para chegar lá.
+FATOR_RANKING_KM = 3.5
+
+def MontarOpcaoEstrategica(Cand, Distancia, Score):
+    return {
+        'iata': Cand.CodigoIata,
+        'nome': Cand.NomeAeroporto,
+        'lat': float(Cand.Latitude),
+        'lon': float(Cand.Longitude),
+        'distancia_km': round(Distancia, 1),
+        'ranking': Cand.IndiceImportancia,
+        'score': round(Score, 1),
+        'metodo': 'Estrategico (Ranking)'
+    }
+
+
+class AtribuicaoAeroportos:
+    """
+    Aeroporto estratégico pré-calculado para cada cidade ativa de UF com ranking.
+    Mesma fórmula do cálculo ao vivo (Score = Distância - Ranking x FATOR_RANKING_KM, menor vence),
+    resolvida por UF numa matriz cidades x aeroportos rankeados. Guarda o vencedor e o segundo colocado.
+    A chave é (UF, latitude, longitude) da cidade, exatamente como o gazetteer devolve as coordenadas.
+    """
+
+    def __init__(self, Candidatos, IndiceCidades, Assinatura):
+        self.Assinatura = Assinatura
+        self.CarregadaEm = datetime.now()
+        self.PorCidade = {}
+
+        CandidatosPorUf = {}
+        for Cand in Candidatos:
+            CandidatosPorUf.setdefault(Cand.Uf, []).append(Cand)
+
+        for Uf, Lista in CandidatosPorUf.items():
+            Grupo = IndiceCidades.PorUf.get(NormalizarTexto(Uf))
+            if Grupo is None:
+                continue
+
+            Distancias = MatrizDistancias(
+                [c['lat'] for c in Grupo.Cidades], [c['lon'] for c in Grupo.Cidades],
+                [c.Latitude for c in Lista], [c.Longitude for c in Lista]
+            )
+            Bonus = np.array([c.IndiceImportancia * FATOR_RANKING_KM for c in Lista], dtype=np.float64)
+            Scores = Distancias - Bonus
+            # Estável: no empate vence o primeiro candidato, como no laço com '<'
+            Ordem = np.argsort(Scores, axis=1, kind='stable')[:, :2]
+
+            for Linha, Cidade in enumerate(Grupo.Cidades):
+                Opcoes = tuple(
+                    MontarOpcaoEstrategica(Lista[p], float(Distancias[Linha, p]), float(Scores[Linha, p]))
+                    for p in Ordem[Linha]
+                )
+                self.PorCidade.setdefault((Uf, Cidade['lat'], Cidade['lon']), (Opcoes[0], Opcoes[1] if len(Opcoes) > 1 else None))
+
+    def Buscar(self, Uf, Latitude, Longitude):
+        """(Vencedor, SegundoColocado) da cidade, ou None se ela não foi pré-calculada."""
+        return self.PorCidade.get((Uf, Latitude, Longitude))
+
+
+class AtribuicaoAeroportosService:
+    """
+    Mantém em memória a atribuição cidade -> aeroporto estratégico.
+    A assinatura combina as remessas de cidades ativas e os candidatos rankeados (UF, aeroporto,
+    índice e coordenadas), então muda ao salvar ranking ou importar cidades/aeroportos;
+    nesses pontos o cálculo é refeito na hora, e em outros processos na próxima conferência.
+    """
+    _Atribuicao = None
+    _Trava = threading.Lock()
+    VALIDADE_ASSINATURA = timedelta(seconds=60)
+
+    @staticmethod
+    def _BuscarCandidatos(Sessao):
+        return Sessao.query(
+            RankingAeroportos.Uf,
+            RankingAeroportos.IndiceImportancia,
+            Aeroporto.CodigoIata,
+            Aeroporto.NomeAeroporto,
+            Aeroporto.Latitude,
+            Aeroporto.Longitude
+        ).join(Aeroporto, RankingAeroportos.IdAeroporto == Aeroporto.Id)\
+         .join(RemessaAeroportos, Aeroporto.IdRemessa == RemessaAeroportos.Id)\
+         .filter(RemessaAeroportos.Ativo == True)\
+         .order_by(RankingAeroportos.Uf, RankingAeroportos.Id)\
+         .all()
+
+    @staticmethod
+    def ObterAtribuicao():
+        """Retorna a atribuição vigente, recalculando-a se cidades, aeroportos ou ranking mudaram."""
+        Atribuicao = AtribuicaoAeroportosService._Atribuicao
+        if Atribuicao is not None and datetime.now() - Atribuicao.CarregadaEm < AtribuicaoAeroportosService.VALIDADE_ASSINATURA:
+            return Atribuicao
+
+        with AtribuicaoAeroportosService._Trava:
+            Atribuicao = AtribuicaoAeroportosService._Atribuicao
+            if Atribuicao is not None and datetime.now() - Atribuicao.CarregadaEm < AtribuicaoAeroportosService.VALIDADE_ASSINATURA:
+                return Atribuicao
+
+            IndiceCidades = IndiceCidadesService.ObterIndice()
+            Sessao = ObterSessaoSqlServer()
+            try:
+                Candidatos = AtribuicaoAeroportosService._BuscarCandidatos(Sessao)
+            finally:
+                Sessao.close()
+
+            Assinatura = (IndiceCidades.Assinatura, tuple(tuple(c) for c in Candidatos))
+            if Atribuicao is not None and Atribuicao.Assinatura == Assinatura:
+                Atribuicao.CarregadaEm = datetime.now()
+                return Atribuicao
+
+            Inicio = datetime.now()
+            Atribuicao = AtribuicaoAeroportos(Candidatos, IndiceCidades, Assinatura)
+            AtribuicaoAeroportosService._Atribuicao = Atribuicao
+            Tempo = (datetime.now() - Inicio).total_seconds()
+            LogService.Info("AtribuicaoAeroportosService", f"Aeroportos estratégicos pré-calculados: {len(Atribuicao.PorCidade)} cidades, {len(Candidatos)} candidatos em {Tempo:.2f}s.")
+            return Atribuicao
+
+    @staticmethod
+    def Invalidar():
+        """Descarta a atribuição atual. A próxima consulta recalcula."""
+        with AtribuicaoAeroportosService._Trava:
+            AtribuicaoAeroportosService._Atribuicao = None
+        LogService.Debug("AtribuicaoAeroportosService", "Atribuição de aeroportos estratégicos invalidada.")
+
+    @staticmethod
+    def Reconstruir():
+        """Invalida e já recalcula (chamado ao salvar ranking e ao importar cidades/aeroportos)."""
+        AtribuicaoAeroportosService.Invalidar()
+        try:
+            AtribuicaoAeroportosService.ObterAtribuicao()
+        except Exception as e:
+            LogService.Error("AtribuicaoAeroportosService", "Falha ao recalcular aeroportos estratégicos", e)
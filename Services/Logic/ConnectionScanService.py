@@ -0,0 +1,98 @@
+from bisect import bisect_left, bisect_right
+from Services.Logic.RedeVoosService import CONEXAO_MINIMA, CONEXAO_MAXIMA
+
+class _Rotulo:
+    """Chegada a um aeroporto usando 'Trechos' voos. Encadeado pelo rótulo anterior."""
+    __slots__ = ('Voo', 'Anterior', 'Trechos', 'PrimeiraPartida', 'Aeroportos')
+
+    def __init__(self, Voo, Anterior):
+        self.Voo = Voo
+        self.Anterior = Anterior
+        if Anterior is None:
+            self.Trechos = 1
+            self.PrimeiraPartida = Voo.Partida
+            self.Aeroportos = (Voo.AeroportoOrigem, Voo.AeroportoDestino)
+        else:
+            self.Trechos = Anterior.Trechos + 1
+            self.PrimeiraPartida = Anterior.PrimeiraPartida
+            self.Aeroportos = Anterior.Aeroportos + (Voo.AeroportoDestino,)
+
+    def Sequencia(self):
+        Voos = []
+        Atual = self
+        while Atual is not None:
+            Voos.append(Atual.Voo)
+            Atual = Atual.Anterior
+        return Voos[::-1]
+
+
+class ConnectionScanService:
+    """
+    Motor de roteamento dependente do tempo (Connection Scan Algorithm limitado por nº de trechos).
+
+    Varre uma única vez os voos da janela em ordem de partida. Um voo é embarcável com k trechos
+    se partir de uma origem (k=1) ou se existir chegada com k-1 trechos no aeroporto de partida
+    dentro da janela de conexão [1h, 48h]. Todas as chegadas são mantidas (não só a mais cedo),
+    por isso o limite máximo de 48h não descarta itinerários viáveis.
+
+    Retorna um itinerário por voo final que chega a um destino, por quantidade de trechos.
+    O itinerário de chegada mais cedo está sempre entre eles (resultado exato).
+    """
+
+    @staticmethod
+    def BuscarItinerarios(Rede, Origens, Destinos, Inicio, LimitePartida, MaxTrechos=3):
+        Origens = set(Origens)
+        Destinos = set(Destinos)
+
+        # (Aeroporto, Trechos) -> listas paralelas ordenadas por chegada
+        TemposChegada = {}
+        RotulosChegada = {}
+        Finais = []
+
+        for Voo in Rede.VoosNoPeriodo(Inicio, LimitePartida):
+            Partida, Destino = Voo.AeroportoOrigem, Voo.AeroportoDestino
+            Novos = []
+
+            if Partida in Origens and Destino not in Origens:
+                Novos.append(_Rotulo(Voo, None))
+
+            for k in range(2, MaxTrechos + 1):
+                Tempos = TemposChegada.get((Partida, k - 1))
+                if not Tempos:
+                    continue
+                Ini = bisect_left(Tempos, Voo.Partida - CONEXAO_MAXIMA)
+                Fim = bisect_right(Tempos, Voo.Partida - CONEXAO_MINIMA)
+                if Ini >= Fim:
+                    continue
+
+                # Entre as chegadas compatíveis: prefere manter a Cia e, depois, a viagem iniciada mais tarde
+                Melhor, MelhorChave = None, None
+                for Candidato in RotulosChegada[(Partida, k - 1)][Ini:Fim]:
+                    if Destino in Candidato.Aeroportos:
+                        continue # Caminho simples: não revisita aeroportos
+                    Chave = (Candidato.Voo.CiaAerea == Voo.CiaAerea, Candidato.PrimeiraPartida)
+                    if MelhorChave is None or Chave > MelhorChave:
+                        Melhor, MelhorChave = Candidato, Chave
+                if Melhor is not None:
+                    Novos.append(_Rotulo(Voo, Melhor))
+
+            for Rotulo in Novos:
+                if Destino in Destinos:
+                    Finais.append(Rotulo)
+                    continue # Chegou ao destino: não segue viagem
+                if Rotulo.Trechos >= MaxTrechos:
+                    continue
+                Chave = (Destino, Rotulo.Trechos)
+                Tempos = TemposChegada.setdefault(Chave, [])
+                Pos = bisect_right(Tempos, Voo.Chegada)
+                Tempos.insert(Pos, Voo.Chegada)
+                RotulosChegada.setdefault(Chave, []).insert(Pos, Rotulo)
+
+        return [r.Sequencia() for r in Finais]
+
+    @staticmethod
+    def MelhorChegada(ListaItinerarios):
+        """Itinerário com chegada mais cedo (desempate: menos trechos)."""
+        if not ListaItinerarios:
+            return None
+        return min(ListaItinerarios, key=lambda s: (s[-1].Chegada, len(s)))
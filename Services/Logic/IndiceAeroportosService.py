@@ -0,0 +1,165 @@
+import threading
+import numpy as np
+from datetime import datetime, timedelta
+from Conexoes import ObterSessaoSqlServer
+from Models.SQL_SERVER.Aeroporto import Aeroporto, RemessaAeroportos
+from Services.LogService import LogService
+from Utils.Formatadores import UfDaRegiao
+from Utils.Geometria import HaversineVetorizado
+
+class IndiceAeroportos:
+    """
+    Aeroportos das remessas ativas em arrays NumPy.
+    A distância (Haversine vetorizado) é calculada para todos os aeroportos de uma vez;
+    UF e país viram máscaras sobre os arrays.
+    Aeroportos sem coordenada (ou com 0, que o Haversine trata como inválida) ficam fora.
+    """
+
+    def __init__(self, Linhas, Assinatura):
+        self.Assinatura = Assinatura
+        self.CarregadaEm = datetime.now()
+
+        Validas = [l for l in Linhas if l.Latitude and l.Longitude]
+        self.Ids = np.array([l.Id for l in Validas], dtype=np.int64)
+        self.Iatas = [l.CodigoIata for l in Validas]
+        self.Nomes = [l.NomeAeroporto for l in Validas]
+        self.Latitudes = np.array([float(l.Latitude) for l in Validas], dtype=np.float64)
+        self.Longitudes = np.array([float(l.Longitude) for l in Validas], dtype=np.float64)
+        self.Paises = np.array([(l.CodigoPais or '').strip().upper() for l in Validas], dtype=object)
+        self.Ufs = np.array([UfDaRegiao(l.NomeRegiao) or '' for l in Validas], dtype=object)
+
+        self.Total = len(Validas)
+
+        # Consulta por código IATA (inclui aeroportos sem coordenada). Sigla repetida: vale o primeiro
+        self.PorIata = {}
+        for l in Linhas:
+            if l.CodigoIata:
+                self.PorIata.setdefault(l.CodigoIata.strip().upper(), {
+                    'iata': l.CodigoIata,
+                    'nome': l.NomeAeroporto,
+                    'lat': float(l.Latitude) if l.Latitude is not None else None,
+                    'lon': float(l.Longitude) if l.Longitude is not None else None
+                })
+
+    def Distancias(self, Latitude, Longitude):
+        """Distância em Km do ponto até todos os aeroportos do índice (mesma ordem dos arrays)."""
+        return HaversineVetorizado(Latitude, Longitude, self.Latitudes, self.Longitudes)
+
+    def BuscarPorSiglas(self, Siglas):
+        """Conjunto de códigos IATA -> {SIGLA: dados}. Siglas desconhecidas ficam fora do resultado."""
+        Resultado = {}
+        for Sigla in Siglas:
+            if not Sigla: continue
+            Sigla = Sigla.strip().upper()
+            Dados = self.PorIata.get(Sigla)
+            if Dados is not None:
+                Resultado[Sigla] = Dados
+        return Resultado
+
+    def _Mascara(self, Uf, Pais):
+        Mascara = np.ones(self.Total, dtype=bool)
+        if Uf:
+            Mascara &= self.Ufs == Uf.upper().strip()
+        if Pais:
+            Mascara &= self.Paises == Pais.upper().strip()
+        return Mascara
+
+    def _Montar(self, Posicoes, Distancias):
+        return [{
+            'id': int(self.Ids[p]),
+            'iata': self.Iatas[p],
+            'nome': self.Nomes[p],
+            'lat': float(self.Latitudes[p]),
+            'lon': float(self.Longitudes[p]),
+            'distancia': float(Distancias[p])
+        } for p in Posicoes]
+
+    def MaisProximos(self, Latitude, Longitude, K=1, Uf=None, Pais=None):
+        """Os K aeroportos mais próximos, do mais perto para o mais longe. Ponto inválido retorna []."""
+        if not Latitude or not Longitude or not self.Total or K < 1:
+            return []
+        Distancias = self.Distancias(Latitude, Longitude)
+        Candidatos = np.flatnonzero(self._Mascara(Uf, Pais))
+        if K < len(Candidatos):
+            Candidatos = Candidatos[np.argpartition(Distancias[Candidatos], K - 1)[:K]]
+        # Ordem estável: empates ficam na ordem do banco, como na ordenação anterior
+        Candidatos = Candidatos[np.lexsort((Candidatos, Distancias[Candidatos]))]
+        return self._Montar(Candidatos, Distancias)
+
+    def NoRaio(self, Latitude, Longitude, RaioKm, Uf=None, Pais=None):
+        """Aeroportos a até RaioKm do ponto, do mais perto para o mais longe."""
+        if not Latitude or not Longitude or not self.Total:
+            return []
+        Distancias = self.Distancias(Latitude, Longitude)
+        Candidatos = np.flatnonzero(self._Mascara(Uf, Pais) & (Distancias <= RaioKm))
+        Candidatos = Candidatos[np.lexsort((Candidatos, Distancias[Candidatos]))]
+        return self._Montar(Candidatos, Distancias)
+
+
+class IndiceAeroportosService:
+    """
+    Mantém em memória um único IndiceAeroportos por processo, construído a partir das
+    remessas de aeroportos ativas. Reconstruído após importação/exclusão ou quando outro
+    processo muda as remessas ativas (conferido a cada VALIDADE_ASSINATURA).
+    """
+    _Indice = None
+    _Trava = threading.Lock()
+    VALIDADE_ASSINATURA = timedelta(seconds=60)
+
+    @staticmethod
+    def _ObterAssinatura(Sessao):
+        Ids = Sessao.query(RemessaAeroportos.Id).filter(RemessaAeroportos.Ativo == True).order_by(RemessaAeroportos.Id).all()
+        return tuple(r.Id for r in Ids)
+
+    @staticmethod
+    def _Construir(Sessao, Assinatura):
+        Inicio = datetime.now()
+        Linhas = Sessao.query(
+            Aeroporto.Id, Aeroporto.CodigoIata, Aeroporto.NomeAeroporto, Aeroporto.CodigoPais,
+            Aeroporto.NomeRegiao, Aeroporto.Latitude, Aeroporto.Longitude
+        ).filter(Aeroporto.IdRemessa.in_(Assinatura)).order_by(Aeroporto.Id).all() if Assinatura else []
+
+        Indice = IndiceAeroportos(Linhas, Assinatura)
+        Tempo = (datetime.now() - Inicio).total_seconds()
+        LogService.Info("IndiceAeroportosService", f"Índice de aeroportos construído: {Indice.Total} aeroportos em {Tempo:.2f}s (Remessas {Assinatura}).")
+        return Indice
+
+    @staticmethod
+    def ObterIndice():
+        """Retorna o índice das remessas ativas, construindo-o se necessário."""
+        Indice = IndiceAeroportosService._Indice
+        if Indice is not None and datetime.now() - Indice.CarregadaEm < IndiceAeroportosService.VALIDADE_ASSINATURA:
+            return Indice
+
+        with IndiceAeroportosService._Trava:
+            Indice = IndiceAeroportosService._Indice
+            if Indice is not None and datetime.now() - Indice.CarregadaEm < IndiceAeroportosService.VALIDADE_ASSINATURA:
+                return Indice
+
+            Sessao = ObterSessaoSqlServer()
+            try:
+                Assinatura = IndiceAeroportosService._ObterAssinatura(Sessao)
+                if Indice is not None and Indice.Assinatura == Assinatura:
+                    Indice.CarregadaEm = datetime.now()
+                else:
+                    Indice = IndiceAeroportosService._Construir(Sessao, Assinatura)
+                    IndiceAeroportosService._Indice = Indice
+                return Indice
+            finally:
+                Sessao.close()
+
+    @staticmethod
+    def Invalidar():
+        """Descarta o índice atual. A próxima busca reconstrói a partir do banco."""
+        with IndiceAeroportosService._Trava:
+            IndiceAeroportosService._Indice = None
+        LogService.Debug("IndiceAeroportosService", "Índice de aeroportos invalidado.")
+
+    @staticmethod
+    def Reconstruir():
+        """Invalida e já reconstrói o índice (chamado logo após importar aeroportos)."""
+        IndiceAeroportosService.Invalidar()
+        try:
+            IndiceAeroportosService.ObterIndice()
+        except Exception as e:
+            LogService.Error("IndiceAeroportosService", "Falha ao reconstruir índice de aeroportos", e)
@@ -0,0 +1,148 @@
+import threading
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from Conexoes import ObterSessaoSqlServer
+from Models.SQL_SERVER.Cidade import Cidade, RemessaCidade
+from Services.LogService import LogService
+from Utils.Texto import NormalizarTexto
+
+# Separador entre nomes no texto de busca por trecho (não ocorre em nomes normalizados)
+SEPARADOR = '\x00'
+
+class _CidadesDaUf:
+    """
+    Cidades de uma UF com os nomes já normalizados.
+    'Exatos' resolve o nome completo em O(1). Para a busca por trecho, os nomes ficam
+    concatenados num único texto (na ordem do banco) e o str.find localiza a primeira cidade
+    que contém o termo; 'Inicios' traduz a posição encontrada de volta para a cidade.
+    """
+
+    def __init__(self):
+        self.Exatos = {}
+        self.Cidades = []
+        self.Inicios = []
+        self.Texto = ''
+
+    def Finalizar(self, Nomes):
+        Posicao = 0
+        for Nome in Nomes:
+            self.Inicios.append(Posicao)
+            Posicao += len(Nome) + len(SEPARADOR)
+        self.Texto = SEPARADOR.join(Nomes)
+
+    def Buscar(self, NomeBusca):
+        Cidade = self.Exatos.get(NomeBusca)
+        if Cidade is not None:
+            return Cidade
+        Posicao = self.Texto.find(NomeBusca)
+        if Posicao < 0:
+            return None
+        return self.Cidades[bisect_right(self.Inicios, Posicao) - 1]
+
+
+class IndiceCidades:
+    """
+    Gazetteer das cidades das remessas ativas, por UF normalizada.
+    A normalização (maiúsculas, sem acento) é feita uma única vez na construção.
+    """
+
+    def __init__(self, Linhas, Assinatura):
+        self.Assinatura = Assinatura
+        self.CarregadaEm = datetime.now()
+        self.PorUf = {}
+
+        NomesPorUf = {}
+        for l in Linhas:
+            Uf = NormalizarTexto(l.Uf)
+            Nome = NormalizarTexto(l.NomeCidade)
+            Dados = {
+                'lat': float(l.Latitude) if l.Latitude else 0.0,
+                'lon': float(l.Longitude) if l.Longitude else 0.0,
+                'nome': l.NomeCidade,
+                'uf': l.Uf
+            }
+            Grupo = self.PorUf.setdefault(Uf, _CidadesDaUf())
+            Grupo.Exatos.setdefault(Nome, Dados) # Nomes repetidos: vale o primeiro, como na varredura
+            Grupo.Cidades.append(Dados)
+            NomesPorUf.setdefault(Uf, []).append(Nome)
+
+        for Uf, Nomes in NomesPorUf.items():
+            self.PorUf[Uf].Finalizar(Nomes)
+
+        self.Total = sum(len(g.Cidades) for g in self.PorUf.values())
+
+    def Buscar(self, NomeCidade, Uf):
+        """Nome exato normalizado; senão a primeira cidade da UF cujo nome contém o termo."""
+        Grupo = self.PorUf.get(NormalizarTexto(Uf))
+        if Grupo is None:
+            return None
+        Cidade = Grupo.Buscar(NormalizarTexto(NomeCidade))
+        return dict(Cidade) if Cidade else None
+
+
+class IndiceCidadesService:
+    """
+    Mantém em memória um único IndiceCidades por processo, construído a partir das
+    remessas de cidades ativas. Reconstruído após importação/exclusão ou quando outro
+    processo muda as remessas ativas (conferido a cada VALIDADE_ASSINATURA).
+    """
+    _Indice = None
+    _Trava = threading.Lock()
+    VALIDADE_ASSINATURA = timedelta(seconds=60)
+
+    @staticmethod
+    def _ObterAssinatura(Sessao):
+        Ids = Sessao.query(RemessaCidade.Id).filter(RemessaCidade.Ativo == True).order_by(RemessaCidade.Id).all()
+        return tuple(r.Id for r in Ids)
+
+    @staticmethod
+    def _Construir(Sessao, Assinatura):
+        Inicio = datetime.now()
+        Linhas = Sessao.query(
+            Cidade.Uf, Cidade.NomeCidade, Cidade.Latitude, Cidade.Longitude
+        ).filter(Cidade.IdRemessa.in_(Assinatura)).order_by(Cidade.Id).all() if Assinatura else []
+
+        Indice = IndiceCidades(Linhas, Assinatura)
+        Tempo = (datetime.now() - Inicio).total_seconds()
+        LogService.Info("IndiceCidadesService", f"Índice de cidades construído: {Indice.Total} cidades, {len(Indice.PorUf)} UFs em {Tempo:.2f}s (Remessas {Assinatura}).")
+        return Indice
+
+    @staticmethod
+    def ObterIndice():
+        """Retorna o índice das remessas ativas, construindo-o se necessário."""
+        Indice = IndiceCidadesService._Indice
+        if Indice is not None and datetime.now() - Indice.CarregadaEm < IndiceCidadesService.VALIDADE_ASSINATURA:
+            return Indice
+
+        with IndiceCidadesService._Trava:
+            Indice = IndiceCidadesService._Indice
+            if Indice is not None and datetime.now() - Indice.CarregadaEm < IndiceCidadesService.VALIDADE_ASSINATURA:
+                return Indice
+
+            Sessao = ObterSessaoSqlServer()
+            try:
+                Assinatura = IndiceCidadesService._ObterAssinatura(Sessao)
+                if Indice is not None and Indice.Assinatura == Assinatura:
+                    Indice.CarregadaEm = datetime.now()
+                else:
+                    Indice = IndiceCidadesService._Construir(Sessao, Assinatura)
+                    IndiceCidadesService._Indice = Indice
+                return Indice
+            finally:
+                Sessao.close()
+
+    @staticmethod
+    def Invalidar():
+        """Descarta o índice atual. A próxima busca reconstrói a partir do banco."""
+        with IndiceCidadesService._Trava:
+            IndiceCidadesService._Indice = None
+        LogService.Debug("IndiceCidadesService", "Índice de cidades invalidado.")
+
+    @staticmethod
+    def Reconstruir():
+        """Invalida e já reconstrói o índice (chamado logo após importar cidades)."""
+        IndiceCidadesService.Invalidar()
+        try:
+            IndiceCidadesService.ObterIndice()
+        except Exception as e:
+            LogService.Error("IndiceCidadesService", "Falha ao reconstruir índice de cidades", e)
@@ -0,0 +1,147 @@
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from Conexoes import ObterSessaoSqlServer
+from Services.LogService import LogService
+from Services.Logic.RedeVoosService import RedeVoosService
+from Utils.Formatadores import LimparNumeroVoo
+
+def ChaveVooStatus(CiaAerea, NumeroVoo):
+    """
+    Número do voo como gravado no TB_AWB_STATUS.VOO.
+    LATAM usa as 2 primeiras + 4 últimas posições do número da malha (ex: LA803456 -> LA3456).
+    """
+    Numero = (NumeroVoo or '').strip()
+    if (CiaAerea or '').strip().upper() == 'LATAM':
+        Numero = Numero[:2] + Numero[-4:]
+    return Numero.upper()
+
+def ChaveVooNumerico(NumeroVoo):
+    """Só os dígitos significativos do número (equivale ao LIKE '%digitos' da malha)."""
+    return LimparNumeroVoo(NumeroVoo).lstrip('0')
+
+
+class RotasVoos:
+    """
+    Chave do TB_AWB_STATUS -> trechos distintos (Cia, origem, destino) desse número,
+    lidos do cadastro de voos intec..Tb_VooMalha (todos os voos, não só a malha ativa),
+    com o mesmo agrupamento da antiga CTE do histórico da AWB.
+    """
+
+    def __init__(self, Linhas, Assinatura):
+        self.Assinatura = Assinatura
+        self.CarregadaEm = datetime.now()
+        self.Rotas = {}
+
+        for CiaAerea, NumeroVoo, Origem, Destino in Linhas:
+            Rotas = self.Rotas.setdefault(ChaveVooStatus(CiaAerea, NumeroVoo), [])
+            Rota = (CiaAerea, Origem, Destino)
+            if Rota not in Rotas:
+                Rotas.append(Rota)
+
+    def RotasDoVoo(self, NumeroStatus):
+        """Trechos (Cia, origem, destino) do voo informado no status. Lista vazia se não estiver no cadastro."""
+        return self.Rotas.get((NumeroStatus or '').strip().upper(), [])
+
+
+class IndiceVoos:
+    """
+    Dicionários de número de voo derivados da RedeVoos (malha ativa), para o modal de detalhes:
+    - PorNumeroData: (dígitos, data) -> voos do dia;
+    - PorData: data -> voos do dia, para os números que só batem pelo final (LIKE '%digitos').
+    """
+
+    def __init__(self, Rede):
+        self.Rede = Rede
+        self.PorNumeroData = {}
+        self.PorData = {}
+
+        for Voo in Rede.VoosPorPartida:
+            self.PorNumeroData.setdefault((ChaveVooNumerico(Voo.NumeroVoo), Voo.DataPartida), []).append(Voo)
+            self.PorData.setdefault(Voo.DataPartida, []).append(Voo)
+
+    def BuscarVoo(self, NumeroVoo, Data):
+        """Primeiro voo do dia (ordem de partida) cujo número termina nos mesmos dígitos."""
+        Voos = self.PorNumeroData.get((ChaveVooNumerico(NumeroVoo), Data))
+        if Voos:
+            return Voos[0]
+        # Número da malha com mais dígitos à esquerda (ex: LA803456 para o voo 3456)
+        for Voo in self.PorData.get(Data, []):
+            if (Voo.NumeroVoo or '').strip().endswith(NumeroVoo):
+                return Voo
+        return None
+
+
+class IndiceVoosService:
+    """
+    Mantém o IndiceVoos da rede de voos atual. Como a RedeVoos é trocada a cada importação
+    (completa ou diferencial), o índice é refeito sempre que a rede em memória muda.
+    Mantém também as RotasVoos do Tb_VooMalha, que não é importado por esta aplicação:
+    a cada VALIDADE_ASSINATURA confere contagem e checksum da tabela e recarrega se mudaram.
+    """
+    _Indice = None
+    _Rotas = None
+    _Trava = threading.Lock()
+    _TravaRotas = threading.Lock()
+    VALIDADE_ASSINATURA = timedelta(seconds=60)
+
+    @staticmethod
+    def _ObterAssinaturaRotas(Sessao):
+        return tuple(Sessao.execute(text("""
+            SELECT COUNT_BIG(*), CHECKSUM_AGG(CHECKSUM(CiaAerea, NumeroVoo, AeroportoOrigem, AeroportoDestino))
+            FROM intec..Tb_VooMalha
+        """)).one())
+
+    @staticmethod
+    def _BuscarRotas(Sessao):
+        return Sessao.execute(text("""
+            SELECT CiaAerea, NumeroVoo, AeroportoOrigem, AeroportoDestino
+            FROM intec..Tb_VooMalha
+            GROUP BY CiaAerea, NumeroVoo, AeroportoOrigem, AeroportoDestino
+        """)).fetchall()
+
+    @staticmethod
+    def ObterRotas():
+        """Retorna as RotasVoos vigentes, recarregando-as se o Tb_VooMalha mudou."""
+        Rotas = IndiceVoosService._Rotas
+        if Rotas is not None and datetime.now() - Rotas.CarregadaEm < IndiceVoosService.VALIDADE_ASSINATURA:
+            return Rotas
+
+        with IndiceVoosService._TravaRotas:
+            Rotas = IndiceVoosService._Rotas
+            if Rotas is not None and datetime.now() - Rotas.CarregadaEm < IndiceVoosService.VALIDADE_ASSINATURA:
+                return Rotas
+
+            Sessao = ObterSessaoSqlServer()
+            try:
+                Assinatura = IndiceVoosService._ObterAssinaturaRotas(Sessao)
+                if Rotas is not None and Rotas.Assinatura == Assinatura:
+                    Rotas.CarregadaEm = datetime.now()
+                    return Rotas
+
+                Inicio = datetime.now()
+                Rotas = RotasVoos(IndiceVoosService._BuscarRotas(Sessao), Assinatura)
+            finally:
+                Sessao.close()
+
+            IndiceVoosService._Rotas = Rotas
+            Tempo = (datetime.now() - Inicio).total_seconds()
+            LogService.Info("IndiceVoosService", f"Rotas do cadastro de voos carregadas: {len(Rotas.Rotas)} números em {Tempo:.2f}s.")
+            return Rotas
+
+    @staticmethod
+    def ObterIndice():
+        Rede = RedeVoosService.ObterRede()
+        Indice = IndiceVoosService._Indice
+        if Indice is not None and Indice.Rede is Rede:
+            return Indice
+
+        with IndiceVoosService._Trava:
+            Indice = IndiceVoosService._Indice
+            if Indice is None or Indice.Rede is not Rede:
+                Inicio = datetime.now()
+                Indice = IndiceVoos(Rede)
+                IndiceVoosService._Indice = Indice
+                Tempo = (datetime.now() - Inicio).total_seconds()
+                LogService.Info("IndiceVoosService", f"Índice de números de voo construído: {len(Indice.PorNumeroData)} voos/dia em {Tempo:.2f}s.")
+            return Indice
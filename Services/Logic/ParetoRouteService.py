@@ -0,0 +1,158 @@
+from bisect import bisect_left, bisect_right
+from collections import deque
+from Services.Logic.RedeVoosService import CONEXAO_MINIMA, CONEXAO_MAXIMA
+
+class _RotuloPareto:
+    """Itinerário parcial até o destino do 'Voo', com os critérios acumulados."""
+    __slots__ = ('Voo', 'Anterior', 'Trechos', 'PrimeiraPartida', 'Aeroportos', 'Custo', 'SemTarifa', 'Trocas', 'SomaParceria')
+
+    def __init__(self, Voo, Anterior, Custo, SemTarifa, Parceria):
+        self.Voo = Voo
+        self.Anterior = Anterior
+        if Anterior is None:
+            self.Trechos = 1
+            self.PrimeiraPartida = Voo.Partida
+            self.Aeroportos = (Voo.AeroportoOrigem, Voo.AeroportoDestino)
+            self.Custo = Custo
+            self.SemTarifa = SemTarifa
+            self.Trocas = 0
+            self.SomaParceria = Parceria
+        else:
+            self.Trechos = Anterior.Trechos + 1
+            self.PrimeiraPartida = Anterior.PrimeiraPartida
+            self.Aeroportos = Anterior.Aeroportos + (Voo.AeroportoDestino,)
+            self.Custo = Anterior.Custo + Custo
+            self.SemTarifa = Anterior.SemTarifa or SemTarifa
+            self.Trocas = Anterior.Trocas + (1 if Anterior.Voo.CiaAerea != Voo.CiaAerea else 0)
+            self.SomaParceria = Anterior.SomaParceria + Parceria
+
+    def Classe(self):
+        """Categorias que nunca competem entre si: direto, conexão na mesma Cia, interline."""
+        if self.Trocas > 0: return 'interline'
+        return 'direta' if self.Trechos == 1 else 'mesma_cia'
+
+    def Vetor(self, NoDestino=False):
+        """
+        Todos os critérios em forma de minimização, um para cada termo do score da RouteIntelligence.
+        A parceria entra no score pela média dos trechos. No destino (itinerário completo) compara-se
+        a média; na sacola compara-se a soma: com Trechos também no vetor, quem tem soma maior e
+        menos trechos continua com média maior depois de qualquer extensão igual.
+        """
+        Base = (-self.PrimeiraPartida.timestamp(), self.Custo, self.Trechos, self.Trocas, int(self.SemTarifa))
+        if NoDestino:
+            return (self.Voo.Chegada.timestamp(),) + Base + (-self.SomaParceria / self.Trechos,)
+        return Base + (-self.SomaParceria,)
+
+    def Sequencia(self):
+        Voos = []
+        Atual = self
+        while Atual is not None:
+            Voos.append(Atual.Voo)
+            Atual = Atual.Anterior
+        return Voos[::-1]
+
+
+def _Domina(A, B):
+    return all(a <= b for a, b in zip(A, B))
+
+def _InserirNaFronteira(Fronteira, Rotulo, Vetor):
+    """Insere mantendo apenas rótulos não dominados. Empates ficam com o primeiro."""
+    for VetorExistente, _ in Fronteira:
+        if _Domina(VetorExistente, Vetor):
+            return False
+    Fronteira[:] = [(v, r) for v, r in Fronteira if not _Domina(Vetor, v)]
+    Fronteira.append((Vetor, Rotulo))
+    return True
+
+
+class ParetoRouteService:
+    """
+    Busca multicritério (label-setting) sobre a varredura de voos do Connection Scan.
+
+    Critérios: chegada, duração (partida inicial), custo, nº de trechos, trocas de Cia, falta de tarifa
+    e índice de parceria das Cias.
+    Cada voo embarcado guarda uma 'sacola' com os rótulos não dominados que chegam por ele;
+    como todos chegam no mesmo horário e com a mesma Cia, a dominância ali é exata para as extensões.
+    Tanto na sacola quanto no destino os rótulos só competem dentro da mesma classe (direta, mesma Cia,
+    interline): a classe de um rótulo e a de suas extensões pelo mesmo voo andam juntas, então um voo
+    direto nunca elimina uma conexão que seria a única candidata da categoria 'conexao_mesma_cia'.
+    Das fronteiras do destino a RouteIntelligence deriva todas as categorias sem tarifar itinerários dominados.
+    """
+
+    @staticmethod
+    def _DistanciasAteDestino(Grafo, Destinos, MaxTrechos):
+        """BFS reversa: menor nº de trechos de cada aeroporto até algum destino (poda da varredura)."""
+        Distancias = {d: 0 for d in Destinos if Grafo.has_node(d)}
+        Fila = deque(Distancias.keys())
+        while Fila:
+            No = Fila.popleft()
+            if Distancias[No] >= MaxTrechos:
+                continue
+            for Anterior in Grafo.predecessors(No):
+                if Anterior not in Distancias:
+                    Distancias[Anterior] = Distancias[No] + 1
+                    Fila.append(Anterior)
+        return Distancias
+
+    @staticmethod
+    def BuscarFronteira(Rede, Origens, Destinos, Inicio, LimitePartida, FuncaoCusto, ScoresParceria=None, MaxTrechos=3):
+        """
+        FuncaoCusto(Voo) -> (custo, sem_tarifa). Chamada só para voos que ainda podem levar ao destino.
+        ScoresParceria: {CIA: índice}, com o mesmo padrão (50) do cálculo das métricas do candidato.
+        Retorna a lista de itinerários (listas de voos) da fronteira de Pareto, todas as classes juntas.
+        """
+        Origens = set(Origens)
+        Destinos = set(Destinos)
+        ScoresParceria = ScoresParceria or {}
+        Distancias = ParetoRouteService._DistanciasAteDestino(Rede.Grafo, Destinos, MaxTrechos)
+
+        # Aeroporto -> listas paralelas (ordenadas por chegada) de horários e sacolas de rótulos
+        TemposChegada = {}
+        SacolasChegada = {}
+        FronteirasDestino = {}
+
+        for Voo in Rede.VoosNoPeriodo(Inicio, LimitePartida):
+            Partida, Destino = Voo.AeroportoOrigem, Voo.AeroportoDestino
+            DistRestante = Distancias.get(Destino)
+            if DistRestante is None:
+                continue # Deste aeroporto não se alcança o destino
+
+            Candidatos = []
+            if Partida in Origens and Destino not in Origens and 1 + DistRestante <= MaxTrechos:
+                Candidatos.append(None)
+
+            Tempos = TemposChegada.get(Partida)
+            if Tempos:
+                Ini = bisect_left(Tempos, Voo.Partida - CONEXAO_MAXIMA)
+                Fim = bisect_right(Tempos, Voo.Partida - CONEXAO_MINIMA)
+                for Sacola in SacolasChegada[Partida][Ini:Fim]:
+                    for _, Anterior in Sacola:
+                        if Anterior.Trechos + 1 + DistRestante > MaxTrechos: continue
+                        if Destino in Anterior.Aeroportos: continue # Caminho simples
+                        Candidatos.append(Anterior)
+
+            if not Candidatos:
+                continue
+
+            Custo, SemTarifa = FuncaoCusto(Voo)
+            Parceria = ScoresParceria.get(Voo.CiaAerea.strip().upper(), 50)
+            Sacola = []
+            for Anterior in Candidatos:
+                Rotulo = _RotuloPareto(Voo, Anterior, Custo, SemTarifa, Parceria)
+                # Rótulos só competem dentro da mesma classe (direto não elimina conexão, nem interline a mesma Cia)
+                _InserirNaFronteira(Sacola, Rotulo, (Rotulo.Classe(),) + Rotulo.Vetor())
+
+            if Destino in Destinos:
+                for _, Rotulo in Sacola:
+                    Fronteira = FronteirasDestino.setdefault(Rotulo.Classe(), [])
+                    _InserirNaFronteira(Fronteira, Rotulo, Rotulo.Vetor(NoDestino=True))
+                continue # Chegou ao destino: não segue viagem
+
+            Sacola = [(v, r) for v, r in Sacola if r.Trechos < MaxTrechos]
+            if Sacola:
+                Tempos = TemposChegada.setdefault(Destino, [])
+                Pos = bisect_right(Tempos, Voo.Chegada)
+                Tempos.insert(Pos, Voo.Chegada)
+                SacolasChegada.setdefault(Destino, []).insert(Pos, Sacola)
+
+        return [Rotulo.Sequencia() for Fronteira in FronteirasDestino.values() for _, Rotulo in Fronteira]
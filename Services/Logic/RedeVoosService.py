@@ -0,0 +1,275 @@
+import threading
+import networkx as nx
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from Conexoes import ObterSessaoSqlServer
+from Models.SQL_SERVER.MalhaAerea import RemessaMalha, VooMalha
+from Services.LogService import LogService
+
+# Regras de conexão entre trechos (mesmas do planejamento manual)
+CONEXAO_MINIMA = timedelta(hours=1)
+CONEXAO_MAXIMA = timedelta(hours=48)
+
+class VooIndexado:
+    """
+    Voo da malha desacoplado da sessão do banco.
+    Mantém os mesmos nomes de atributos do VooMalha (usados na formatação das rotas)
+    e acrescenta Partida/Chegada absolutas, já com a virada de dia aplicada.
+    """
+    __slots__ = ('Id', 'IdRemessa', 'CiaAerea', 'NumeroVoo', 'DataPartida', 'AeroportoOrigem',
+                 'AeroportoDestino', 'HorarioSaida', 'HorarioChegada', 'Partida', 'Chegada')
+
+    def __init__(self, Id, IdRemessa, CiaAerea, NumeroVoo, DataPartida, AeroportoOrigem,
+                 AeroportoDestino, HorarioSaida, HorarioChegada):
+        self.Id = Id
+        self.IdRemessa = IdRemessa
+        self.CiaAerea = CiaAerea
+        self.NumeroVoo = NumeroVoo
+        self.DataPartida = DataPartida
+        self.AeroportoOrigem = AeroportoOrigem
+        self.AeroportoDestino = AeroportoDestino
+        self.HorarioSaida = HorarioSaida
+        self.HorarioChegada = HorarioChegada
+        self.Partida = datetime.combine(DataPartida, HorarioSaida)
+        self.Chegada = datetime.combine(DataPartida, HorarioChegada)
+        # Voo noturno: chegada no dia seguinte
+        if HorarioChegada < HorarioSaida:
+            self.Chegada += timedelta(days=1)
+
+
+class RedeVoos:
+    """
+    Índice temporal da malha ativa.
+    Para cada par (origem, destino) guarda os voos ordenados pela partida absoluta
+    e a lista paralela de partidas, permitindo localizar a janela de embarque via bisect.
+    """
+
+    def __init__(self, ListaVoos, Assinatura):
+        self.Assinatura = Assinatura
+        self.Trechos = {}
+        self.Partidas = {}
+        self.PorId = {v.Id: v for v in ListaVoos}
+        self._Copiados = None
+
+        for Voo in ListaVoos:
+            self.Trechos.setdefault((Voo.AeroportoOrigem, Voo.AeroportoDestino), []).append(Voo)
+
+        for Chave, Voos in self.Trechos.items():
+            Voos.sort(key=lambda v: v.Partida)
+            self.Partidas[Chave] = [v.Partida for v in Voos]
+
+        # Todos os voos ordenados por partida (varredura do Connection Scan)
+        self.VoosPorPartida = sorted(ListaVoos, key=lambda v: v.Partida)
+        self.PartidasGlobais = [v.Partida for v in self.VoosPorPartida]
+
+        # Grafo topológico (sem tempo) usado na enumeração de caminhos
+        self.Grafo = nx.DiGraph()
+        self.Grafo.add_edges_from(self.Trechos.keys())
+
+        self.TotalVoos = len(ListaVoos)
+
+    def TemAeroporto(self, Iata):
+        return self.Grafo.has_node(Iata)
+
+    def VoosEntre(self, Origem, Destino, PartidaMinima, PartidaMaxima):
+        """Voos do trecho com partida em [PartidaMinima, PartidaMaxima], já ordenados."""
+        Chave = (Origem, Destino)
+        Voos = self.Trechos.get(Chave)
+        if not Voos:
+            return []
+        Partidas = self.Partidas[Chave]
+        Inicio = bisect_left(Partidas, PartidaMinima)
+        Resultado = []
+        for Pos in range(Inicio, len(Voos)):
+            if Partidas[Pos] > PartidaMaxima:
+                break
+            Resultado.append(Voos[Pos])
+        return Resultado
+
+    def VoosNoPeriodo(self, PartidaMinima, PartidaMaxima):
+        """Todos os voos com partida em [PartidaMinima, PartidaMaxima], em ordem de partida."""
+        Inicio = bisect_left(self.PartidasGlobais, PartidaMinima)
+        Fim = bisect_right(self.PartidasGlobais, PartidaMaxima)
+        return self.VoosPorPartida[Inicio:Fim]
+
+    # --- ATUALIZAÇÃO INCREMENTAL (importação diferencial) ---
+
+    def Copiar(self):
+        """
+        Cópia rasa para aplicar uma diferença sem afetar as buscas em andamento na rede atual.
+        As listas de cada trecho só são duplicadas quando o trecho é alterado.
+        """
+        Nova = RedeVoos.__new__(RedeVoos)
+        Nova.Assinatura = self.Assinatura
+        Nova.Trechos = dict(self.Trechos)
+        Nova.Partidas = dict(self.Partidas)
+        Nova.PorId = dict(self.PorId)
+        Nova.VoosPorPartida = list(self.VoosPorPartida)
+        Nova.PartidasGlobais = list(self.PartidasGlobais)
+        Nova.Grafo = self.Grafo.copy()
+        Nova.TotalVoos = self.TotalVoos
+        Nova._Copiados = set()
+        return Nova
+
+    def _ListasDoTrecho(self, Chave):
+        if self._Copiados is not None and Chave not in self._Copiados and Chave in self.Trechos:
+            self.Trechos[Chave] = list(self.Trechos[Chave])
+            self.Partidas[Chave] = list(self.Partidas[Chave])
+            self._Copiados.add(Chave)
+        if Chave not in self.Trechos:
+            self.Trechos[Chave] = []
+            self.Partidas[Chave] = []
+            if self._Copiados is not None: self._Copiados.add(Chave)
+        return self.Trechos[Chave], self.Partidas[Chave]
+
+    @staticmethod
+    def _RemoverDaLista(Voos, Partidas, Voo):
+        Pos = bisect_left(Partidas, Voo.Partida)
+        while Pos < len(Voos) and Voos[Pos] is not Voo:
+            Pos += 1
+        if Pos < len(Voos):
+            del Voos[Pos]
+            del Partidas[Pos]
+
+    def Adicionar(self, Voo):
+        Chave = (Voo.AeroportoOrigem, Voo.AeroportoDestino)
+        Voos, Partidas = self._ListasDoTrecho(Chave)
+        Pos = bisect_right(Partidas, Voo.Partida)
+        Voos.insert(Pos, Voo)
+        Partidas.insert(Pos, Voo.Partida)
+
+        Pos = bisect_right(self.PartidasGlobais, Voo.Partida)
+        self.VoosPorPartida.insert(Pos, Voo)
+        self.PartidasGlobais.insert(Pos, Voo.Partida)
+
+        self.Grafo.add_edge(*Chave)
+        self.PorId[Voo.Id] = Voo
+        self.TotalVoos += 1
+
+    def Remover(self, IdVoo):
+        Voo = self.PorId.pop(IdVoo, None)
+        if Voo is None:
+            return
+        Chave = (Voo.AeroportoOrigem, Voo.AeroportoDestino)
+        Voos, Partidas = self._ListasDoTrecho(Chave)
+        RedeVoos._RemoverDaLista(Voos, Partidas, Voo)
+        if not Voos:
+            del self.Trechos[Chave]
+            del self.Partidas[Chave]
+            self.Grafo.remove_edge(*Chave)
+            for No in Chave:
+                if self.Grafo.has_node(No) and self.Grafo.degree(No) == 0:
+                    self.Grafo.remove_node(No)
+
+        RedeVoos._RemoverDaLista(self.VoosPorPartida, self.PartidasGlobais, Voo)
+        self.TotalVoos -= 1
+
+
+class RedeVoosService:
+    """
+    Mantém em memória uma única RedeVoos por processo, construída a partir das remessas ativas.
+    É reconstruída quando a malha é importada/excluída ou quando a assinatura das remessas
+    ativas muda (ex: outro processo importou uma malha nova ou aplicou uma diferencial).
+    A assinatura é a tupla (Id, DataUpload) das remessas ativas: a importação diferencial grava
+    na própria remessa ativa, e o DataUpload renovado é o que avisa os demais processos.
+    """
+    _Rede = None
+    _Trava = threading.Lock()
+
+    @staticmethod
+    def _ObterAssinatura(Sessao):
+        Remessas = Sessao.query(RemessaMalha.Id, RemessaMalha.DataUpload).filter(RemessaMalha.Ativo == True).order_by(RemessaMalha.Id).all()
+        return tuple((r.Id, r.DataUpload) for r in Remessas)
+
+    @staticmethod
+    def IdsRemessas(Assinatura):
+        return [IdRemessa for IdRemessa, _ in Assinatura]
+
+    @staticmethod
+    def _Construir(Sessao, Assinatura):
+        Inicio = datetime.now()
+        Ids = RedeVoosService.IdsRemessas(Assinatura)
+        Linhas = Sessao.query(
+            VooMalha.Id, VooMalha.IdRemessa, VooMalha.CiaAerea, VooMalha.NumeroVoo, VooMalha.DataPartida,
+            VooMalha.AeroportoOrigem, VooMalha.AeroportoDestino, VooMalha.HorarioSaida, VooMalha.HorarioChegada
+        ).filter(VooMalha.IdRemessa.in_(Ids)).all() if Ids else []
+
+        ListaVoos = [
+            VooIndexado(
+                l.Id, l.IdRemessa, l.CiaAerea, l.NumeroVoo, l.DataPartida,
+                l.AeroportoOrigem.strip().upper(), l.AeroportoDestino.strip().upper(),
+                l.HorarioSaida, l.HorarioChegada
+            )
+            for l in Linhas
+        ]
+        Rede = RedeVoos(ListaVoos, Assinatura)
+
+        Tempo = (datetime.now() - Inicio).total_seconds()
+        LogService.Info("RedeVoosService", f"Rede de voos construída: {Rede.TotalVoos} voos, {len(Rede.Trechos)} trechos em {Tempo:.2f}s (Remessas {Ids}).")
+        return Rede
+
+    @staticmethod
+    def ObterRede(Sessao=None):
+        """
+        Retorna a rede da malha ativa, construindo-a se necessário.
+        A verificação de validade é uma consulta leve a Id/DataUpload das remessas ativas.
+        """
+        SessaoPropria = Sessao is None
+        if SessaoPropria:
+            Sessao = ObterSessaoSqlServer()
+        try:
+            Assinatura = RedeVoosService._ObterAssinatura(Sessao)
+            Rede = RedeVoosService._Rede
+            if Rede is not None and Rede.Assinatura == Assinatura:
+                return Rede
+
+            with RedeVoosService._Trava:
+                Rede = RedeVoosService._Rede
+                if Rede is None or Rede.Assinatura != Assinatura:
+                    Rede = RedeVoosService._Construir(Sessao, Assinatura)
+                    RedeVoosService._Rede = Rede
+                return Rede
+        finally:
+            if SessaoPropria:
+                Sessao.close()
+
+    @staticmethod
+    def AplicarDiferenca(IdRemessa, DataUpload, Inseridos, Alterados, Removidos):
+        """
+        Atualiza a rede residente com o resultado de uma importação diferencial, sem reconstruí-la.
+        Inseridos/Alterados são VooIndexado (Alterados com o mesmo Id do voo antigo); Removidos são Ids.
+        DataUpload é o novo valor gravado na remessa: passa a fazer parte da assinatura da rede.
+        A diferença é aplicada numa cópia, trocada de uma vez: buscas em andamento não são afetadas.
+        """
+        with RedeVoosService._Trava:
+            Rede = RedeVoosService._Rede
+            if Rede is None or IdRemessa not in RedeVoosService.IdsRemessas(Rede.Assinatura):
+                return # Não há rede dessa remessa em memória: a próxima busca constrói do banco
+
+            Inicio = datetime.now()
+            Nova = Rede.Copiar()
+            for IdVoo in list(Removidos) + [v.Id for v in Alterados]:
+                Nova.Remover(IdVoo)
+            for Voo in list(Alterados) + list(Inseridos):
+                Nova.Adicionar(Voo)
+            Nova.Assinatura = tuple((Id, DataUpload if Id == IdRemessa else Versao) for Id, Versao in Rede.Assinatura)
+            RedeVoosService._Rede = Nova
+
+        Tempo = (datetime.now() - Inicio).total_seconds()
+        LogService.Info("RedeVoosService", f"Rede de voos atualizada: +{len(Inseridos)} ~{len(Alterados)} -{len(Removidos)} voos em {Tempo:.2f}s (Remessa {IdRemessa}).")
+
+    @staticmethod
+    def Invalidar():
+        """Descarta a rede atual. A próxima busca reconstrói a partir do banco."""
+        with RedeVoosService._Trava:
+            RedeVoosService._Rede = None
+        LogService.Debug("RedeVoosService", "Rede de voos invalidada.")
+
+    @staticmethod
+    def Reconstruir():
+        """Invalida e já reconstrói a rede (chamado logo após importar uma malha)."""
+        RedeVoosService.Invalidar()
+        try:
+            RedeVoosService.ObterRede()
+        except Exception as e:
+            LogService.Error("RedeVoosService", "Falha ao reconstruir rede de voos", e)
@@ -51,49 +51,40 @@ class RouteIntelligenceService:
             item['metricas']['score'] = novo_score
             candidatos_processados.append(item)
 
-        # 2. Preenchimento das Categorias
-
-        # A) RECOMENDADA (Menor Score Geral)
-        # O Score alto da penalidade já joga estas rotas para o final da lista,
-        # mas elas ainda são retornadas se forem as únicas opções.
-        candidatos_processados.sort(key=lambda x: x['metricas']['score'])
-        
-        # Tenta pegar uma que tenha custo < 10000 e NÃO seja "Sem Tarifa" primeiro
-        if candidates_validos := [c for c in candidatos_processados if c['metricas']['custo'] < 10000 and not c['metricas']['sem_tarifa']]:
-             Categorias['recomendada'] = candidates_validos[0]
-        elif candidatos_processados:
-             Categorias['recomendada'] = candidatos_processados[0]
-
-        # B) DIRETA (0 Escalas)
-        diretas = [c for c in candidatos_processados if c['metricas']['escalas'] == 0]
-        if diretas:
-            diretas.sort(key=lambda x: x['metricas']['score'])
-            Categorias['direta'] = diretas[0]
-
-        # C) RÁPIDA (Menor Duração)
-        rapidas = sorted(candidatos_processados, key=lambda x: x['metricas']['duracao'])
-        if rapidas:
-            Categorias['rapida'] = rapidas[0]
-
-        # D) ECONÔMICA (Menor Custo)
-        # IMPORTANTE: Filtrar as que estão "sem tarifa", pois elas têm custo 0.0
-        # Se não filtrar, a rota sem tarifa ganha sempre como "a mais barata".
-        economicas = [c for c in candidatos_processados if c['metricas']['custo'] < 10000 and not c['metricas']['sem_tarifa']]
-        if economicas:
-            economicas.sort(key=lambda x: x['metricas']['custo'])
-            Categorias['economica'] = economicas[0]
-
-        # E) COM CONEXÕES (Mesma Cia)
-        conexoes_simples = [c for c in candidatos_processados if c['metricas']['escalas'] > 0 and c['metricas']['trocas_cia'] == 0]
-        if conexoes_simples:
-            conexoes_simples.sort(key=lambda x: x['metricas']['score'])
-            Categorias['conexao_mesma_cia'] = conexoes_simples[0]
-
-        # F) INTERLINE (Troca de Cia)
-        interline = [c for c in candidatos_processados if c['metricas']['trocas_cia'] > 0]
-        if interline:
-            interline.sort(key=lambda x: x['metricas']['score'])
-            Categorias['interline'] = interline[0]
+        # 2. Preenchimento das Categorias (uma única passada)
+        # Cada categoria guarda o melhor candidato visto até agora. Rápida e econômica desempatam
+        # pelo score, o mesmo resultado das ordenações estáveis sobre a lista já ordenada por score.
+        # Candidatos "sem tarifa" têm custo 0.0 e não podem ganhar a econômica nem a recomendada válida.
+        def menor(atual, candidato, chave):
+            return candidato if atual is None or chave(candidato) < chave(atual) else atual
+
+        por_score = lambda x: x['metricas']['score']
+        por_duracao = lambda x: (x['metricas']['duracao'], x['metricas']['score'])
+        por_custo = lambda x: (x['metricas']['custo'], x['metricas']['score'])
+
+        Melhores = dict.fromkeys(['recomendada_valida', 'recomendada', 'direta', 'rapida', 'economica', 'conexao_mesma_cia', 'interline'])
+        for c in candidatos_processados:
+            m = c['metricas']
+            valida = m['custo'] < 10000 and not m['sem_tarifa']
+
+            Melhores['recomendada'] = menor(Melhores['recomendada'], c, por_score)
+            Melhores['rapida'] = menor(Melhores['rapida'], c, por_duracao)
+            if valida:
+                Melhores['recomendada_valida'] = menor(Melhores['recomendada_valida'], c, por_score)
+                Melhores['economica'] = menor(Melhores['economica'], c, por_custo)
+            if m['escalas'] == 0:
+                Melhores['direta'] = menor(Melhores['direta'], c, por_score)
+            if m['escalas'] > 0 and m['trocas_cia'] == 0:
+                Melhores['conexao_mesma_cia'] = menor(Melhores['conexao_mesma_cia'], c, por_score)
+            if m['trocas_cia'] > 0:
+                Melhores['interline'] = menor(Melhores['interline'], c, por_score)
+
+        # A) RECOMENDADA: prefere uma rota com tarifa válida; sem tarifa só se for a única opção
+        Melhores['recomendada'] = Melhores.pop('recomendada_valida') or Melhores['recomendada']
+
+        for cat, melhor in Melhores.items():
+            if melhor is not None:
+                Categorias[cat] = melhor
 
         return Categorias
 
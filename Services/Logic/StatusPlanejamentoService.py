@@ -0,0 +1,117 @@
+import threading
+from datetime import datetime
+from sqlalchemy import func
+from Conexoes import ObterSessaoSqlServer
+from Models.SQL_SERVER.Planejamento import PlanejamentoCabecalho, PlanejamentoItem
+from Services.LogService import LogService
+
+# Limite de parâmetros por consulta (o SQL Server aceita até 2100)
+TAMANHO_LOTE = 1000
+
+def ChavePlanejamento(Filial, Serie, Ctc):
+    """Chave 'filial-serie-ctc' usada para cruzar a fila de CTCs com os planejamentos gravados."""
+    return '-'.join(str(v).strip() if v else '' for v in (Filial, Serie, Ctc))
+
+
+class StatusPlanejamentoService:
+    """
+    Status de planejamento por CTC, mantido em memória e consultado só para os CTCs da fila.
+    - CTC nunca visto: buscado em lote no Tb_PLN_PlanejamentoItem (pela coluna Ctc);
+      a ausência também fica guardada (None), para não reconsultar a cada atualização da fila;
+    - RegistrarPlanejamento atualiza o mapa na hora (Registrar);
+    - gravações de outros processos chegam pela marca d'água em IdItem: a cada consulta
+      só os itens com IdItem acima da última vista são lidos.
+    Assim o custo de atualizar a fila não cresce com o histórico de planejamentos.
+    """
+    _Mapa = {}  # Chave -> {'status', 'id_plan'} ou None (sem planejamento)
+    _UltimoItem = None
+    Versao = 0  # Incrementada a cada Registrar: quem guarda a fila serializada sabe que precisa reaplicar
+    _Trava = threading.Lock()
+
+    @staticmethod
+    def _Consulta(Sessao):
+        return Sessao.query(
+            PlanejamentoItem.IdItem, PlanejamentoItem.Filial, PlanejamentoItem.Serie, PlanejamentoItem.Ctc,
+            PlanejamentoCabecalho.Status, PlanejamentoCabecalho.IdPlanejamento
+        ).join(PlanejamentoCabecalho, PlanejamentoItem.IdPlanejamento == PlanejamentoCabecalho.IdPlanejamento)
+
+    @staticmethod
+    def _Aplicar(Linhas, Chaves=None):
+        """Grava as linhas no mapa. Em ordem de IdItem: o planejamento mais recente do CTC prevalece."""
+        for l in Linhas:
+            Chave = ChavePlanejamento(l.Filial, l.Serie, l.Ctc)
+            if Chaves is None or Chave in Chaves:
+                StatusPlanejamentoService._Mapa[Chave] = {'status': l.Status, 'id_plan': l.IdPlanejamento}
+            if StatusPlanejamentoService._UltimoItem is None or l.IdItem > StatusPlanejamentoService._UltimoItem:
+                StatusPlanejamentoService._UltimoItem = l.IdItem
+
+    @staticmethod
+    def _Sincronizar(Sessao):
+        """Traz os itens gravados desde a última consulta (inclusive por outros processos)."""
+        if StatusPlanejamentoService._UltimoItem is None:
+            # Primeira consulta: o mapa está vazio, só posiciona a marca d'água
+            StatusPlanejamentoService._UltimoItem = Sessao.query(func.max(PlanejamentoItem.IdItem)).scalar() or 0
+            return
+        Novos = StatusPlanejamentoService._Consulta(Sessao)\
+            .filter(PlanejamentoItem.IdItem > StatusPlanejamentoService._UltimoItem)\
+            .order_by(PlanejamentoItem.IdItem).all()
+        StatusPlanejamentoService._Aplicar(Novos)
+
+    @staticmethod
+    def _CarregarChaves(Sessao, Faltantes):
+        Ctcs = sorted(set(Faltantes.values()))
+        for i in range(0, len(Ctcs), TAMANHO_LOTE):
+            Linhas = StatusPlanejamentoService._Consulta(Sessao)\
+                .filter(PlanejamentoItem.Ctc.in_(Ctcs[i:i + TAMANHO_LOTE]))\
+                .order_by(PlanejamentoItem.IdItem).all()
+            StatusPlanejamentoService._Aplicar(Linhas, Faltantes)
+        for Chave in Faltantes:
+            StatusPlanejamentoService._Mapa.setdefault(Chave, None)
+
+    @staticmethod
+    def BuscarPorDocumentos(Documentos):
+        """
+        Recebe (Filial, Serie, Ctc) dos CTCs da fila e devolve {Chave: {'status', 'id_plan'}}
+        apenas dos que têm planejamento.
+        """
+        Chaves = {ChavePlanejamento(Filial, Serie, Ctc): str(Ctc).strip() for Filial, Serie, Ctc in Documentos if Ctc}
+        with StatusPlanejamentoService._Trava:
+            Inicio = datetime.now()
+            Sessao = ObterSessaoSqlServer()
+            try:
+                StatusPlanejamentoService._Sincronizar(Sessao)
+                Faltantes = {c: Ctc for c, Ctc in Chaves.items() if c not in StatusPlanejamentoService._Mapa}
+                if Faltantes:
+                    StatusPlanejamentoService._CarregarChaves(Sessao, Faltantes)
+            finally:
+                Sessao.close()
+
+            # CTCs que saíram da fila não precisam continuar em memória
+            if len(StatusPlanejamentoService._Mapa) > 2 * len(Chaves) + 10000:
+                StatusPlanejamentoService._Mapa = {c: StatusPlanejamentoService._Mapa[c] for c in Chaves}
+
+            if Faltantes:
+                Tempo = (datetime.now() - Inicio).total_seconds()
+                LogService.Debug("StatusPlanejamentoService", f"Status de planejamento: {len(Faltantes)} CTC(s) novo(s) consultado(s) em {Tempo:.2f}s.")
+
+            return {c: StatusPlanejamentoService._Mapa[c] for c in Chaves if StatusPlanejamentoService._Mapa.get(c)}
+
+    @staticmethod
+    def Registrar(IdPlanejamento, Status, Chaves, ChavesRemovidas=()):
+        """
+        Chamado após gravar um planejamento: os CTCs gravados passam a apontar para ele.
+        CTCs que saíram do planejamento (regravação) são esquecidos e reconsultados na próxima busca.
+        """
+        with StatusPlanejamentoService._Trava:
+            for Chave in ChavesRemovidas:
+                Info = StatusPlanejamentoService._Mapa.get(Chave)
+                if Info and Info['id_plan'] == IdPlanejamento:
+                    del StatusPlanejamentoService._Mapa[Chave]
+            for Chave in Chaves:
+                StatusPlanejamentoService._Mapa[Chave] = {'status': Status, 'id_plan': IdPlanejamento}
+            StatusPlanejamentoService.Versao += 1
+
+    @staticmethod
+    def ObterEmMemoria(Chave):
+        """Status já conhecido do CTC, sem ir ao banco. None se não tem planejamento (ou não foi consultado)."""
+        return StatusPlanejamentoService._Mapa.get(Chave)
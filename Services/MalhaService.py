@@ -2,16 +2,21 @@ import os
 import networkx as nx
 import pandas as pd
 from datetime import datetime, timedelta, date, time
-from sqlalchemy import desc
-from Conexoes import ObterSessaoSqlServer
-from Utils.Formatadores import PadronizarData
+from sqlalchemy import desc, delete, update
+from Conexoes import ObterSessaoSqlServer, ObterSessaoRequisicao
+from Utils.Formatadores import PadronizarDatas, PadronizarHorarios
+from Utils.Snapshot import SalvarUpload, SalvarSnapshot, CarregarSnapshot, RemoverArquivoESnapshot
 from Models.SQL_SERVER.Aeroporto import Aeroporto
 from Models.SQL_SERVER.MalhaAerea import RemessaMalha, VooMalha
 from Services.TabelaFreteService import TabelaFreteService
 from Services.CiaAereaService import CiaAereaService
 from Services.LogService import LogService
+from Services.Shared.CargaEmLoteService import CargaEmLoteService
 from Services.Logic.RouteIntelligenceService import RouteIntelligenceService
-from Configuracoes import ConfiguracaoBase
+from Services.Logic.RedeVoosService import RedeVoosService, VooIndexado, CONEXAO_MINIMA, CONEXAO_MAXIMA
+from Services.Logic.ConnectionScanService import ConnectionScanService
+from Services.Logic.ParetoRouteService import ParetoRouteService
+from Configuracoes import ConfiguracaoBase, ConfiguracaoAtual
 
 class MalhaService:
     
@@ -37,6 +42,7 @@ class MalhaService:
             if RemessaAlvo:
                 Sessao.delete(RemessaAlvo)
                 Sessao.commit()
+                RedeVoosService.Invalidar()
                 LogService.Info("MalhaService", f"Remessa ID {id_remessa} excluída com sucesso.")
                 return True, "Remessa excluída com sucesso."
             
@@ -49,31 +55,62 @@ class MalhaService:
         finally:
             Sessao.close()
 
+    @staticmethod
+    def _LerMalha(Caminho):
+        """
+        Lê a planilha uma única vez e devolve os voos já normalizados coluna a coluna (sem iterrows).
+        DataPartida fica None nas linhas com data inválida (descartadas no processamento).
+        Retorna None se a planilha não tiver coluna de data.
+        """
+        Df = pd.read_excel(Caminho, engine='openpyxl')
+        Df.columns = [c.strip().upper() for c in Df.columns]
+
+        ColunaData = next((col for col in ['DIA', 'DATA'] if col in Df.columns), None)
+        if not ColunaData:
+            return None
+
+        def coluna_texto(Nome):
+            # Mesmo resultado do str() usado antes: vazios viram 'nan'
+            return Df[Nome].astype(str).fillna('nan') if Nome in Df.columns else pd.Series('', index=Df.index)
+
+        def coluna_horario(Nome):
+            return PadronizarHorarios(Df[Nome]) if Nome in Df.columns else pd.Series(time(0, 0), index=Df.index)
+
+        return pd.DataFrame({
+            'CiaAerea': coluna_texto('CIA'),
+            'NumeroVoo': coluna_texto('Nº VOO'),
+            'DataPartida': PadronizarDatas(Df[ColunaData]),
+            'AeroportoOrigem': coluna_texto('ORIGEM').str.strip().str.upper(),
+            'HorarioSaida': coluna_horario('HORÁRIO DE SAIDA'),
+            'HorarioChegada': coluna_horario('HORÁRIO DE CHEGADA'),
+            'AeroportoDestino': coluna_texto('DESTINO').str.strip().str.upper()
+        })
+
     @staticmethod
     def AnalisarArquivo(file_storage):
         """
         Analisa a integridade do arquivo enviado e verifica conflitos de vigência.
+        A planilha é lida uma única vez: os voos normalizados ficam num snapshot ao lado
+        do arquivo temporário, reaproveitado pelo ProcessarMalhaFinal.
         Retorna metadados para confirmação do usuário.
         """
         try:
             LogService.Info("MalhaService", f"Iniciando análise do arquivo: {file_storage.filename}")
             MalhaService._GarantirDiretorio()
-            CaminhoTemp = os.path.join(MalhaService.DIR_TEMP, file_storage.filename)
-            file_storage.save(CaminhoTemp)
-            
-            Df = pd.read_excel(CaminhoTemp, engine='openpyxl')
-            Df.columns = [c.strip().upper() for c in Df.columns]
+            CaminhoTemp = SalvarUpload(file_storage, MalhaService.DIR_TEMP)
             
-            ColunaData = next((col for col in ['DIA', 'DATA'] if col in Df.columns), None)
-            if not ColunaData:
+            Voos = MalhaService._LerMalha(CaminhoTemp)
+            if Voos is None:
                 LogService.Warning("MalhaService", "Arquivo rejeitado: Coluna de DATA não encontrada.")
                 return False, "Coluna de DATA não encontrada no arquivo."
 
-            PrimeiraData = PadronizarData(Df[ColunaData].iloc[0])
+            PrimeiraData = Voos['DataPartida'].iloc[0] if len(Voos) else None
             if not PrimeiraData:
                 LogService.Warning("MalhaService", "Arquivo rejeitado: Falha ao analisar formato de data.")
                 return False, "Falha ao analisar formato de data."
             
+            SalvarSnapshot(Voos, CaminhoTemp)
+
             # Define o primeiro dia do mês como referência
             DataRef = PrimeiraData.replace(day=1) 
             
@@ -98,23 +135,34 @@ class MalhaService:
             return False, f"Exceção durante análise do arquivo: {e}"
 
     @staticmethod
-    def ProcessarMalhaFinal(caminho_arquivo, data_ref, nome_original, usuario, tipo_acao):
+    def ProcessarMalhaFinal(caminho_arquivo, data_ref, nome_original, usuario, tipo_acao, Progresso=None):
         """
         Processa o arquivo validado e persiste os voos no banco de dados.
+        Usa o snapshot gerado na análise; só relê a planilha se ele não existir.
         Realiza a substituição de malha anterior caso necessário.
+        Com tipo_acao='Diferencial' a remessa ativa do mês é mantida e só as diferenças são gravadas.
+        'Progresso(Fase, Linhas=None)' é informado pelo ImportacaoJobService.
         """
         LogService.Info("MalhaService", f"Iniciando processamento final ({tipo_acao}) para {data_ref}")
+        Progresso = Progresso or (lambda Fase, Linhas=None: None)
         Sessao = ObterSessaoSqlServer()
         try:
-            Df = pd.read_excel(caminho_arquivo, engine='openpyxl')
-            Df.columns = [c.strip().upper() for c in Df.columns]
-            ColunaData = next((col for col in ['DIA', 'DATA'] if col in Df.columns), None)
-            
-            Df['DATA_PADRAO'] = Df[ColunaData].apply(PadronizarData)
-            Df = Df.dropna(subset=['DATA_PADRAO'])
+            Progresso("Carregando voos analisados")
+            Voos = CarregarSnapshot(caminho_arquivo)
+            if Voos is None:
+                Progresso("Lendo arquivo")
+                Voos = MalhaService._LerMalha(caminho_arquivo)
+                if Voos is None:
+                    return False, "Coluna de DATA não encontrada no arquivo."
+            Voos = Voos.dropna(subset=['DataPartida'])
 
-            # Desativa remessa anterior
             RemessaAnterior = Sessao.query(RemessaMalha).filter_by(MesReferencia=data_ref, Ativo=True).first()
+            if tipo_acao == 'Diferencial':
+                if RemessaAnterior:
+                    return MalhaService._AplicarDiferencaMalha(Sessao, RemessaAnterior, Voos, caminho_arquivo, nome_original, usuario, Progresso)
+                tipo_acao = 'Importacao' # Nada a comparar: importação completa
+
+            # Desativa remessa anterior
             if RemessaAnterior:
                 RemessaAnterior.Ativo = False
 
@@ -128,41 +176,17 @@ class MalhaService:
             Sessao.add(NovaRemessa)
             Sessao.flush()
 
-            ListaVoos = []
-            for _, Linha in Df.iterrows():
-                try:
-                    # Tratamento de Horário
-                    raw_saida = str(Linha.get('HORÁRIO DE SAIDA', ''))
-                    raw_chegada = str(Linha.get('HORÁRIO DE CHEGADA', ''))
-                    
-                    if len(raw_saida) == 5: raw_saida += ":00"
-                    if len(raw_chegada) == 5: raw_chegada += ":00"
-
-                    H_Saida = pd.to_datetime(raw_saida, format='%H:%M:%S', errors='coerce').time() if raw_saida != 'nan' else time(0,0)
-                    H_Chegada = pd.to_datetime(raw_chegada, format='%H:%M:%S', errors='coerce').time() if raw_chegada != 'nan' else time(0,0)
-                except:
-                    H_Saida = time(0,0)
-                    H_Chegada = time(0,0)
-
-                Voo = VooMalha(
-                    IdRemessa=NovaRemessa.Id,
-                    CiaAerea=str(Linha.get('CIA', '')),
-                    NumeroVoo=str(Linha.get('Nº VOO', '')),
-                    DataPartida=Linha['DATA_PADRAO'],
-                    AeroportoOrigem=str(Linha.get('ORIGEM', '')).strip().upper(),
-                    HorarioSaida=H_Saida,
-                    HorarioChegada=H_Chegada,
-                    AeroportoDestino=str(Linha.get('DESTINO', '')).strip().upper()
-                )
-                ListaVoos.append(Voo)
-
-            Sessao.bulk_save_objects(ListaVoos)
+            ListaVoos = Voos.assign(IdRemessa=NovaRemessa.Id).to_dict('records')
+
+            # Carga em lote na mesma transação da remessa
+            CargaEmLoteService.Inserir(Sessao, VooMalha, ListaVoos, "MalhaService", Progresso=Progresso)
             Sessao.commit()
             
             LogService.Info("MalhaService", f"Malha processada com sucesso. {len(ListaVoos)} voos importados.")
+            Progresso("Reconstruindo rede de voos", len(ListaVoos))
+            RedeVoosService.Reconstruir()
             
-            if os.path.exists(caminho_arquivo):
-                os.remove(caminho_arquivo)
+            RemoverArquivoESnapshot(caminho_arquivo)
                 
             return True, "Malha processada e persistida com sucesso."
 
@@ -173,17 +197,103 @@ class MalhaService:
         finally:
             Sessao.close()
 
+    # Identidade de um voo na comparação diferencial
+    CHAVE_VOO = ['CiaAerea', 'NumeroVoo', 'DataPartida', 'AeroportoOrigem']
+    COLUNAS_VOO = CHAVE_VOO + ['HorarioSaida', 'HorarioChegada', 'AeroportoDestino']
+
+    @staticmethod
+    def _AplicarDiferencaMalha(Sessao, Remessa, Voos, caminho_arquivo, nome_original, usuario, Progresso):
+        """
+        Compara o arquivo com os voos da remessa ativa pela chave (Cia, Nº voo, data, origem)
+        e grava apenas inclusões, alterações (horários/destino) e exclusões na própria remessa.
+        A rede de voos em memória recebe a mesma diferença, sem reconstrução completa.
+        Chaves repetidas são pareadas pela ordem de ocorrência.
+        """
+        Chave = MalhaService.CHAVE_VOO + ['_Ocorrencia']
+
+        Progresso("Comparando com a malha ativa")
+        Atuais = pd.DataFrame(
+            Sessao.query(VooMalha.Id, *[getattr(VooMalha, c) for c in MalhaService.COLUNAS_VOO])
+                  .filter(VooMalha.IdRemessa == Remessa.Id)
+                  .order_by(VooMalha.Id).all(), # Ordem fixa: o pareamento por _Ocorrencia não depende do plano de execução
+            columns=['Id'] + MalhaService.COLUNAS_VOO
+        )
+        Novos = Voos[MalhaService.COLUNAS_VOO].copy()
+        Novos['_Ocorrencia'] = Novos.groupby(MalhaService.CHAVE_VOO, sort=False).cumcount()
+        Atuais['_Ocorrencia'] = Atuais.groupby(MalhaService.CHAVE_VOO, sort=False).cumcount()
+
+        Comparacao = Novos.merge(Atuais, on=Chave, how='outer', suffixes=('', '_Atual'), indicator=True)
+        Inclusoes = Comparacao[Comparacao['_merge'] == 'left_only']
+        Exclusoes = Comparacao[Comparacao['_merge'] == 'right_only']
+        Comuns = Comparacao[Comparacao['_merge'] == 'both']
+        Alteracoes = Comuns[
+            (Comuns['HorarioSaida'] != Comuns['HorarioSaida_Atual']) |
+            (Comuns['HorarioChegada'] != Comuns['HorarioChegada_Atual']) |
+            (Comuns['AeroportoDestino'] != Comuns['AeroportoDestino_Atual'])
+        ]
+
+        IdsRemovidos = [int(i) for i in Exclusoes['Id']]
+        ListaAlteracoes = [
+            {'Id': int(l['Id']), 'HorarioSaida': l['HorarioSaida'], 'HorarioChegada': l['HorarioChegada'], 'AeroportoDestino': l['AeroportoDestino']}
+            for l in Alteracoes.to_dict('records')
+        ]
+        ListaInclusoes = Inclusoes[MalhaService.COLUNAS_VOO].assign(IdRemessa=Remessa.Id).to_dict('records')
+
+        Progresso("Gravando diferenças")
+        # Lotes de 1000 Ids: abaixo do limite de 2100 parâmetros do SQL Server
+        for Inicio in range(0, len(IdsRemovidos), 1000):
+            Sessao.execute(delete(VooMalha).where(VooMalha.Id.in_(IdsRemovidos[Inicio:Inicio + 1000])))
+        if ListaAlteracoes:
+            Sessao.execute(update(VooMalha), ListaAlteracoes) # UPDATE em lote pela chave primária
+
+        UltimoIdAnterior = int(Atuais['Id'].max()) if len(Atuais) else 0
+        if ListaInclusoes:
+            CargaEmLoteService.Inserir(Sessao, VooMalha, ListaInclusoes, "MalhaService", Progresso=Progresso)
+
+        Remessa.NomeArquivoOriginal = nome_original
+        Remessa.UsuarioResponsavel = usuario
+        Remessa.TipoAcao = 'Diferencial'
+        Remessa.DataUpload = datetime.now() # Muda a assinatura da malha: os demais processos reconstroem a rede
+
+        # Ids gerados na carga (o executemany não os devolve)
+        Inseridos = Sessao.query(
+            VooMalha.Id, *[getattr(VooMalha, c) for c in MalhaService.COLUNAS_VOO]
+        ).filter(VooMalha.IdRemessa == Remessa.Id, VooMalha.Id > UltimoIdAnterior).all() if ListaInclusoes else []
+        Sessao.commit()
+
+        Resumo = f"{len(ListaInclusoes)} inclusões, {len(ListaAlteracoes)} alterações, {len(IdsRemovidos)} exclusões"
+        LogService.Info("MalhaService", f"Malha diferencial aplicada na remessa {Remessa.Id}: {Resumo}.")
+
+        def indexar(l):
+            return VooIndexado(
+                int(l['Id']), Remessa.Id, l['CiaAerea'], l['NumeroVoo'], l['DataPartida'],
+                l['AeroportoOrigem'].strip().upper(), l['AeroportoDestino'].strip().upper(),
+                l['HorarioSaida'], l['HorarioChegada']
+            )
+
+        Progresso("Atualizando rede de voos", len(ListaInclusoes) + len(ListaAlteracoes) + len(IdsRemovidos))
+        RedeVoosService.AplicarDiferenca(
+            Remessa.Id, Remessa.DataUpload, # Relido após o commit: o mesmo valor que os outros processos verão
+            [indexar(l._asdict()) for l in Inseridos],
+            [indexar(l) for l in Alteracoes.to_dict('records')],
+            IdsRemovidos
+        )
+
+        RemoverArquivoESnapshot(caminho_arquivo)
+        return True, f"Malha atualizada por diferença: {Resumo}."
+
     @staticmethod
     def _GarantirDiretorio():
         if not os.path.exists(MalhaService.DIR_TEMP):
             os.makedirs(MalhaService.DIR_TEMP)
 
     @staticmethod
-    def BuscarOpcoesDeRotas(data_inicio, data_fim, lista_origens, lista_destinos, peso_total=100.0):
+    def BuscarOpcoesDeRotas(data_inicio, data_fim, lista_origens, lista_destinos, peso_total=100.0, motor=None):
         """
         Retorna dicionário expandido com as novas categorias.
+        'motor' sobrepõe Configuracoes.MOTOR_ROTAS ('classico', 'pareto', 'csa' ou 'comparar').
         """
-        Sessao = ObterSessaoSqlServer()
+        Sessao = ObterSessaoRequisicao()
         ResultadosFormatados = {
             'recomendada': [], 
             'direta': [],
@@ -201,95 +311,39 @@ class MalhaService:
 
         try:
             LogService.Warning("MalhaService", f"=== BUSCA INTELIGENTE INICIADA ===")
-            FiltroDataInicio = data_inicio.date() if isinstance(data_inicio, datetime) else data_inicio
             FiltroDataFim = data_fim.date() if isinstance(data_fim, datetime) else data_fim
             
-            # 1. Busca no Banco
-            VoosDB = Sessao.query(VooMalha).join(RemessaMalha).filter(
-                    RemessaMalha.Ativo == True,
-                    VooMalha.DataPartida >= FiltroDataInicio, 
-                    VooMalha.DataPartida <= FiltroDataFim + timedelta(days=5) 
-                ).all()
-
-            if not VoosDB: 
+            # 1. Rede de voos residente (índice temporal da malha ativa)
+            Rede = RedeVoosService.ObterRede(Sessao)
+            if not Rede.TotalVoos:
                 LogService.Error("MalhaDebug", "[CRÍTICO] Nenhum voo encontrado no banco para este período/remessa ativa.")
                 return ResultadosFormatados
-            
-            # 2. Montagem do Grafo
-            G = nx.DiGraph()
-            for Voo in VoosDB:
-                OrigemNo = Voo.AeroportoOrigem.strip().upper()
-                DestinoNo = Voo.AeroportoDestino.strip().upper()
-
-                if G.has_edge(OrigemNo, DestinoNo):
-                    G[OrigemNo][DestinoNo]['voos'].append(Voo)
-                else:
-                    G.add_edge(OrigemNo, DestinoNo, voos=[Voo])
-            
-            ListaCandidatos = []
+
+            # Mesma janela de antes: voos partindo até 5 dias após o fim do período
+            LimitePartida = datetime.combine(FiltroDataFim + timedelta(days=5), time.max)
+
             ScoresParceria = CiaAereaService.ObterDicionarioScores()
+            InicioBusca = data_inicio if isinstance(data_inicio, datetime) else datetime.combine(data_inicio, time.min)
+
+            # 2. Geração dos itinerários (motor selecionável para comparação)
+            # Tarifas memorizadas por (origem, destino, cia): cada trecho distinto é tarifado uma única vez
+            MemoTarifas = {}
+            Motor = (motor or ConfiguracaoAtual.MOTOR_ROTAS).lower()
+            def custo_trecho(Voo):
+                c, info_frete = MalhaService._TarifarTrecho(Voo, peso_total, MemoTarifas)
+                return c, info_frete.get('tarifa_missing', False)
+            if Motor == 'pareto':
+                Sequencias = ParetoRouteService.BuscarFronteira(Rede, lista_origens, lista_destinos, InicioBusca, LimitePartida, custo_trecho, ScoresParceria)
+            elif Motor == 'comparar':
+                Sequencias = MalhaService._CompararMotores(Rede, lista_origens, lista_destinos, InicioBusca, LimitePartida, custo_trecho, peso_total, ScoresParceria, MemoTarifas)
+            elif Motor == 'csa':
+                Sequencias = ConnectionScanService.BuscarItinerarios(Rede, lista_origens, lista_destinos, InicioBusca, LimitePartida)
+            else:
+                Sequencias = MalhaService._GerarSequenciasClassico(Rede, lista_origens, lista_destinos, InicioBusca, LimitePartida)
+
+            # 3. Processamento de Rotas (Tarifação e Métricas)
+            ListaCandidatos = [MalhaService._MontarCandidato(Seq, peso_total, ScoresParceria, MemoTarifas) for Seq in Sequencias]
 
-            # 3. Processamento de Rotas
-            for origem_iata in lista_origens:
-                for destino_iata in lista_destinos:
-                    
-                    if not G.has_node(origem_iata) or not G.has_node(destino_iata):
-                        continue 
-
-                    try:
-                        CaminhosNos = list(nx.all_simple_paths(G, source=origem_iata, target=destino_iata, cutoff=3))
-                    except Exception as e: 
-                        LogService.Error("MalhaDebug", f"Erro no algoritmo nx.all_simple_paths para {origem_iata}->{destino_iata}", e)
-                        continue 
-
-                    if not CaminhosNos: continue
-
-                    # CHECK 3: Validação de Horários (Cronologia)
-                    for Caminho in CaminhosNos:
-                        SequenciaVoos = MalhaService._ValidarCaminhoCronologico(G, Caminho, data_inicio)
-                        
-                        if not SequenciaVoos: continue
-                        
-                        # --- Processamento da Rota Válida ---
-                        Duracao = MalhaService._CalcularDuracaoRota(SequenciaVoos)
-                        TrocasCia = MalhaService._ContarTrocasCia(SequenciaVoos)
-                        QtdEscalas = len(SequenciaVoos) - 1
-                        CustoTotal = 0.0
-                        ScoreParceriaAcumulado = 0 
-                        SemTarifaFlag = False
-                        DetalhesTarifarios = []
-                        IdRota = "->".join(Caminho)
-                        
-                        for i, v in enumerate(SequenciaVoos):
-                            c, info_frete = TabelaFreteService.CalcularCustoEstimado(v.AeroportoOrigem, v.AeroportoDestino, v.CiaAerea, peso_total)
-                            
-                            # AQUI MUDOU: Verifica a flag retornada pelo serviço
-                            if info_frete.get('tarifa_missing', False):
-                                SemTarifaFlag = True
-                                LogService.Warning("MalhaDebug", f"[TARIFACAO MISS] {IdRota} Trecho {i+1} ({v.CiaAerea}): Penalidade Virtual")
-                            
-                            # 'c' agora é 0.0 se não tiver tarifa, então CustoTotal não explode visualmente
-                            info_frete['custo_calculado'] = c
-                            CustoTotal += c
-                            DetalhesTarifarios.append(info_frete)
-                            ScoreParceriaAcumulado += ScoresParceria.get(v.CiaAerea.strip().upper(), 50)
-                        
-                        MediaParceria = ScoreParceriaAcumulado / len(SequenciaVoos) if len(SequenciaVoos) > 0 else 50
-                        
-                        ListaCandidatos.append({
-                            'rota': SequenciaVoos,
-                            'detalhes_tarifas': DetalhesTarifarios,
-                            'metricas': {
-                                'duracao': Duracao, 
-                                'custo': CustoTotal, 
-                                'escalas': QtdEscalas, 
-                                'trocas_cia': TrocasCia, 
-                                'indice_parceria': MediaParceria,
-                                'sem_tarifa': SemTarifaFlag, # Flag repassada para Intelligence
-                                'score': 0
-                            }
-                        })
-                    
             if not ListaCandidatos: 
                 LogService.Warning("MalhaDebug", "Finalizado sem candidatos válidos.")
                 return ResultadosFormatados
@@ -329,30 +383,141 @@ class MalhaService:
             Sessao.close()
 
     @staticmethod
-    def _ValidarCaminhoCronologico(Grafo, ListaNos, DataInicio):
+    def _GerarSequenciasClassico(Rede, lista_origens, lista_destinos, InicioBusca, LimitePartida):
+        """Motor clássico: enumera caminhos simples no grafo (até 3 trechos) e valida a cronologia de cada um."""
+        G = Rede.Grafo
+        Sequencias = []
+        for origem_iata in lista_origens:
+            for destino_iata in lista_destinos:
+
+                if not G.has_node(origem_iata) or not G.has_node(destino_iata):
+                    continue
+
+                try:
+                    CaminhosNos = list(nx.all_simple_paths(G, source=origem_iata, target=destino_iata, cutoff=3))
+                except Exception as e:
+                    LogService.Error("MalhaDebug", f"Erro no algoritmo nx.all_simple_paths para {origem_iata}->{destino_iata}", e)
+                    continue
+
+                # CHECK 3: Validação de Horários (Cronologia)
+                for Caminho in CaminhosNos:
+                    SequenciaVoos = MalhaService._ValidarCaminhoCronologico(Rede, Caminho, InicioBusca, LimitePartida)
+                    if SequenciaVoos: Sequencias.append(SequenciaVoos)
+        return Sequencias
+
+    @staticmethod
+    def _CompararMotores(Rede, lista_origens, lista_destinos, InicioBusca, LimitePartida, custo_trecho, peso_total, ScoresParceria, MemoTarifas):
+        """
+        Executa os motores lado a lado e registra tempos e melhor chegada de cada um.
+        Para o Pareto registra também as categorias cujo vencedor difere do clássico.
+        Retorna o resultado do motor clássico (comportamento de produção).
+        """
+        def descrever(Seq):
+            if not Seq: return "nenhuma"
+            return f"{'->'.join([Seq[0].AeroportoOrigem] + [v.AeroportoDestino for v in Seq])} chegada {Seq[-1].Chegada:%d/%m %H:%M}"
+
+        T0 = datetime.now()
+        Classico = MalhaService._GerarSequenciasClassico(Rede, lista_origens, lista_destinos, InicioBusca, LimitePartida)
+        T1 = datetime.now()
+        Csa = ConnectionScanService.BuscarItinerarios(Rede, lista_origens, lista_destinos, InicioBusca, LimitePartida)
+        T2 = datetime.now()
+        Pareto = ParetoRouteService.BuscarFronteira(Rede, lista_origens, lista_destinos, InicioBusca, LimitePartida, custo_trecho, ScoresParceria)
+        T3 = datetime.now()
+
+        def vencedores(Sequencias):
+            Candidatos = [MalhaService._MontarCandidato(Seq, peso_total, ScoresParceria, MemoTarifas) for Seq in Sequencias]
+            Opcoes = RouteIntelligenceService.OtimizarOpcoes(Candidatos) if Candidatos else {}
+            return {cat: tuple(v.Id for v in val['rota']) for cat, val in Opcoes.items() if val}
+
+        VencedoresClassico = vencedores(Classico)
+        VencedoresPareto = vencedores(Pareto)
+        Divergentes = sorted(cat for cat in set(VencedoresClassico) | set(VencedoresPareto)
+                             if VencedoresClassico.get(cat) != VencedoresPareto.get(cat))
+
+        LogService.Info("MalhaDebug", (
+            f"[COMPARAR MOTORES] {lista_origens}->{lista_destinos} | "
+            f"Clássico: {len(Classico)} itinerários em {(T1 - T0).total_seconds() * 1000:.1f}ms, melhor {descrever(ConnectionScanService.MelhorChegada(Classico))} | "
+            f"CSA: {len(Csa)} itinerários em {(T2 - T1).total_seconds() * 1000:.1f}ms, melhor {descrever(ConnectionScanService.MelhorChegada(Csa))} | "
+            f"Pareto: {len(Pareto)} itinerários em {(T3 - T2).total_seconds() * 1000:.1f}ms, "
+            f"categorias divergentes do clássico: {', '.join(Divergentes) if Divergentes else 'nenhuma'}"
+        ))
+        return Classico
+
+    @staticmethod
+    def _TarifarTrecho(Voo, peso_total, MemoTarifas):
+        """Tarifa um trecho reaproveitando o resultado de outro voo com mesma origem, destino e Cia."""
+        Chave = (Voo.AeroportoOrigem, Voo.AeroportoDestino, Voo.CiaAerea)
+        if Chave not in MemoTarifas:
+            MemoTarifas[Chave] = TabelaFreteService.CalcularCustoEstimado(Voo.AeroportoOrigem, Voo.AeroportoDestino, Voo.CiaAerea, peso_total)
+        c, info_frete = MemoTarifas[Chave]
+        return c, dict(info_frete)
+
+    @staticmethod
+    def _MontarCandidato(SequenciaVoos, peso_total, ScoresParceria, MemoTarifas=None):
+        """Tarifa cada trecho e calcula as métricas usadas pela RouteIntelligence."""
+        if MemoTarifas is None: MemoTarifas = {}
+        Duracao = MalhaService._CalcularDuracaoRota(SequenciaVoos)
+        TrocasCia = MalhaService._ContarTrocasCia(SequenciaVoos)
+        QtdEscalas = len(SequenciaVoos) - 1
+        CustoTotal = 0.0
+        ScoreParceriaAcumulado = 0
+        SemTarifaFlag = False
+        DetalhesTarifarios = []
+        IdRota = "->".join([SequenciaVoos[0].AeroportoOrigem] + [v.AeroportoDestino for v in SequenciaVoos])
+
+        for i, v in enumerate(SequenciaVoos):
+            c, info_frete = MalhaService._TarifarTrecho(v, peso_total, MemoTarifas)
+
+            # AQUI MUDOU: Verifica a flag retornada pelo serviço
+            if info_frete.get('tarifa_missing', False):
+                SemTarifaFlag = True
+                LogService.Warning("MalhaDebug", f"[TARIFACAO MISS] {IdRota} Trecho {i+1} ({v.CiaAerea}): Penalidade Virtual")
+
+            # 'c' agora é 0.0 se não tiver tarifa, então CustoTotal não explode visualmente
+            info_frete['custo_calculado'] = c
+            CustoTotal += c
+            DetalhesTarifarios.append(info_frete)
+            ScoreParceriaAcumulado += ScoresParceria.get(v.CiaAerea.strip().upper(), 50)
+
+        MediaParceria = ScoreParceriaAcumulado / len(SequenciaVoos) if len(SequenciaVoos) > 0 else 50
+
+        return {
+            'rota': SequenciaVoos,
+            'detalhes_tarifas': DetalhesTarifarios,
+            'metricas': {
+                'duracao': Duracao,
+                'custo': CustoTotal,
+                'escalas': QtdEscalas,
+                'trocas_cia': TrocasCia,
+                'indice_parceria': MediaParceria,
+                'sem_tarifa': SemTarifaFlag, # Flag repassada para Intelligence
+                'score': 0
+            }
+        }
+
+    @staticmethod
+    def _ValidarCaminhoCronologico(Rede, ListaNos, DataInicio, LimitePartida):
+        """
+        Escolhe, trecho a trecho, o primeiro voo viável respeitando conexão mínima de 1h e máxima de 48h.
+        Dentro da janela viável, prefere manter a mesma Cia do trecho anterior.
+        """
         VoosEscolhidos = []
         MomentoDisponivel = DataInicio if isinstance(DataInicio, datetime) else datetime.combine(DataInicio, time.min)
         for i in range(len(ListaNos) - 1):
             Origem, Destino = ListaNos[i], ListaNos[i+1]
-            if Destino not in Grafo[Origem]: return None
-            OpcoesVoos = sorted(Grafo[Origem][Destino]['voos'][:], key=lambda v: (v.DataPartida, v.HorarioSaida))
+            if i == 0:
+                JanelaInicio, JanelaFim = MomentoDisponivel, LimitePartida
+            else:
+                JanelaInicio = MomentoDisponivel + CONEXAO_MINIMA
+                JanelaFim = min(MomentoDisponivel + CONEXAO_MAXIMA, LimitePartida)
+            OpcoesVoos = Rede.VoosEntre(Origem, Destino, JanelaInicio, JanelaFim)
+            if not OpcoesVoos: return None
+            VooViavel = OpcoesVoos[0]
             CiaPreferida = VoosEscolhidos[-1].CiaAerea if VoosEscolhidos else None
-            if CiaPreferida: OpcoesVoos = [v for v in OpcoesVoos if v.CiaAerea == CiaPreferida] + [v for v in OpcoesVoos if v.CiaAerea != CiaPreferida]
-            VooViavel = None
-            for Voo in OpcoesVoos:
-                SaidaVoo = datetime.combine(Voo.DataPartida, Voo.HorarioSaida)
-                if i == 0:
-                    if SaidaVoo >= MomentoDisponivel: VooViavel = Voo; break
-                else:
-                    ChegadaAnt = datetime.combine(VoosEscolhidos[-1].DataPartida, VoosEscolhidos[-1].HorarioChegada)
-                    if VoosEscolhidos[-1].HorarioChegada < VoosEscolhidos[-1].HorarioSaida: ChegadaAnt += timedelta(days=1)
-                    if SaidaVoo >= ChegadaAnt + timedelta(hours=1) and SaidaVoo <= ChegadaAnt + timedelta(hours=48): VooViavel = Voo; break
-            if VooViavel:
-                VoosEscolhidos.append(VooViavel)
-                ChegadaVoo = datetime.combine(VooViavel.DataPartida, VooViavel.HorarioChegada)
-                if VooViavel.HorarioChegada < VooViavel.HorarioSaida: ChegadaVoo += timedelta(days=1)
-                MomentoDisponivel = ChegadaVoo
-            else: return None
+            if CiaPreferida:
+                VooViavel = next((v for v in OpcoesVoos if v.CiaAerea == CiaPreferida), VooViavel)
+            VoosEscolhidos.append(VooViavel)
+            MomentoDisponivel = VooViavel.Chegada
         return VoosEscolhidos
 
     @staticmethod
@@ -0,0 +1,140 @@
+import json
+import threading
+import time
+from uuid import uuid4
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from Conexoes import ObterSessaoSqlServer
+from Configuracoes import ConfiguracaoAtual
+from Models.SQL_SERVER.Awb import AwbStatus
+from Services.AcompanhamentoService import AcompanhamentoService
+from Services.LogService import LogService
+
+class MonitorStatusAwbService:
+    """
+    Acompanha o TB_AWB_STATUS por marca d'água em DATA_INSERT, numa única thread por processo,
+    e guarda as mudanças de status num buffer em memória com número de sequência.
+    Os painéis recebem só as diferenças via Server-Sent Events (Last-Event-ID = 'instância.sequência'):
+    muitos operadores conectados custam uma consulta ao banco por intervalo, não uma listagem por operador.
+    A thread só roda enquanto houver painel conectado (para após MONITOR_AWB_OCIOSO sem acessos).
+    Cada consulta relê MONITOR_AWB_JANELA segundos antes da marca d'água: linhas com o mesmo DATA_INSERT
+    ou gravadas por transações que commitaram depois não se perdem; as já vistas são descartadas
+    pela chave (CODAWB, DATA_INSERT). O filtro por DATA_INSERT usa o IX_AWB_STATUS_DataInsert (SQL/UltimoStatusAwb.sql).
+    """
+    _Trava = threading.Lock()
+    _Thread = None
+    _Instancia = uuid4().hex[:8] # Sequências de outro processo (ou de antes de um reinício) não valem aqui
+    _MarcaDagua = None
+    _Vistos = set() # (CODAWB, DATA_INSERT) já processados dentro da janela
+    _Sequencia = 0
+    _Eventos = deque(maxlen=2000) # (Sequencia, Mudancas)
+    _UltimoAcesso = 0.0
+
+    @staticmethod
+    def _Garantir():
+        """Registra o acesso e sobe a thread de consulta se ela não estiver rodando."""
+        MonitorStatusAwbService._UltimoAcesso = time.monotonic()
+        if MonitorStatusAwbService._Thread is not None and MonitorStatusAwbService._Thread.is_alive():
+            return
+        with MonitorStatusAwbService._Trava:
+            if MonitorStatusAwbService._Thread is None or not MonitorStatusAwbService._Thread.is_alive():
+                MonitorStatusAwbService._Thread = threading.Thread(
+                    target=MonitorStatusAwbService._Executar, name='MonitorStatusAwb', daemon=True
+                )
+                MonitorStatusAwbService._Thread.start()
+                LogService.Info("MonitorStatusAwbService", "Monitor de status de AWB iniciado.")
+
+    @staticmethod
+    def _Executar():
+        Intervalo = ConfiguracaoAtual.MONITOR_AWB_INTERVALO
+        while time.monotonic() - MonitorStatusAwbService._UltimoAcesso < ConfiguracaoAtual.MONITOR_AWB_OCIOSO:
+            try:
+                MonitorStatusAwbService._Consultar()
+            except Exception as e:
+                LogService.Error("MonitorStatusAwbService", "Erro ao consultar novos status de AWB", e)
+            time.sleep(Intervalo)
+        LogService.Info("MonitorStatusAwbService", "Monitor de status de AWB parado (nenhum painel conectado).")
+
+    @staticmethod
+    def _Consultar():
+        Sessao = ObterSessaoSqlServer()
+        try:
+            Janela = timedelta(seconds=ConfiguracaoAtual.MONITOR_AWB_JANELA)
+            if MonitorStatusAwbService._MarcaDagua is None:
+                # Primeira consulta: só posiciona a marca d'água (e marca a janela como vista),
+                # os painéis já carregaram a lista
+                MarcaDagua = Sessao.query(func.max(AwbStatus.DATA_INSERT)).scalar() or datetime.now()
+                Linhas = Sessao.query(AwbStatus.CODAWB, AwbStatus.DATA_INSERT)\
+                    .filter(AwbStatus.DATA_INSERT >= MarcaDagua - Janela).all()
+                MonitorStatusAwbService._Vistos = {(l.CODAWB, l.DATA_INSERT) for l in Linhas}
+                MonitorStatusAwbService._MarcaDagua = MarcaDagua
+                return
+
+            Linhas = Sessao.query(AwbStatus.CODAWB, AwbStatus.DATA_INSERT)\
+                .filter(AwbStatus.DATA_INSERT >= MonitorStatusAwbService._MarcaDagua - Janela).all()
+            Novos = [l for l in Linhas if (l.CODAWB, l.DATA_INSERT) not in MonitorStatusAwbService._Vistos]
+
+            # A janela acompanha a marca d'água: o que saiu dela não será relido
+            MarcaDagua = max([MonitorStatusAwbService._MarcaDagua] + [l.DATA_INSERT for l in Linhas])
+            MonitorStatusAwbService._Vistos = {
+                (l.CODAWB, l.DATA_INSERT) for l in Linhas if l.DATA_INSERT >= MarcaDagua - Janela
+            }
+            MonitorStatusAwbService._MarcaDagua = MarcaDagua
+            if not Novos:
+                return
+
+            # Status inserido fora de ordem não pode sobrescrever um mais recente: relê o último de cada AWB
+            Ultimos = AcompanhamentoService.BuscarUltimosStatus(Sessao, list({n.CODAWB for n in Novos}))
+            Mudancas = [{
+                'Numero': Numero,
+                'Status': d['Status'],
+                'DataStatus': d['Data'].strftime('%d/%m %H:%M') if d['Data'] else '',
+                'Voo': d['Voo'] or ''
+            } for Numero, d in Ultimos.items()]
+
+            with MonitorStatusAwbService._Trava:
+                MonitorStatusAwbService._Sequencia += 1
+                MonitorStatusAwbService._Eventos.append((MonitorStatusAwbService._Sequencia, Mudancas))
+            LogService.Debug("MonitorStatusAwbService", f"{len(Mudancas)} AWB(s) com status novo (sequência {MonitorStatusAwbService._Sequencia}).")
+        finally:
+            Sessao.close()
+
+    @staticmethod
+    def MontarEventos(UltimoId):
+        """
+        Texto text/event-stream com as mudanças posteriores a 'UltimoId' (Last-Event-ID do EventSource).
+        Sem id (primeira conexão) só informa a posição atual. Pede a recarga completa da lista se o id
+        é de outra instância (processo reiniciado), está à frente da sequência atual, ou se o painel
+        ficou tanto tempo fora que o buffer já descartou eventos.
+        'retry' define em quantos ms o EventSource reconecta para buscar as próximas.
+        """
+        MonitorStatusAwbService._Garantir()
+        Retry = ConfiguracaoAtual.MONITOR_AWB_INTERVALO * 1000
+
+        with MonitorStatusAwbService._Trava:
+            Atual = MonitorStatusAwbService._Sequencia
+            Eventos = list(MonitorStatusAwbService._Eventos)
+        IdAtual = f"{MonitorStatusAwbService._Instancia}.{Atual}"
+
+        if not UltimoId:
+            return f"retry: {Retry}\nid: {IdAtual}\nevent: inicio\ndata: {{}}\n\n"
+
+        Instancia, _, Sequencia = UltimoId.partition('.')
+        UltimaSequencia = int(Sequencia) if Sequencia.isdigit() else None
+        if (Instancia != MonitorStatusAwbService._Instancia or UltimaSequencia is None or UltimaSequencia > Atual
+                or (UltimaSequencia < Atual and (not Eventos or Eventos[0][0] > UltimaSequencia + 1))):
+            return f"retry: {Retry}\nid: {IdAtual}\nevent: recarregar\ndata: {{}}\n\n"
+
+        Mudancas = {}
+        for Sequencia, Lista in Eventos:
+            if Sequencia > UltimaSequencia:
+                for Item in Lista:
+                    Mudancas[Item['Numero']] = Item # Vale o mais recente de cada AWB
+
+        Texto = f"retry: {Retry}\nid: {IdAtual}\n"
+        if Mudancas:
+            Texto += f"event: status\ndata: {json.dumps(list(Mudancas.values()), ensure_ascii=False)}\n"
+        else:
+            Texto += "event: ping\ndata: {}\n"
+        return Texto + "\n"
@@ -2,7 +2,7 @@ from functools import wraps
 from flask import request, abort, flash, redirect, url_for
 from flask_login import current_user
 from sqlalchemy import or_
-from Conexoes import ObterSessaoSqlServer
+from Conexoes import ObterSessaoSqlServer, ObterSessaoRequisicao
 from Models.SQL_SERVER.Permissoes import Tb_PLN_Permissao, Tb_PLN_PermissaoGrupo, Tb_PLN_PermissaoUsuario, Tb_PLN_LogAcesso
 from Services.LogService import LogService
 
@@ -22,7 +22,7 @@ class PermissaoService:
         if getattr(Usuario, 'Grupo', '') == 'ADM_SISTEMA': 
             return True
 
-        Sessao = ObterSessaoSqlServer()
+        Sessao = ObterSessaoRequisicao()
         TemPermissao = False
         
         try:
@@ -96,7 +96,7 @@ class PermissaoService:
     @staticmethod
     def ObterCategoriaPermissao(ChavePermissao):
         """Busca o nome da categoria apenas para exibir no erro"""
-        Sessao = ObterSessaoSqlServer()
+        Sessao = ObterSessaoRequisicao()
         Categoria = "Geral"
         try:
             Perm = Sessao.query(Tb_PLN_Permissao).filter_by(Chave_Permissao=ChavePermissao).first()
@@ -1,7 +1,10 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, TimeoutError as FuturoTimeout
 from datetime import datetime, date, time, timedelta
 from decimal import Decimal
 from sqlalchemy import desc, func, text
-from Conexoes import ObterSessaoSqlServer, ObterSessaoSqlServer
+from Conexoes import ObterSessaoSqlServer, ObterSessaoRequisicao
+from Configuracoes import ConfiguracaoAtual
 from Models.SQL_SERVER.Ctc import CtcEsp, CtcEspCpl
 from Models.SQL_SERVER.Planejamento import PlanejamentoCabecalho, PlanejamentoItem, PlanejamentoTrecho
 from Models.SQL_SERVER.TabelaFrete import TabelaFrete, RemessaFrete
@@ -9,6 +12,7 @@ from Models.SQL_SERVER.Aeroporto import Aeroporto, RemessaAeroportos
 from Models.SQL_SERVER.Cidade import Cidade, RemessaCidade
 from Models.SQL_SERVER.MalhaAerea import VooMalha , RemessaMalha
 from Services.LogService import LogService 
+from Services.Logic.StatusPlanejamentoService import StatusPlanejamentoService, ChavePlanejamento
 
 class PlanejamentoService:
     """
@@ -86,23 +90,9 @@ class PlanejamentoService:
     """
 
     @staticmethod
-    def _ObterMapaCache():
-        """Helper para buscar o cache de planejamentos existentes."""
-        SessaoPln = ObterSessaoSqlServer()
-        mapa = {}
-        if SessaoPln:
-            try:
-                rows = SessaoPln.query(
-                    PlanejamentoItem.Filial, PlanejamentoItem.Serie, PlanejamentoItem.Ctc,
-                    PlanejamentoCabecalho.Status, PlanejamentoCabecalho.IdPlanejamento
-                ).join(PlanejamentoCabecalho, PlanejamentoItem.IdPlanejamento == PlanejamentoCabecalho.IdPlanejamento).all()
-                
-                for r in rows:
-                    k = f"{str(r.Filial).strip()}-{str(r.Serie).strip()}-{str(r.Ctc).strip()}"
-                    mapa[k] = {'status': r.Status, 'id_plan': r.IdPlanejamento}
-            except: pass
-            finally: SessaoPln.close()
-        return mapa
+    def _ObterMapaCache(Rows):
+        """Status de planejamento só dos CTCs retornados (chave 'filial-serie-ctc')."""
+        return StatusPlanejamentoService.BuscarPorDocumentos((r.Filial, r.Serie, r.CTC) for r in Rows)
 
     @staticmethod
     def _SerializarResultados(ResultadoSQL, NomeBloco, MapaCache):
@@ -133,13 +123,14 @@ class PlanejamentoService:
             if qtd_notas == 0 and to_int(row.Volumes) > 0: qtd_notas = 1
 
             # Cache Planejamento
-            chave = f"{to_str(row.Filial)}-{to_str(row.Serie)}-{to_str(row.CTC)}"
+            chave = ChavePlanejamento(row.Filial, row.Serie, row.CTC)
             info = MapaCache.get(chave)
             
             
             #print(f"Cabeçalho Row: {row} | Chave: {chave} | Info Cache: {info}")  # Log de debug para verificar a chave e o cache
             Lista.append({
                 'id_unico': f"{to_str(row.Filial)}-{to_str(row.CTC)}",
+                'chave': chave, # filial-serie-ctc: identifica o CTC nas diferenças entre versões da fila
                 'origem_dados': NomeBloco,  # <--- IMPORTANTE: DIARIO, REVERSA ou BACKLOG
                 'filial': to_str(row.Filial),
                 'ctc': to_str(row.CTC),
@@ -177,106 +168,206 @@ class PlanejamentoService:
     # -------------------------------------------------------------------------
     # BLOCO 1: DIÁRIO
     # -------------------------------------------------------------------------
+    @staticmethod
+    def _ConsultaDiario():
+        # --- ALTERAÇÃO AQUI: Pegando a data de ontem ---
+        Hoje = date.today() #- timedelta(days=1)
+        
+        # Filtro Específico
+        # Alterado de >= para = para pegar apenas o dia de ontem
+        FiltroSQL = """
+            AND c.motivodoc IN ('REE', 'ENT', 'NOR') 
+            AND c.data = :data_alvo
+        """
+        return text(PlanejamentoService._QueryBase + FiltroSQL + " ORDER BY c.data DESC, c.hora DESC"), {'data_alvo': Hoje}
+
     @staticmethod
     def BuscarCtcsDiario(mapa_cache=None):
-        Sessao = ObterSessaoSqlServer()
         try:
-            if not mapa_cache: mapa_cache = PlanejamentoService._ObterMapaCache()
-            
-            # --- ALTERAÇÃO AQUI: Pegando a data de ontem ---
-            Hoje = date.today() #- timedelta(days=1)
-            
-            # Filtro Específico
-            # Alterado de >= para = para pegar apenas o dia de ontem
-            FiltroSQL = """
-                AND c.motivodoc IN ('REE', 'ENT', 'NOR') 
-                AND c.data = :data_alvo
-            """
-            
-            Query = text(PlanejamentoService._QueryBase + FiltroSQL + " ORDER BY c.data DESC, c.hora DESC")
-            Rows = Sessao.execute(Query, {'data_alvo': Hoje}).fetchall()
-            
-            return PlanejamentoService._SerializarResultados(Rows, "DIARIO", mapa_cache)
+            return PlanejamentoService._BuscarBloco('DIARIO', mapa_cache)
         except Exception as e:
             LogService.Error("PlanejamentoService", "Erro Buscar Diario", e)
             return []
-        finally: Sessao.close()
 
     # -------------------------------------------------------------------------
     # BLOCO 2: REVERSA
     # -------------------------------------------------------------------------
+    @staticmethod
+    def _ConsultaReversa():
+        # Filtro Específico: Motivo DEV + Tabela Reversa Liberada
+        FiltroSQL = """
+            AND c.motivodoc = 'DEV' 
+            AND rev.LiberadoPlanejamento = 1
+        """
+        return text(PlanejamentoService._QueryBase + FiltroSQL + " ORDER BY c.data DESC"), {}
+
     @staticmethod
     def BuscarCtcsReversa(mapa_cache=None):
-        Sessao = ObterSessaoSqlServer()
         try:
-            if not mapa_cache: mapa_cache = PlanejamentoService._ObterMapaCache()
-            
-            # Filtro Específico: Motivo DEV + Tabela Reversa Liberada
-            FiltroSQL = """
-                AND c.motivodoc = 'DEV' 
-                AND rev.LiberadoPlanejamento = 1
-            """
-            
-            Query = text(PlanejamentoService._QueryBase + FiltroSQL + " ORDER BY c.data DESC")
-            Rows = Sessao.execute(Query).fetchall()
-            
-            return PlanejamentoService._SerializarResultados(Rows, "REVERSA", mapa_cache)
+            return PlanejamentoService._BuscarBloco('REVERSA', mapa_cache)
         except Exception as e:
             LogService.Error("PlanejamentoService", "Erro Buscar Reversa", e)
             return []
-        finally: Sessao.close()
 
     # -------------------------------------------------------------------------
     # BLOCO 3: BACKLOG
     # -------------------------------------------------------------------------
+    @staticmethod
+    def _ConsultaBacklog():
+        Hoje = date.today()
+        Corte = Hoje - timedelta(days=120)
+        
+        # Filtro Específico: Anterior a hoje, maior que corte, REE/ENT
+        FiltroSQL = """
+            AND c.motivodoc IN ('REE', 'ENT')
+            AND c.data < :data_hoje 
+            AND c.data >= :data_corte
+        """
+        # Backlog ordena pelos mais velhos
+        return text(PlanejamentoService._QueryBase + FiltroSQL + " ORDER BY c.data ASC"), {'data_hoje': Hoje, 'data_corte': Corte}
+
     @staticmethod
     def BuscarCtcsBacklog(mapa_cache=None):
-        Sessao = ObterSessaoSqlServer()
         try:
-            if not mapa_cache: mapa_cache = PlanejamentoService._ObterMapaCache()
-            
-            Hoje = date.today()
-            Corte = Hoje - timedelta(days=120)
-            
-            # Filtro Específico: Anterior a hoje, maior que corte, REE/ENT
-            FiltroSQL = """
-                AND c.motivodoc IN ('REE', 'ENT')
-                AND c.data < :data_hoje 
-                AND c.data >= :data_corte
-            """
-            
-            Query = text(PlanejamentoService._QueryBase + FiltroSQL + " ORDER BY c.data ASC") # Backlog ordena pelos mais velhos
-            Rows = Sessao.execute(Query, {'data_hoje': Hoje, 'data_corte': Corte}).fetchall()
-            
-            return PlanejamentoService._SerializarResultados(Rows, "BACKLOG", mapa_cache)
+            return PlanejamentoService._BuscarBloco('BACKLOG', mapa_cache)
         except Exception as e:
             LogService.Error("PlanejamentoService", "Erro Buscar Backlog", e)
             return []
-        finally: Sessao.close()
+
+    # -------------------------------------------------------------------------
+    # EXECUÇÃO DOS BLOCOS
+    # -------------------------------------------------------------------------
+    # Ordem de exibição na fila unificada
+    BLOCOS = ('DIARIO', 'REVERSA', 'BACKLOG')
+
+    _Executor = None
+    _TravaExecutor = threading.Lock()
+
+    @staticmethod
+    def _ObterExecutor():
+        """Pool compartilhado e limitado: N usuários atualizando a fila não abrem N x 4 conexões."""
+        if PlanejamentoService._Executor is None:
+            with PlanejamentoService._TravaExecutor:
+                if PlanejamentoService._Executor is None:
+                    PlanejamentoService._Executor = ThreadPoolExecutor(
+                        max_workers=ConfiguracaoAtual.PLANEJAMENTO_WORKERS,
+                        thread_name_prefix='PlanejamentoBloco'
+                    )
+        return PlanejamentoService._Executor
+
+    @staticmethod
+    def _ConsultarBloco(NomeBloco):
+        """
+        Executa a query do bloco numa sessão própria (cada thread do pool usa sua conexão).
+        No pyodbc o tempo limite da consulta é aplicado na própria conexão, para que o banco
+        cancele a query em vez de a thread seguir presa depois que a fila desistiu dela.
+        """
+        Query, Parametros = {
+            'DIARIO': PlanejamentoService._ConsultaDiario,
+            'REVERSA': PlanejamentoService._ConsultaReversa,
+            'BACKLOG': PlanejamentoService._ConsultaBacklog
+        }[NomeBloco]()
+
+        Sessao = ObterSessaoSqlServer()
+        try:
+            ConexaoDbapi = Sessao.connection().connection.dbapi_connection
+            TimeoutAnterior = getattr(ConexaoDbapi, 'timeout', None)
+            if TimeoutAnterior is not None:
+                ConexaoDbapi.timeout = ConfiguracaoAtual.PLANEJAMENTO_TIMEOUT_BLOCO
+            try:
+                return Sessao.execute(Query, Parametros).fetchall()
+            finally:
+                # A conexão volta ao pool: não deixa o limite do planejamento para o próximo uso
+                if TimeoutAnterior is not None:
+                    ConexaoDbapi.timeout = TimeoutAnterior
+        finally:
+            Sessao.close()
+
+    @staticmethod
+    def _BuscarBloco(NomeBloco, mapa_cache=None):
+        Rows = PlanejamentoService._ConsultarBloco(NomeBloco)
+        if not mapa_cache: mapa_cache = PlanejamentoService._ObterMapaCache(Rows)
+        return PlanejamentoService._SerializarResultados(Rows, NomeBloco, mapa_cache)
+
+    @staticmethod
+    def _Cronometrar(Funcao, *Args):
+        """Roda a função no pool devolvendo (resultado, segundos gastos na thread)."""
+        Inicio = datetime.now()
+        Resultado = Funcao(*Args)
+        return Resultado, (datetime.now() - Inicio).total_seconds()
 
     # -------------------------------------------------------------------------
     # VISÃO GLOBAL (Chamada pela API Principal)
     # -------------------------------------------------------------------------
     @staticmethod
-    def BuscarCtcsPlanejamento():
+    def BuscarFilaPlanejamento():
         """
-        Executa as 3 buscas e consolida o resultado.
+        Executa as 3 buscas em paralelo, cada uma com sua conexão, e consolida o resultado.
+        O tempo total passa a ser o do bloco mais lento, não a soma. O status de planejamento
+        é buscado depois, só para os CTCs retornados.
+        Retorna {'ctcs': [...], 'blocos': {BLOCO: {'qtd', 'tempo_ms', 'erro'}}, 'parcial': bool}:
+        um bloco que falha ou estoura PLANEJAMENTO_TIMEOUT_BLOCO volta vazio com 'erro' preenchido,
+        e os demais são entregues normalmente.
         """
-        LogService.Debug("PlanejamentoService", "Iniciando busca GLOBAL (3 Blocos)...")
-        
-        # 1. Busca Cache uma única vez
-        Cache = PlanejamentoService._ObterMapaCache()
-        
-        # 2. Busca os Blocos
-        ListaDiario = PlanejamentoService.BuscarCtcsDiario(Cache)
-        ListaReversa = PlanejamentoService.BuscarCtcsReversa(Cache)
-        ListaBacklog = PlanejamentoService.BuscarCtcsBacklog(Cache)
-        
-        Total = len(ListaDiario) + len(ListaReversa) + len(ListaBacklog)
-        LogService.Info("PlanejamentoService", f"Busca Concluída. Total: {Total} (D:{len(ListaDiario)}, R:{len(ListaReversa)}, B:{len(ListaBacklog)})")
-        
-        # 3. Retorna Unificado
-        return ListaDiario + ListaReversa + ListaBacklog
+        LogService.Debug("PlanejamentoService", "Iniciando busca GLOBAL (3 Blocos em paralelo)...")
+        Inicio = datetime.now()
+        Executor = PlanejamentoService._ObterExecutor()
+
+        Futuros = {
+            Bloco: Executor.submit(PlanejamentoService._Cronometrar, PlanejamentoService._ConsultarBloco, Bloco)
+            for Bloco in PlanejamentoService.BLOCOS
+        }
+
+        # Margem sobre o timeout do banco: cobre a espera por uma thread livre do pool
+        Limite = ConfiguracaoAtual.PLANEJAMENTO_TIMEOUT_BLOCO + 5
+        wait(Futuros.values(), timeout=Limite)
+
+        Resultados = {}
+        Blocos = {}
+        for Bloco, Futuro in Futuros.items():
+            Info = {'qtd': 0, 'tempo_ms': None, 'erro': None}
+            try:
+                Resultados[Bloco], Tempo = Futuro.result(timeout=0)
+                Info['qtd'] = len(Resultados[Bloco])
+                Info['tempo_ms'] = int(Tempo * 1000)
+            except FuturoTimeout:
+                Futuro.cancel()
+                Info['erro'] = 'Tempo limite excedido'
+                LogService.Warning("PlanejamentoService", f"Bloco {Bloco} excedeu {Limite}s e foi entregue vazio.")
+            except Exception as e:
+                Info['erro'] = 'Falha na consulta'
+                LogService.Error("PlanejamentoService", f"Erro Buscar {Bloco}", e)
+            Blocos[Bloco] = Info
+
+        InicioMapa = datetime.now()
+        try:
+            Cache = PlanejamentoService._ObterMapaCache([r for Rows in Resultados.values() for r in Rows])
+            TempoMapa = f"{int((datetime.now() - InicioMapa).total_seconds() * 1000)}ms"
+        except Exception as e:
+            LogService.Warning("PlanejamentoService", f"Mapa de planejamentos indisponível, fila sem status de planejamento: {e}")
+            Cache, TempoMapa = {}, "ERRO"
+
+        Ctcs = []
+        for Bloco, Rows in Resultados.items():
+            Ctcs.extend(PlanejamentoService._SerializarResultados(Rows, Bloco, Cache))
+
+        Total = (datetime.now() - Inicio).total_seconds()
+        Tempos = ", ".join(
+            f"{b[0]}:{i['qtd']} em {i['tempo_ms']}ms" if i['erro'] is None else f"{b[0]}:ERRO"
+            for b, i in Blocos.items()
+        )
+        LogService.Info("PlanejamentoService", f"Busca Concluída. Total: {len(Ctcs)} ({Tempos}; Mapa: {TempoMapa}) em {Total:.2f}s")
+
+        return {
+            'ctcs': Ctcs,
+            'blocos': Blocos,
+            'parcial': any(i['erro'] for i in Blocos.values())
+        }
+
+    @staticmethod
+    def BuscarCtcsPlanejamento():
+        """Lista unificada Diário + Reversa + Backlog (sem os metadados dos blocos)."""
+        return PlanejamentoService.BuscarFilaPlanejamento()['ctcs']
 
     @staticmethod
     def ObterCtcDetalhado(Filial, Serie, Numero):
@@ -284,7 +375,7 @@ class PlanejamentoService:
         Captura detalhes completos do CTC a partir da Filial, Série e Número.
         AGORA COM JOIN NA TABELA COMPLEMENTAR PARA PEGAR O TIPO DE CARGA.
         """
-        Sessao = ObterSessaoSqlServer()
+        Sessao = ObterSessaoRequisicao()
         try:
             f = str(Filial).strip()
             s = str(Serie).strip()
@@ -371,7 +462,7 @@ class PlanejamentoService:
         Busca CTCs do mesmo dia/rota/tipo.
         CORREÇÃO: Agora retorna 'origem_uf' e 'destino_uf' para evitar erro no salvamento.
         """
-        Sessao = ObterSessaoSqlServer()
+        Sessao = ObterSessaoRequisicao()
         try:
             LogService.Debug("PlanejamentoService", f"Busca consolidação (Inc. TM). Rota: {cidade_origem} -> {cidade_destino}")
 
@@ -626,6 +717,7 @@ class PlanejamentoService:
             ).first()
 
             Cabecalho = None
+            ChavesAnteriores = []
             if item_existente:
                 Cabecalho = item_existente.Cabecalho
                 Cabecalho.AeroportoOrigem = aero_origem
@@ -639,6 +731,11 @@ class PlanejamentoService:
                 Cabecalho.TotalPeso = get_val('peso_taxado') 
                 Cabecalho.TotalValor = get_val('valor')
 
+                ChavesAnteriores = [
+                    ChavePlanejamento(i.Filial, i.Serie, i.Ctc) for i in SessaoPG.query(
+                        PlanejamentoItem.Filial, PlanejamentoItem.Serie, PlanejamentoItem.Ctc
+                    ).filter(PlanejamentoItem.IdPlanejamento == Cabecalho.IdPlanejamento).all()
+                ]
                 SessaoPG.query(PlanejamentoTrecho).filter(PlanejamentoTrecho.IdPlanejamento == Cabecalho.IdPlanejamento).delete()
                 SessaoPG.query(PlanejamentoItem).filter(PlanejamentoItem.IdPlanejamento == Cabecalho.IdPlanejamento).delete()
             else:
@@ -757,6 +854,11 @@ class PlanejamentoService:
                     SessaoPG.add(NovoTrecho)
 
             SessaoPG.commit()
+            StatusPlanejamentoService.Registrar(
+                Cabecalho.IdPlanejamento, status_inicial,
+                [ChavePlanejamento(d['filial'], d['serie'], d['ctc']) for d in todos_docs],
+                ChavesAnteriores
+            )
             LogService.Info("PlanejamentoService", f"Planejamento gravado com sucesso! ID: {Cabecalho.IdPlanejamento}")
             return Cabecalho.IdPlanejamento
 
@@ -0,0 +1,40 @@
+from time import perf_counter
+from sqlalchemy import insert
+from Configuracoes import ConfiguracaoAtual
+from Services.LogService import LogService
+
+
+class CargaEmLoteService:
+    """
+    Carga em massa compartilhada pelas importações de remessas (Malha, Frete, Cidades, Aeroportos).
+    Usa insert() do Core em executemany, que no SQL Server vira um único envio por lote
+    graças ao fast_executemany do pyodbc (ver Conexoes / SQL_FAST_EXECUTEMANY).
+    """
+
+    @staticmethod
+    def Inserir(Sessao, Modelo, Registros, Origem, TamanhoLote=None, Progresso=None):
+        """
+        Insere a lista de dicionários (chaves = colunas do Modelo) em lotes de 'TamanhoLote'.
+        Roda dentro da transação da Sessao: o commit (ou rollback) fica com quem chamou,
+        assim a remessa e suas linhas continuam sendo gravadas de forma atômica.
+        'Progresso(Fase, Linhas)' (opcional) é chamado a cada lote com o total já enviado.
+        Retorna a quantidade de linhas enviadas.
+        """
+        Total = len(Registros)
+        if not Total:
+            return 0
+
+        Tamanho = TamanhoLote or ConfiguracaoAtual.SQL_BULK_LOTE
+        Tabela = Modelo.__table__
+        Instrucao = insert(Tabela)
+
+        Inicio = perf_counter()
+        for Pos in range(0, Total, Tamanho):
+            Sessao.execute(Instrucao, Registros[Pos:Pos + Tamanho])
+            if Progresso:
+                Progresso(f"Gravando {Tabela.name}", min(Pos + Tamanho, Total))
+        Tempo = perf_counter() - Inicio
+
+        Taxa = Total / Tempo if Tempo > 0 else float(Total)
+        LogService.Info(Origem, f"Carga em lote {Tabela.name}: {Total} linhas em {Tempo:.2f}s ({Taxa:.0f} linhas/s, lotes de {Tamanho}).")
+        return Total
@@ -1,58 +1,49 @@
 from sqlalchemy import distinct, desc
-from Conexoes import ObterSessaoSqlServer
+from Conexoes import ObterSessaoRequisicao
 from Models.SQL_SERVER.Cidade import Cidade, RemessaCidade
 from Models.SQL_SERVER.Aeroporto import Aeroporto, RemessaAeroportos
 from Models.SQL_SERVER.MalhaAerea import VooMalha, RemessaMalha
 # Importação da Model de Ranking (Planejamento)
 from Models.SQL_SERVER.Planejamento import RankingAeroportos 
-from Utils.Geometria import Haversine
+from Utils.Geometria import HaversineVetorizado
 from Utils.Texto import NormalizarTexto
 from Services.LogService import LogService
+from Services.Logic.IndiceAeroportosService import IndiceAeroportosService
+from Services.Logic.IndiceCidadesService import IndiceCidadesService
+from Services.Logic.AtribuicaoAeroportosService import AtribuicaoAeroportosService, FATOR_RANKING_KM, MontarOpcaoEstrategica
 
-# Configuração de Inteligência
-# Quanto maior este número, mais o sistema ignora a distância para priorizar o Ranking.
-# Ex: 3.5 significa que 1 ponto de ranking equivale a percorrer 3.5km a mais para chegar lá.
-FATOR_RANKING_KM = 3.5 
 
 def BuscarCoordenadasCidade(NomeCidade, Uf):
-    Sessao = ObterSessaoSqlServer()
+    """Resolve a cidade no gazetteer residente: nome exato normalizado, senão o primeiro que contém o termo."""
     try:
         if not NomeCidade or not Uf: return None
-        
-        NomeBusca = NormalizarTexto(NomeCidade)
-        UfBusca = NormalizarTexto(Uf)
-        
-        CidadesDoEstado = Sessao.query(Cidade)\
-            .join(RemessaCidade)\
-            .filter(RemessaCidade.Ativo == True) \
-            .filter(Cidade.Uf == UfBusca).all()
-        
-        for c in CidadesDoEstado:
-            NomeBanco = NormalizarTexto(c.NomeCidade)
-            if NomeBanco == NomeBusca or NomeBusca in NomeBanco:
-                return {
-                    'lat': float(c.Latitude) if c.Latitude else 0.0, 
-                    'lon': float(c.Longitude) if c.Longitude else 0.0, 
-                    'nome': c.NomeCidade,
-                    'uf': c.Uf
-                }
-        return None
+        return IndiceCidadesService.ObterIndice().Buscar(NomeCidade, Uf)
     except Exception as e:
         LogService.Error("GeoService", f"Erro ao buscar cidade {NomeCidade}-{Uf}", e)
         return None
-    finally:
-        Sessao.close()
 
 def BuscarAeroportoEstrategico(Latitude, Longitude, UfAlvo):
     """
     Busca o melhor aeroporto baseando-se na Estratégia da Empresa (Ranking) 
     restrito à UF do cliente.
+    Cidades do gazetteer já têm o resultado pré-calculado (AtribuicaoAeroportosService);
+    o cálculo abaixo só roda para coordenadas fora dele e devolve as mesmas chaves
+    (iata, nome, lat, lon, distancia_km, ranking, score, metodo, segunda_opcao).
     """
-    Sessao = ObterSessaoSqlServer()
+    Sessao = ObterSessaoRequisicao()
     try:
         # 1. Normalização da UF para garantir o filtro
         UfFiltro = UfAlvo.upper().strip()
 
+        try:
+            PreCalculado = AtribuicaoAeroportosService.ObterAtribuicao().Buscar(UfFiltro, Latitude, Longitude)
+        except Exception as e:
+            LogService.Error("GeoService", "Atribuição pré-calculada indisponível. Calculando ao vivo.", e)
+            PreCalculado = None
+        if PreCalculado:
+            Vencedor, Segundo = PreCalculado
+            return dict(Vencedor, segunda_opcao=Segundo['iata'] if Segundo else None)
+
         # 2. Busca aeroportos que estão no Ranking E que estão ativos na RemessaAeroportos
         # O filtro RankingAeroportos.Uf garante a restrição estadual solicitada.
         # CORREÇÃO: Ajuste no JOIN de RemessaAeroportos (Aeroporto.IdRemessa == RemessaAeroportos.Id)
@@ -68,16 +59,21 @@ def BuscarAeroportoEstrategico(Latitude, Longitude, UfAlvo):
          .filter(RemessaAeroportos.Ativo == True)\
          .all()
 
-        MelhorOpcao = None
-        MenorScore = float('inf') # Quanto menor o score, melhor (Score = Custo/Esforço)
+        MelhorOpcao = None # Quanto menor o score, melhor (Score = Custo/Esforço)
+        SegundaOpcao = None
 
         # Lista para log de decisão (Debug)
         LogDecisao = []
 
         if CandidatosEstrategicos:
             # CENÁRIO A: Temos aeroportos rankeados nesta UF. Vamos competir Distância vs Ranking.
-            for Cand in CandidatosEstrategicos:
-                DistanciaReal = Haversine(Latitude, Longitude, float(Cand.Latitude), float(Cand.Longitude))
+            # Distâncias de todos os candidatos numa única operação vetorizada
+            Distancias = HaversineVetorizado(
+                Latitude, Longitude,
+                [Cand.Latitude for Cand in CandidatosEstrategicos],
+                [Cand.Longitude for Cand in CandidatosEstrategicos]
+            )
+            for Cand, DistanciaReal in zip(CandidatosEstrategicos, Distancias.tolist()):
                 
                 # FÓRMULA DE DECISÃO:
                 # O Ranking atua como um "redutor de distância percebida".
@@ -87,46 +83,41 @@ def BuscarAeroportoEstrategico(Latitude, Longitude, UfAlvo):
 
                 LogDecisao.append(f"{Cand.CodigoIata}: Dist={DistanciaReal:.1f}km, Rank={Cand.IndiceImportancia}, Score={ScoreCalculado:.1f}")
 
-                if ScoreCalculado < MenorScore:
-                    MenorScore = ScoreCalculado
-                    MelhorOpcao = {
-                        'iata': Cand.CodigoIata,
-                        'nome': Cand.NomeAeroporto,
-                        'lat': float(Cand.Latitude),
-                        'lon': float(Cand.Longitude),
-                        'distancia_km': round(DistanciaReal, 1),
-                        'ranking': Cand.IndiceImportancia,
-                        'metodo': 'Estrategico (Ranking)'
-                    }
+                # Vencedor e segundo colocado, como no pré-cálculo (no empate fica o primeiro)
+                Opcao = (ScoreCalculado, Cand, DistanciaReal)
+                if MelhorOpcao is None or ScoreCalculado < MelhorOpcao[0]:
+                    MelhorOpcao, SegundaOpcao = Opcao, MelhorOpcao
+                elif SegundaOpcao is None or ScoreCalculado < SegundaOpcao[0]:
+                    SegundaOpcao = Opcao
             
             LogService.Debug("GeoService", f"Analise Estrategica UF {UfFiltro}: { ' | '.join(LogDecisao) }")
+            if MelhorOpcao:
+                Score, Cand, DistanciaReal = MelhorOpcao
+                MelhorOpcao = dict(
+                    MontarOpcaoEstrategica(Cand, DistanciaReal, Score),
+                    segunda_opcao=SegundaOpcao[1].CodigoIata if SegundaOpcao else None
+                )
 
         else:
             # CENÁRIO B: A UF não tem aeroportos na tabela de Ranking (ou nenhum ativo).
             # Fallback: Busca o mais próximo geograficamente DENTRO DA UF, sem ponderar ranking.
+            # A UF vem do NomeRegiao: o filtro de país evita regiões homônimas no exterior.
             LogService.Info("GeoService", f"Nenhum aeroporto rankeado em {UfFiltro}. Usando proximidade simples.")
             
-            AeroportosDaUf = Sessao.query(Aeroporto)\
-                .join(RemessaAeroportos, Aeroporto.IdRemessa == RemessaAeroportos.Id)\
-                .filter(RemessaAeroportos.Ativo == True)\
-                .filter(Aeroporto.Uf == UfFiltro)\
-                .all()
-            
-            MenorDistancia = float('inf')
-            
-            for Aero in AeroportosDaUf:
-                Dist = Haversine(Latitude, Longitude, float(Aero.Latitude), float(Aero.Longitude))
-                if Dist < MenorDistancia:
-                    MenorDistancia = Dist
-                    MelhorOpcao = {
-                        'iata': Aero.CodigoIata,
-                        'nome': Aero.NomeAeroporto,
-                        'lat': float(Aero.Latitude),
-                        'lon': float(Aero.Longitude),
-                        'distancia_km': round(Dist, 1),
-                        'ranking': 0,
-                        'metodo': 'Proximidade (Fallback UF)'
-                    }
+            MaisProximo = IndiceAeroportosService.ObterIndice().MaisProximos(Latitude, Longitude, K=1, Uf=UfFiltro, Pais='BR')
+            if MaisProximo:
+                Aero = MaisProximo[0]
+                MelhorOpcao = {
+                    'iata': Aero['iata'],
+                    'nome': Aero['nome'],
+                    'lat': Aero['lat'],
+                    'lon': Aero['lon'],
+                    'distancia_km': round(Aero['distancia'], 1),
+                    'ranking': 0,
+                    'score': round(Aero['distancia'], 1), # Sem ranking: o score é a própria distância
+                    'metodo': 'Proximidade (Fallback UF)',
+                    'segunda_opcao': None
+                }
 
         return MelhorOpcao
 
@@ -139,32 +130,12 @@ def BuscarAeroportoEstrategico(Latitude, Longitude, UfAlvo):
 # Manter métodos auxiliares legados caso outras partes do sistema ainda usem, 
 # mas o Planejamento deve chamar o BuscarAeroportoEstrategico acima.
 def BuscarTopAeroportos(lat_cidade, lon_cidade, limite=2):
-    Sessao = ObterSessaoSqlServer()
+    """Os 'limite' aeroportos ativos mais próximos do ponto, consultados no índice espacial residente."""
     try:
-        aeroportos = Sessao.query(Aeroporto)\
-            .join(RemessaAeroportos, Aeroporto.IdRemessa == RemessaAeroportos.Id)\
-            .filter(
-                RemessaAeroportos.Ativo == True,
-                Aeroporto.Latitude != None,
-                Aeroporto.Longitude != None
-            ).all()
-        
-        lista_distancias = []
-        for aero in aeroportos:
-            dist = Haversine(lat_cidade, lon_cidade, float(aero.Latitude), float(aero.Longitude))
-            lista_distancias.append({
-                'iata': aero.CodigoIata,
-                'nome': aero.NomeAeroporto,
-                'lat': float(aero.Latitude),
-                'lon': float(aero.Longitude),
-                'distancia': dist
-            })
-
-        lista_distancias.sort(key=lambda x: x['distancia'])
-        return lista_distancias[:limite]
-
+        return [
+            {k: Aero[k] for k in ('iata', 'nome', 'lat', 'lon', 'distancia')}
+            for Aero in IndiceAeroportosService.ObterIndice().MaisProximos(lat_cidade, lon_cidade, K=limite)
+        ]
     except Exception as e:
         LogService.Error("GeoService", "Erro ao buscar Top Aeroportos", e)
         return []
-    finally:
-        Sessao.close()
\ No newline at end of file
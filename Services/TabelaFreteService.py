@@ -1,11 +1,49 @@
 import os
+import threading
 import pandas as pd
-from datetime import datetime
-from sqlalchemy import desc, func, text
-from Conexoes import ObterSessaoSqlServer
+from datetime import datetime, timedelta
+from sqlalchemy import desc, text
+from Conexoes import ObterSessaoSqlServer, ObterSessaoRequisicao
 from Models.SQL_SERVER.TabelaFrete import RemessaFrete, TabelaFrete
 from Configuracoes import ConfiguracaoBase
 from Services.LogService import LogService
+from Services.Shared.CargaEmLoteService import CargaEmLoteService
+from Utils.Snapshot import SalvarUpload
+
+class MatrizTarifas:
+    """
+    Tarifas das remessas ativas em memória, por trecho normalizado (origem, destino).
+    Para cada trecho guarda a tarifa mais barata por Cia, a mais barata de qualquer Cia
+    e a primeira linha com tarifa NULL (trecho bloqueado), espelhando as três estratégias do banco.
+    """
+
+    def __init__(self, Linhas, Assinatura):
+        self.Assinatura = Assinatura
+        self.CarregadaEm = datetime.now()
+        self.PorCia = {}
+        self.Melhor = {}
+        self.Bloqueio = {}
+
+        for Origem, Destino, Cia, Servico, Tarifa in Linhas:
+            Chave = (Origem, Destino)
+            if Tarifa is None:
+                self.Bloqueio.setdefault(Chave, (Servico, Cia))
+                continue
+            Item = (float(Tarifa), Servico, Cia)
+            PorCia = self.PorCia.setdefault(Chave, {})
+            if Cia not in PorCia or Item[0] < PorCia[Cia][0]:
+                PorCia[Cia] = Item
+            if Chave not in self.Melhor or Item[0] < self.Melhor[Chave][0]:
+                self.Melhor[Chave] = Item
+
+        self.TotalTarifas = sum(len(v) for v in self.PorCia.values())
+
+    def BuscarPorCia(self, Origem, Destino, CiaNormalizada):
+        """Mais barata da Cia (chave normalizada). Sem Cia informada, vale a mais barata do trecho."""
+        if not CiaNormalizada:
+            return self.Melhor.get((Origem, Destino))
+        return self.PorCia.get((Origem, Destino), {}).get(CiaNormalizada)
+
 
 class TabelaFreteService:
     DIR_TEMP = ConfiguracaoBase.DIR_TEMP
@@ -13,6 +51,12 @@ class TabelaFreteService:
     # Penalidade mantida apenas como referência, não retornada visualmente
     PENALIDADE_TARIFA_MISSING = 15000.0
 
+    # Matriz residente de tarifas (uma por processo)
+    _Matriz = None
+    _TravaMatriz = threading.Lock()
+    # De quanto em quanto tempo confere se outro processo mudou as remessas ativas
+    VALIDADE_ASSINATURA = timedelta(seconds=60)
+
     @staticmethod
     def _GarantirDiretorio():
         if not os.path.exists(TabelaFreteService.DIR_TEMP):
@@ -57,6 +101,7 @@ class TabelaFreteService:
             if Remessa:
                 Sessao.delete(Remessa)
                 Sessao.commit()
+                TabelaFreteService.InvalidarMatriz()
                 return True, "Tabela excluída com sucesso."
             return False, "Registro não encontrado."
         except Exception as e:
@@ -66,14 +111,33 @@ class TabelaFreteService:
             Sessao.close()
 
     @staticmethod
-    def ProcessarArquivo(arquivo, usuario):
+    def SalvarArquivoTemp(arquivo):
+        """Grava o upload na pasta temporária (antes de enfileirar o processamento)."""
         TabelaFreteService._GarantirDiretorio()
-        Caminho = os.path.join(TabelaFreteService.DIR_TEMP, arquivo.filename)
+        return SalvarUpload(arquivo, TabelaFreteService.DIR_TEMP)
+
+    @staticmethod
+    def ProcessarArquivo(arquivo, usuario):
+        """Processamento síncrono de um upload (a tela usa o ImportacaoJobService)."""
+        try:
+            Caminho = TabelaFreteService.SalvarArquivoTemp(arquivo)
+        except Exception as e:
+            LogService.Error("TabelaFreteService", "Erro ao salvar arquivo", e)
+            return False, f"Erro técnico: {str(e)}"
+        return TabelaFreteService.ProcessarArquivoSalvo(Caminho, arquivo.filename, usuario)
+
+    @staticmethod
+    def ProcessarArquivoSalvo(Caminho, nome_arquivo, usuario, Progresso=None):
+        """
+        Lê a planilha de tarifas já gravada em 'Caminho' e cria uma nova remessa.
+        'Progresso(Fase, Linhas=None)' é informado pelo ImportacaoJobService.
+        """
+        Progresso = Progresso or (lambda Fase, Linhas=None: None)
         Sessao = ObterSessaoSqlServer()
         
         try:
-            arquivo.save(Caminho)
-            LogService.Info("TabelaFreteService", f"Analisando arquivo: {arquivo.filename}")
+            Progresso("Lendo arquivo")
+            LogService.Info("TabelaFreteService", f"Analisando arquivo: {nome_arquivo}")
             
             DfRaw = None
             with pd.ExcelFile(Caminho, engine='openpyxl') as XlsFile:
@@ -104,13 +168,14 @@ class TabelaFreteService:
 
             NovaRemessa = RemessaFrete(
                 DataReferencia=datetime.now().date(),
-                NomeArquivoOriginal=arquivo.filename,
+                NomeArquivoOriginal=nome_arquivo,
                 UsuarioResponsavel=usuario,
                 Ativo=True
             )
             Sessao.add(NovaRemessa)
             Sessao.flush()
 
+            Progresso("Convertendo tarifas")
             ListaInsert = []
             for i in range(RowHeaderIdx + 1, len(DfRaw)):
                 Row = DfRaw.iloc[i]
@@ -127,17 +192,22 @@ class TabelaFreteService:
                             CiaBruta = NomeServico.split(' ')[0].upper()
                             CiaNormalizada = TabelaFreteService._NormalizarNomeCia(CiaBruta)
 
-                            ListaInsert.append(TabelaFrete(
-                                IdRemessa=NovaRemessa.Id,
-                                Origem=Origem,
-                                Destino=RowDestino,
-                                CiaAerea=CiaNormalizada, 
-                                Servico=NomeServico,
-                                Tarifa=ValorTarifa
-                            ))
+                            ListaInsert.append({
+                                'IdRemessa': NovaRemessa.Id,
+                                'Origem': Origem,
+                                'Destino': RowDestino,
+                                'CiaAerea': CiaNormalizada,
+                                'Servico': NomeServico,
+                                'Tarifa': ValorTarifa,
+                                'OrigemChave': Origem.strip().upper(),
+                                'DestinoChave': RowDestino.strip().upper(),
+                                'CiaChave': CiaNormalizada.strip().upper()
+                            })
 
-            Sessao.bulk_save_objects(ListaInsert)
+            CargaEmLoteService.Inserir(Sessao, TabelaFrete, ListaInsert, "TabelaFreteService", Progresso=Progresso)
             Sessao.commit()
+            Progresso("Atualizando matriz de tarifas", len(ListaInsert))
+            TabelaFreteService.ReconstruirMatriz()
             return True, f"Sucesso! {len(ListaInsert)} tarifas importadas."
 
         except Exception as e:
@@ -148,26 +218,153 @@ class TabelaFreteService:
             if os.path.exists(Caminho): os.remove(Caminho)
             Sessao.close()
             
+    # --- MATRIZ RESIDENTE ---
+
+    @staticmethod
+    def _ObterAssinatura(Sessao):
+        Ids = Sessao.query(RemessaFrete.Id).filter(RemessaFrete.Ativo == True).order_by(RemessaFrete.Id).all()
+        return tuple(r.Id for r in Ids)
+
+    @staticmethod
+    def _ConstruirMatriz(Sessao, Assinatura):
+        Inicio = datetime.now()
+        Linhas = Sessao.query(
+            TabelaFrete.OrigemChave, TabelaFrete.DestinoChave, TabelaFrete.CiaChave, TabelaFrete.Servico, TabelaFrete.Tarifa
+        ).filter(TabelaFrete.IdRemessa.in_(Assinatura)).all() if Assinatura else []
+
+        Matriz = MatrizTarifas(
+            ((l.OrigemChave, l.DestinoChave, l.CiaChave or '', l.Servico, l.Tarifa) for l in Linhas),
+            Assinatura
+        )
+        Tempo = (datetime.now() - Inicio).total_seconds()
+        LogService.Info("TabelaFreteService", f"Matriz de tarifas construída: {Matriz.TotalTarifas} tarifas, {len(Matriz.Melhor)} trechos em {Tempo:.2f}s (Remessas {Assinatura}).")
+        return Matriz
+
+    @staticmethod
+    def ObterMatriz():
+        """
+        Retorna a matriz das remessas ativas, construindo-a se necessário.
+        A assinatura (Ids das remessas ativas) só é conferida a cada VALIDADE_ASSINATURA,
+        assim a tarifação de uma busca inteira não faz nenhuma consulta ao banco.
+        """
+        Matriz = TabelaFreteService._Matriz
+        if Matriz is not None and datetime.now() - Matriz.CarregadaEm < TabelaFreteService.VALIDADE_ASSINATURA:
+            return Matriz
+
+        with TabelaFreteService._TravaMatriz:
+            Matriz = TabelaFreteService._Matriz
+            if Matriz is not None and datetime.now() - Matriz.CarregadaEm < TabelaFreteService.VALIDADE_ASSINATURA:
+                return Matriz
+
+            Sessao = ObterSessaoSqlServer()
+            try:
+                Assinatura = TabelaFreteService._ObterAssinatura(Sessao)
+                if Matriz is not None and Matriz.Assinatura == Assinatura:
+                    Matriz.CarregadaEm = datetime.now()
+                else:
+                    Matriz = TabelaFreteService._ConstruirMatriz(Sessao, Assinatura)
+                    TabelaFreteService._Matriz = Matriz
+                return Matriz
+            finally:
+                Sessao.close()
+
+    @staticmethod
+    def InvalidarMatriz():
+        """Descarta a matriz atual. A próxima tarifação reconstrói a partir do banco."""
+        with TabelaFreteService._TravaMatriz:
+            TabelaFreteService._Matriz = None
+        LogService.Debug("TabelaFreteService", "Matriz de tarifas invalidada.")
+
+    @staticmethod
+    def ReconstruirMatriz():
+        """Invalida e já reconstrói a matriz (chamado logo após importar uma tabela)."""
+        TabelaFreteService.InvalidarMatriz()
+        try:
+            TabelaFreteService.ObterMatriz()
+        except Exception as e:
+            LogService.Error("TabelaFreteService", "Falha ao reconstruir matriz de tarifas", e)
+
     @staticmethod
     def CalcularCustoEstimado(origem, destino, cia, peso):
         """
-        Estratégia Tripla com Tratamento de NULL (Penalidade Virtual)
+        Estratégia Tripla com Tratamento de NULL (Penalidade Virtual), resolvida na matriz residente:
+        1. Tarifa mais barata da Cia; 2. Mais barata de qualquer Cia; 3. Trecho bloqueado (tarifa NULL).
         """
-        Sessao = ObterSessaoSqlServer()
+        try:
+            Matriz = TabelaFreteService.ObterMatriz()
+        except Exception as e:
+            LogService.Error("TabelaFreteService", "Matriz de tarifas indisponível. Consultando o banco.", e)
+            return TabelaFreteService._CalcularCustoNoBanco(origem, destino, cia, peso)
+
+        try:
+            cia_normalizada = TabelaFreteService._NormalizarNomeCia(cia)
+            origem = origem.strip().upper()
+            destino = destino.strip().upper()
+
+            # --- ESTRATEGIA 1: Match da Cia ---
+            Item = Matriz.BuscarPorCia(origem, destino, cia_normalizada)
+
+            # --- ESTRATEGIA 2: Fallback (Qualquer Cia Válida) ---
+            if Item is None:
+                Item = Matriz.Melhor.get((origem, destino))
+                if Item is not None:
+                    LogService.Warning("TarifaFallback", f"Matriz: Usando tarifa de {Item[2]} para {origem}->{destino}")
+
+            if Item is not None:
+                vl_tarifa, servico, cia_tarifaria = Item
+                return vl_tarifa * float(peso), {
+                    'tarifa_base': vl_tarifa,
+                    'servico': servico,
+                    'cia_tarifaria': cia_tarifaria,
+                    'peso_calculado': float(peso),
+                    'tarifa_missing': False
+                }
+
+            # --- ESTRATEGIA 3: Trecho Bloqueado (Tarifa NULL) ---
+            Bloqueio = Matriz.Bloqueio.get((origem, destino))
+            if Bloqueio is not None:
+                LogService.Warning("TarifaNull", f"Tarifa NULL (Bloqueada) para {origem}->{destino}. Aplicando Penalidade Virtual.")
+                # RETORNA CUSTO ZERO PARA O USUÁRIO, MAS FLAG TRUE PARA O SCORE
+                return 0.0, {
+                    'tarifa_base': 0.0,
+                    'servico': Bloqueio[0],
+                    'cia_tarifaria': Bloqueio[1],
+                    'peso_calculado': float(peso),
+                    'tarifa_missing': True
+                }
+
+            LogService.Error("TarifaFatal", f"Nenhuma tarifa encontrada para {origem}->{destino}")
+            # Retorna 0.0 e marca missing para penalidade
+            return 0.0, {'tarifa_missing': True}
+
+        except Exception as e:
+            LogService.Error("TabelaFreteService", f"Erro crítico calc {origem}->{destino}", e)
+            return 0.0, {'tarifa_missing': True}
+
+    @staticmethod
+    def _CalcularCustoNoBanco(origem, destino, cia, peso):
+        """
+        Estratégia Tripla com Tratamento de NULL (Penalidade Virtual), direto no banco.
+        Usada apenas quando a matriz residente não pôde ser carregada.
+        """
+        Sessao = ObterSessaoRequisicao()
         try:
             cia_normalizada = TabelaFreteService._NormalizarNomeCia(cia)
             origem = origem.strip().upper()
             destino = destino.strip().upper()
 
             # --- ESTRATEGIA 1: ORM Match Exato (Ignorando NULLs) ---
+            # Igualdade nas chaves normalizadas: index seek em IX_PLN_Frete_Chave
             QueryBase = Sessao.query(TabelaFrete).join(RemessaFrete).filter(
                 RemessaFrete.Ativo == True,
-                func.upper(func.trim(TabelaFrete.Origem)) == origem,
-                func.upper(func.trim(TabelaFrete.Destino)) == destino,
+                TabelaFrete.OrigemChave == origem,
+                TabelaFrete.DestinoChave == destino,
                 TabelaFrete.Tarifa != None 
             )
 
-            Item = QueryBase.filter(TabelaFrete.CiaAerea.like(f"%{cia_normalizada}%")).order_by(TabelaFrete.Tarifa.asc()).first()
+            Item = None
+            if cia_normalizada:
+                Item = QueryBase.filter(TabelaFrete.CiaChave == cia_normalizada).order_by(TabelaFrete.Tarifa.asc()).first()
             
             # --- ESTRATEGIA 2: Fallback ORM (Qualquer Cia Válida) ---
             if not Item:
@@ -194,8 +391,8 @@ class TabelaFreteService:
                 FROM intec.dbo.Tb_PLN_Frete F
                 INNER JOIN intec.dbo.Tb_PLN_RemessaFrete RF ON F.IdRemessa = RF.Id
                 WHERE RF.Ativo = 1 
-                  AND RTRIM(LTRIM(F.Origem)) = :origem 
-                  AND RTRIM(LTRIM(F.Destino)) = :destino
+                  AND F.OrigemChave = :origem 
+                  AND F.DestinoChave = :destino
                 -- Ordena: Preços válidos primeiro, NULL por último
                 ORDER BY CASE WHEN F.Tarifa IS NULL THEN 1 ELSE 0 END, F.Tarifa ASC
             """)
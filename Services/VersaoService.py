@@ -1,4 +1,4 @@
-from Conexoes import ObterSessaoSqlServer
+from Conexoes import ObterSessaoSqlServer, ObterSessaoRequisicao
 from Models.SQL_SERVER.VersaoSistema import VersaoSistema
 from sqlalchemy import desc
 from datetime import datetime
@@ -8,7 +8,7 @@ class VersaoService:
     @staticmethod
     def ObterVersaoAtual():
         """Retorna a versão mais recente registrada no banco."""
-        with ObterSessaoSqlServer() as sessao:
+        with ObterSessaoRequisicao() as sessao:
             versao = sessao.query(VersaoSistema).order_by(desc(VersaoSistema.DataLancamento)).first()
             if not versao:
                 return {
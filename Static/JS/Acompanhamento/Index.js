@@ -14,6 +14,7 @@ var canvasRenderer = L.canvas({ padding: 0.5 });
 document.addEventListener('DOMContentLoaded', () => { 
     InitMap(); 
     CarregarDados(); 
+    IniciarStreamStatus();
 });
 
 function GetCorPorCia(texto) {
@@ -111,29 +112,13 @@ function CarregarDados() {
                 const rowId = `row-${awb.CodigoId}`;
                 const corCia = GetCorPorCia(awb.CiaAerea);
 
-                let badgeClass = 'badge-secondary';
-                const status = awb.Status ? awb.Status.toUpperCase() : '';
-
-                const successStatus = ['ENTREGUE', 'CARGA ENTREGUE'];
-                const dangerStatus = ['RETIDA', 'ATRASADO', 'DELAY', 'CANCELADO'];
-                const warningStatus = ['RECEPCAO DOCUMENTAL', 'LIBERADO PELA FISCALIZAÇÃO', 'EM PROCESSO DE LIBERAÇÃO FISCAL'];
-                const infoStatus = ['CARGA ALOCADA', 'EMBARQUE CONFIRMADO', 'AGUARDANDO DESEMBARQUE', 'AGUARDANDO', 'CARGA DESEMBARCADA', 'EMBARQUE SURFACE', 'DESEMBARQUE VÔO', 'EMBARQUE VÔO'];
-
-                if (successStatus.some(s => status.includes(s))) badgeClass = 'badge-success';
-                else if (dangerStatus.some(s => status.includes(s))) badgeClass = 'badge-danger';
-                else if (warningStatus.some(s => status.includes(s))) badgeClass = 'badge-warning';
-                else if (infoStatus.some(s => status.includes(s))) badgeClass = 'badge-info';
-
-                let htmlVoo = '<span style="color:#ccc;">-</span>';
-                if(awb.Voo && awb.Voo.length > 2) {
-                    htmlVoo = `<span class="voo-interativo" title="Duplo clique para detalhes do voo" 
-                               ondblclick="AbrirModalVoo('${awb.Voo}', '${awb.DataStatus}', event)">
-                               <i class="ph-bold ph-airplane-tilt"></i> ${awb.Voo}</span>`;
-                }
+                const badgeClass = GetClasseStatus(awb.Status);
+                const htmlVoo = GetHtmlVoo(awb.Voo, awb.DataStatus);
 
                 let trMain = document.createElement('tr');
                 trMain.className = 'row-main';
                 trMain.id = rowId;
+                trMain.dataset.numero = awb.Numero;
                 trMain.onclick = (e) => { 
                     if(!e.target.closest('.voo-interativo') && !e.target.closest('td[ondblclick]')) {
                         ToggleTree(awb.Numero, rowId); 
@@ -151,10 +136,10 @@ function CarregarDados() {
                     </td>
                     <td><span style="font-weight:600; color:${corCia};">${awb.CiaAerea || 'INDEF'}</span></td>
                     <td><span style="font-weight:700;">${awb.Origem}</span> <i class="ph-bold ph-arrow-right" style="font-size:0.8rem; color:#ccc;"></i> <span style="font-weight:700;">${awb.Destino}</span></td>
-                    <td>${htmlVoo}</td>
+                    <td class="cel-voo">${htmlVoo}</td>
                     <td>${awb.Peso.toFixed(1)} kg</td>
-                    <td><span class="badge ${badgeClass}">${awb.Status}</span></td>
-                    <td style="color:var(--cor-texto-secundario); font-size:0.8rem;">${awb.DataStatus}</td>
+                    <td class="cel-status"><span class="badge ${badgeClass}">${awb.Status}</span></td>
+                    <td class="cel-data-status" style="color:var(--cor-texto-secundario); font-size:0.8rem;">${awb.DataStatus}</td>
                 `;
 
                 let trDetail = document.createElement('tr');
@@ -168,6 +153,52 @@ function CarregarDados() {
         });
 }
 
+function GetClasseStatus(statusAwb) {
+    const status = statusAwb ? statusAwb.toUpperCase() : '';
+
+    const successStatus = ['ENTREGUE', 'CARGA ENTREGUE'];
+    const dangerStatus = ['RETIDA', 'ATRASADO', 'DELAY', 'CANCELADO'];
+    const warningStatus = ['RECEPCAO DOCUMENTAL', 'LIBERADO PELA FISCALIZAÇÃO', 'EM PROCESSO DE LIBERAÇÃO FISCAL'];
+    const infoStatus = ['CARGA ALOCADA', 'EMBARQUE CONFIRMADO', 'AGUARDANDO DESEMBARQUE', 'AGUARDANDO', 'CARGA DESEMBARCADA', 'EMBARQUE SURFACE', 'DESEMBARQUE VÔO', 'EMBARQUE VÔO'];
+
+    if (successStatus.some(s => status.includes(s))) return 'badge-success';
+    if (dangerStatus.some(s => status.includes(s))) return 'badge-danger';
+    if (warningStatus.some(s => status.includes(s))) return 'badge-warning';
+    if (infoStatus.some(s => status.includes(s))) return 'badge-info';
+    return 'badge-secondary';
+}
+
+function GetHtmlVoo(voo, dataStatus) {
+    if(!voo || voo.length <= 2) return '<span style="color:#ccc;">-</span>';
+    return `<span class="voo-interativo" title="Duplo clique para detalhes do voo" 
+               ondblclick="AbrirModalVoo('${voo}', '${dataStatus}', event)">
+               <i class="ph-bold ph-airplane-tilt"></i> ${voo}</span>`;
+}
+
+// --- ATUALIZAÇÃO EM TEMPO REAL (Server-Sent Events) ---
+// O servidor consulta o TB_AWB_STATUS uma vez por intervalo para todos os painéis
+// e envia apenas as AWBs que mudaram de status; aqui só as linhas visíveis são atualizadas.
+function IniciarStreamStatus() {
+    if(!window.EventSource || !APP_CONFIG.urls.streamStatus) return;
+    const stream = new EventSource(APP_CONFIG.urls.streamStatus);
+
+    stream.addEventListener('status', (ev) => {
+        JSON.parse(ev.data).forEach(AtualizarLinhaStatus);
+    });
+
+    // Ficamos tempo demais sem receber eventos: recarrega a lista inteira
+    stream.addEventListener('recarregar', () => CarregarDados());
+}
+
+function AtualizarLinhaStatus(mudanca) {
+    const trMain = document.querySelector(`#tabela-awbs tr.row-main[data-numero="${CSS.escape(mudanca.Numero)}"]`);
+    if(!trMain) return;
+
+    trMain.querySelector('.cel-status').innerHTML = `<span class="badge ${GetClasseStatus(mudanca.Status)}">${mudanca.Status}</span>`;
+    trMain.querySelector('.cel-data-status').innerText = mudanca.DataStatus;
+    trMain.querySelector('.cel-voo').innerHTML = GetHtmlVoo(mudanca.Voo, mudanca.DataStatus);
+}
+
 function PlotarRotaResumo(awb) {
     if(awb.RotaMap && awb.RotaMap.Origem) {
         // Usa a função de curva
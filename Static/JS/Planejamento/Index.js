@@ -2,11 +2,18 @@
  * Index.js - Controlador do Painel de Planejamento (Versão Modern UI)
  */
 
-let DADOS_ORIGINAIS = [];
+// Filtros, ordenação e paginação são feitos no servidor: aqui fica só a página atual
 let DADOS_VISIVEIS = [];
 let ORDEM_ATUAL = { col: 'data_raw', dir: 'desc' };
 let ABA_ATUAL = 'TODOS';
 let isAnimating = false;
+let PAGINACAO = { pagina: 1, tamanho: 50, total: 0, totalPaginas: 1 };
+let ETAG_PAGINA = null; // ETag da última página recebida (versão da fila + parâmetros)
+let OPCOES_ATUAIS = null; // Opções dos filtros já aplicadas aos selects (JSON), para só redesenhar se mudarem
+let TIMER_FILTRO = null;
+
+// Intervalo da consulta da fila (ms). Se nada mudou o servidor responde 304, sem corpo
+const INTERVALO_ATUALIZACAO = 60000;
 
 // Formatadores
 const fmtMoeda = new Intl.NumberFormat('pt-BR', { style: 'currency', currency: 'BRL' });
@@ -18,6 +25,7 @@ const fmtNumero = new Intl.NumberFormat('pt-BR', { minimumFractionDigits: 2, max
 document.addEventListener('DOMContentLoaded', () => {
     AtualizarDataExtenso();
     BuscarDados();
+    setInterval(() => BuscarDados(false, true), INTERVALO_ATUALIZACAO);
 });
 
 function AtualizarDataExtenso() {
@@ -33,48 +41,100 @@ function AtualizarDataExtenso() {
 // ============================================================================
 // 2. API E DADOS
 // ============================================================================
-async function BuscarDados() {
+function MontarParametros(forcar) {
+    const params = new URLSearchParams({
+        pagina: PAGINACAO.pagina,
+        tamanho: PAGINACAO.tamanho,
+        ordem: ORDEM_ATUAL.col,
+        dir: ORDEM_ATUAL.dir
+    });
+    const filtros = {
+        bloco: ABA_ATUAL,
+        q: document.getElementById('input-busca')?.value.trim() || '',
+        prioridade: document.getElementById('filtro-prioridade')?.value || 'TODOS',
+        filial: document.getElementById('filtro-filial')?.value || 'TODOS',
+        motivo: document.getElementById('filtro-motivo')?.value || 'TODOS',
+        uf: document.getElementById('filtro-uf')?.value || 'TODOS',
+        tipo_carga: document.getElementById('filtro-tipo-carga')?.value || 'TODOS'
+    };
+    Object.entries(filtros).forEach(([nome, valor]) => {
+        if (valor && valor !== 'TODOS') params.set(nome, valor);
+    });
+    if (forcar) params.set('atualizar', '1');
+    return params;
+}
+
+// 'forcar' pede ao servidor que refaça a fila na hora (senão vem o retrato do último ciclo).
+// 'silencioso' (atualização periódica) mantém a tabela na tela e aceita 304 se nada mudou.
+async function BuscarDados(forcar = false, silencioso = false) {
     try {
         const tabela = document.getElementById('table-body');
-        if(tabela) tabela.innerHTML = '<tr><td colspan="11" style="text-align:center; padding:20px;">Carregando dados...</td></tr>';
+        if(tabela && !silencioso) tabela.innerHTML = '<tr><td colspan="11" style="text-align:center; padding:20px;">Carregando dados...</td></tr>';
 
-        const resp = await fetch(URL_API_LISTAR);
-        if (!resp.ok) throw new Error("Erro na requisição");
-        
-        const dadosNovos = await resp.json();
-
-        // Pré-processamento para busca rápida e ordenação
-        dadosNovos.forEach(d => {
-            // Cria campo data numérico para ordenação (YYYYMMDDHHMM)
-            const partes = d.data_emissao.split('/'); // assumindo dd/mm/yyyy
-            const horaLimpa = d.hora_emissao ? d.hora_emissao.replace(':', '') : '0000';
-            d.data_raw = Number(`${partes[2]}${partes[1]}${partes[0]}${horaLimpa}`);
-
-            // Texto completo para o filtro de busca
-            d.busca_texto = `${d.ctc} ${d.remetente} ${d.destinatario} ${d.origem} ${d.destino} ${d.filial} ${d.tipo_carga} ${d.motivodoc} ${d.prioridade}`.toLowerCase();
-            
-            // Tratamento de valores numéricos
-            d.peso_fisico = Number(d.peso_fisico || 0);
-            d.peso_taxado = Number(d.peso_taxado || 0); // Mantém para ordenação principal
-            d.raw_val_mercadoria = Number(d.raw_val_mercadoria || 0);
-            d.volumes = Number(d.volumes || 0);
-            d.qtd_notas = Number(d.qtd_notas || 0);
+        const resp = await fetch(`${URL_API_LISTAR}?${MontarParametros(forcar)}`, {
+            cache: 'no-store',
+            headers: silencioso && ETAG_PAGINA ? { 'If-None-Match': ETAG_PAGINA } : {}
         });
-
-        if (DADOS_ORIGINAIS.length === 0) {
-            PopularSelects(dadosNovos);
+        if (resp.status === 304) return;
+        if (!resp.ok) {
+            // 503: a fila ainda não pôde ser montada; o servidor explica no campo 'erro'
+            const falha = await resp.json().catch(() => ({}));
+            throw new Error(falha.erro || "Erro na requisição");
         }
+        ETAG_PAGINA = resp.headers.get('ETag');
+        
+        const payload = await resp.json();
+        ExibirAvisoBlocos(payload.blocos);
+
+        const geradoEm = document.getElementById('gerado-em');
+        if (geradoEm) geradoEm.innerText = `Fila atualizada em ${payload.gerado_em}`;
+
+        PopularSelects(payload.opcoes);
 
-        DADOS_ORIGINAIS = dadosNovos;
-        FiltrarTabela();
+        PAGINACAO = {
+            pagina: payload.pagina,
+            tamanho: payload.tamanho_pagina,
+            total: payload.total,
+            totalPaginas: payload.total_paginas
+        };
+        DADOS_VISIVEIS = payload.ctcs.map(PrepararItem);
+        Renderizar();
+        AtualizarKPIs(payload.total, payload.agregados);
+        AtualizarPaginacao();
 
     } catch (e) {
         console.error("Erro API:", e);
+        if (silencioso) return; // Mantém a página atual; a próxima consulta tenta de novo
         const tabela = document.getElementById('table-body');
         if(tabela) tabela.innerHTML = `<tr><td colspan="11" style="color:red; text-align:center;">Erro ao carregar: ${e.message}</td></tr>`;
     }
 }
 
+// Pré-processamento dos valores numéricos para exibição
+function PrepararItem(d) {
+    // Tratamento de valores numéricos
+    d.peso_fisico = Number(d.peso_fisico || 0);
+    d.peso_taxado = Number(d.peso_taxado || 0); // Mantém para ordenação principal
+    d.raw_val_mercadoria = Number(d.raw_val_mercadoria || 0);
+    d.volumes = Number(d.volumes || 0);
+    d.qtd_notas = Number(d.qtd_notas || 0);
+    return d;
+}
+
+// Blocos que falharam ou estouraram o tempo chegam vazios: avisa que a lista está incompleta
+function ExibirAvisoBlocos(blocos) {
+    const aviso = document.getElementById('aviso-blocos');
+    if (!aviso || !blocos) return;
+
+    const falhas = Object.entries(blocos).filter(([, info]) => info.erro);
+    if (falhas.length === 0) {
+        aviso.style.display = 'none';
+        return;
+    }
+    aviso.innerHTML = `<i class="ph-bold ph-warning"></i> Lista parcial: ${falhas.map(([nome, info]) => `${nome} (${info.erro})`).join(', ')}`;
+    aviso.style.display = 'block';
+}
+
 // ============================================================================
 // 3. TABELA E RENDERIZAÇÃO
 // ============================================================================
@@ -95,7 +155,6 @@ function Renderizar() {
                     Nenhum registro encontrado para os filtros atuais.
                 </td>
             </tr>`;
-        contador.innerText = 'Mostrando 0 registros';
         return;
     }
 
@@ -190,9 +249,32 @@ function Renderizar() {
     });
 
     tbody.appendChild(fragment);
-    contador.innerText = `Mostrando ${DADOS_VISIVEIS.length} registros`;
-    
-    AtualizarKPIs();
+}
+
+function AtualizarPaginacao() {
+    const contador = document.getElementById('contador-registros');
+    const { pagina, tamanho, total, totalPaginas } = PAGINACAO;
+
+    if (contador) {
+        const inicio = total ? (pagina - 1) * tamanho + 1 : 0;
+        const fim = Math.min(pagina * tamanho, total);
+        contador.innerText = `Mostrando ${inicio}–${fim} de ${total} registros`;
+    }
+
+    const info = document.getElementById('pag-info');
+    if (info) info.innerText = `Página ${pagina} de ${totalPaginas}`;
+
+    const anterior = document.getElementById('pag-anterior');
+    const proxima = document.getElementById('pag-proxima');
+    if (anterior) anterior.disabled = pagina <= 1;
+    if (proxima) proxima.disabled = pagina >= totalPaginas;
+}
+
+function MudarPagina(delta) {
+    const nova = PAGINACAO.pagina + delta;
+    if (nova < 1 || nova > PAGINACAO.totalPaginas) return;
+    PAGINACAO.pagina = nova;
+    BuscarDados();
 }
 
 // ============================================================================
@@ -235,45 +317,17 @@ function MudarAba(tipo) {
     }, 400);
 }
 
+// Filtros e busca voltam para a primeira página. Espera o usuário parar de digitar antes de consultar
 function FiltrarTabela() {
-    const termo = document.getElementById('input-busca')?.value.toLowerCase() || '';
-    const prio = document.getElementById('filtro-prioridade')?.value || 'TODOS';
-    const filial = document.getElementById('filtro-filial')?.value || 'TODOS';
-    const motivo = document.getElementById('filtro-motivo')?.value || 'TODOS';
-
-    DADOS_VISIVEIS = DADOS_ORIGINAIS.filter(item => {
-        // Filtro de Texto
-        const matchTexto = !termo || item.busca_texto.includes(termo);
-        
-        // --- ATUALIZADO: Filtros Select (3 Prioridades) ---
-        let matchPrio = true;
-        const pItem = (item.prioridade || 'NORMAL').toUpperCase();
-
-        if (prio !== 'TODOS') {
-            if (prio === 'URGENTE') {
-                matchPrio = (pItem === 'S' || pItem === 'URGENTE');
-            } else if (prio === 'AGENDADA') {
-                matchPrio = (pItem === 'AGENDADA');
-            } else if (prio === 'NORMAL') {
-                // Normal é tudo que NÃO é Urgente nem Agendada
-                matchPrio = (pItem !== 'S' && pItem !== 'URGENTE' && pItem !== 'AGENDADA');
-            }
-        }
-                          
-        const matchFilial = (filial === 'TODOS') || (item.filial === filial);
-        const matchMotivo = (motivo === 'TODOS') || (item.motivodoc === motivo);
-        
-        // Filtro da Aba
-        const matchAba = (ABA_ATUAL === 'TODOS') || (item.origem_dados === ABA_ATUAL);
-
-        return matchTexto && matchPrio && matchFilial && matchMotivo && matchAba;
-    });
-
-    AplicarOrdenacao();
-    Renderizar();
+    clearTimeout(TIMER_FILTRO);
+    TIMER_FILTRO = setTimeout(() => {
+        PAGINACAO.pagina = 1;
+        BuscarDados();
+    }, 300);
 }
 
-function AtualizarKPIs() {
+// Totais do conjunto filtrado inteiro (calculados no servidor), não só da página
+function AtualizarKPIs(total, agregados) {
     // IDs atualizados conforme o novo HTML
     const elTotal = document.getElementById('kpi-total');
     const elPeso = document.getElementById('kpi-peso');
@@ -282,20 +336,10 @@ function AtualizarKPIs() {
 
     if (!elTotal) return; 
 
-    let totalPeso = 0;
-    let totalValor = 0;
-    let totalNotas = 0;
-
-    DADOS_VISIVEIS.forEach(d => {
-        totalPeso += d.peso_taxado;
-        totalValor += d.raw_val_mercadoria;
-        totalNotas += d.qtd_notas;
-    });
-
-    elTotal.innerText = DADOS_VISIVEIS.length;
-    elPeso.innerText = fmtNumero.format(totalPeso);
-    elValor.innerText = totalValor.toLocaleString('pt-BR', { minimumFractionDigits: 2, maximumFractionDigits: 2 });
-    elNotas.innerText = totalNotas;
+    elTotal.innerText = total;
+    elPeso.innerText = fmtNumero.format(agregados.peso_taxado);
+    elValor.innerText = agregados.valor.toLocaleString('pt-BR', { minimumFractionDigits: 2, maximumFractionDigits: 2 });
+    elNotas.innerText = agregados.notas;
 }
 
 // ============================================================================
@@ -316,48 +360,32 @@ function Ordenar(coluna) {
         thAtual.className = ORDEM_ATUAL.dir === 'asc' ? 'ph-bold ph-caret-up' : 'ph-bold ph-caret-down';
     }
 
-    AplicarOrdenacao();
-    Renderizar();
+    PAGINACAO.pagina = 1;
+    BuscarDados();
 }
 
-function AplicarOrdenacao() {
-    const col = ORDEM_ATUAL.col;
-    const dir = ORDEM_ATUAL.dir === 'asc' ? 1 : -1;
-
-    DADOS_VISIVEIS.sort((a, b) => {
-        let valA = a[col];
-        let valB = b[col];
-
-        if (typeof valA === 'string') valA = valA.toLowerCase();
-        if (typeof valB === 'string') valB = valB.toLowerCase();
-
-        if (valA < valB) return -1 * dir;
-        if (valA > valB) return 1 * dir;
-        return 0;
-    });
+// Opções vêm prontas do servidor (valores distintos da fila inteira, já ordenados)
+// e acompanham cada versão da fila: filiais, motivos, UFs e tipos de carga novos aparecem sem recarregar a página.
+function PopularSelects(opcoes) {
+    if (!opcoes) return;
+    const json = JSON.stringify(opcoes);
+    if (json === OPCOES_ATUAIS) return;
+    OPCOES_ATUAIS = json;
+
+    PreencherSelect('filtro-filial', opcoes.filiais);
+    PreencherSelect('filtro-motivo', opcoes.motivos);
+    PreencherSelect('filtro-uf', opcoes.ufs);
+    PreencherSelect('filtro-tipo-carga', opcoes.tipos_carga);
 }
 
-function PopularSelects(dados) {
-    const filiais = new Set();
-    const motivos = new Set();
-
-    dados.forEach(d => {
-        if(d.filial) filiais.add(d.filial);
-        if(d.motivodoc) motivos.add(d.motivodoc);
-    });
-
-    const selFilial = document.getElementById('filtro-filial');
-    const selMotivo = document.getElementById('filtro-motivo');
-
-    if(selFilial) {
-        Array.from(filiais).sort().forEach(f => {
-            selFilial.innerHTML += `<option value="${f}">${f}</option>`;
-        });
-    }
+// Refaz as opções mantendo a primeira ('Todos') e a seleção atual, mesmo que ela tenha saído da fila
+function PreencherSelect(id, valores) {
+    const sel = document.getElementById(id);
+    if (!sel || !valores) return;
 
-    if(selMotivo) {
-        Array.from(motivos).sort().forEach(m => {
-            selMotivo.innerHTML += `<option value="${m}">${m}</option>`;
-        });
-    }
+    const selecionado = sel.value;
+    const lista = (selecionado !== 'TODOS' && !valores.includes(selecionado)) ? [selecionado, ...valores] : valores;
+    sel.length = 1;
+    lista.forEach(v => sel.add(new Option(v, v)));
+    sel.value = selecionado;
 }
\ No newline at end of file
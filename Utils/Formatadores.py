@@ -1,5 +1,36 @@
-from datetime import datetime, date
+from datetime import datetime, date, time
 import re
+import pandas as pd
+
+# Mapa de meses em português
+MAPA_MESES = {
+    'jan': '01', 'fev': '02', 'mar': '03', 'abr': '04', 'mai': '05', 'jun': '06',
+    'jul': '07', 'ago': '08', 'set': '09', 'out': '10', 'nov': '11', 'dez': '12'
+}
+FORMATOS_DATA = ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%d/%m/%y']
+
+# De-Para do NomeRegiao da base de aeroportos para a sigla da UF
+MAPA_REGIAO_UF = {
+    'SAO PAULO': 'SP', 'RIO DE JANEIRO': 'RJ', 'MINAS GERAIS': 'MG',
+    'ESPIRITO SANTO': 'ES', 'PARANA': 'PR', 'SANTA CATARINA': 'SC',
+    'RIO GRANDE DO SUL': 'RS', 'BAHIA': 'BA', 'PERNAMBUCO': 'PE',
+    'CEARA': 'CE', 'DISTRITO FEDERAL': 'DF', 'GOIAS': 'GO',
+    'AMAZONAS': 'AM', 'PARA': 'PA', 'MATO GROSSO': 'MT',
+    'MATO GROSSO DO SUL': 'MS', 'ACRE': 'AC', 'ALAGOAS': 'AL',
+    'AMAPA': 'AP', 'MARANHAO': 'MA', 'PARAIBA': 'PB',
+    'PIAUI': 'PI', 'RIO GRANDE DO NORTE': 'RN', 'RONDONIA': 'RO',
+    'RORAIMA': 'RR', 'SERGIPE': 'SE', 'TOCANTINS': 'TO'
+}
+
+def UfDaRegiao(NomeRegiao):
+    """
+    Converte o NomeRegiao do aeroporto na sigla da UF.
+    Se não estiver no mapa, usa as 2 primeiras letras. Vazio retorna None.
+    """
+    if not NomeRegiao:
+        return None
+    RegiaoUpper = str(NomeRegiao).upper().strip()
+    return MAPA_REGIAO_UF.get(RegiaoUpper, RegiaoUpper[:2])
 
 def PadronizarData(Valor):
     """
@@ -19,15 +50,9 @@ def PadronizarData(Valor):
 
     ValorStr = str(Valor).strip().lower()
 
-    # Mapa de meses em português
-    MapaMeses = {
-        'jan': '01', 'fev': '02', 'mar': '03', 'abr': '04', 'mai': '05', 'jun': '06',
-        'jul': '07', 'ago': '08', 'set': '09', 'out': '10', 'nov': '11', 'dez': '12'
-    }
-
     try:
         # 1. Substitui meses texto por números
-        for MesTexto, MesNum in MapaMeses.items():
+        for MesTexto, MesNum in MAPA_MESES.items():
             if MesTexto in ValorStr:
                 ValorStr = ValorStr.replace(MesTexto, MesNum)
                 break
@@ -36,11 +61,7 @@ def PadronizarData(Valor):
         ValorLimpo = re.sub(r'[^0-9/\-]', '', ValorStr)
 
         # 3. Tenta converter formatos comuns
-        FormatosPossiveis = [
-            '%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%d/%m/%y'
-        ]
-
-        for Fmt in FormatosPossiveis:
+        for Fmt in FORMATOS_DATA:
             try:
                 return datetime.strptime(ValorLimpo, Fmt).date()
             except ValueError:
@@ -50,4 +71,61 @@ def PadronizarData(Valor):
 
     except Exception as e:
         print(f"⚠️ Erro ao padronizar data '{Valor}': {e}")
-        return None
\ No newline at end of file
+        return None
+
+def PadronizarDatas(Serie):
+    """
+    Versão vetorizada do PadronizarData para uma coluna inteira (pandas Series).
+    Retorna uma Series de objetos date, com None onde a data não pôde ser interpretada.
+    """
+    Resultado = pd.Series(pd.NaT, index=Serie.index, dtype='datetime64[ns]')
+
+    # Coluna já tipada como data pelo Excel
+    if pd.api.types.is_datetime64_any_dtype(Serie):
+        Resultado = Serie.dt.normalize()
+    else:
+        EhData = Serie.map(lambda v: isinstance(v, (datetime, date)))
+        if EhData.any():
+            Resultado[EhData] = pd.to_datetime(Serie[EhData]).dt.normalize()
+
+        Textos = Serie[~EhData & Serie.notna()].astype(str).str.strip().str.lower()
+        Textos = Textos[Textos != '']
+        if not Textos.empty:
+            # 1. Meses por extenso -> número; 2. Remove caracteres estranhos
+            Textos = Textos.str.replace('|'.join(MAPA_MESES), lambda m: MAPA_MESES[m.group(0)], n=1, regex=True)
+            Textos = Textos.str.replace(r'[^0-9/\-]', '', regex=True)
+
+            # 3. Cada formato só preenche o que os anteriores não resolveram
+            Convertidas = pd.Series(pd.NaT, index=Textos.index, dtype='datetime64[ns]')
+            for Fmt in FORMATOS_DATA:
+                Pendentes = Convertidas.isna()
+                if not Pendentes.any():
+                    break
+                Convertidas[Pendentes] = pd.to_datetime(Textos[Pendentes], format=Fmt, errors='coerce')
+            Resultado[Convertidas.index] = Convertidas
+
+    return Resultado.dt.date.where(Resultado.notna(), None)
+
+def PadronizarHorarios(Serie, Padrao=time(0, 0)):
+    """
+    Converte uma coluna de horários ('HH:MM' ou 'HH:MM:SS') em objetos time, de forma vetorizada.
+    Valores vazios ou inválidos viram 'Padrao'.
+    """
+    Textos = Serie.astype(str).str.strip()
+    Textos = Textos.where(Textos.str.len() != 5, Textos + ':00')
+    Convertidos = pd.to_datetime(Textos, format='%H:%M:%S', errors='coerce')
+    return Convertidos.dt.time.where(Convertidos.notna(), Padrao)
+
+# Prefixos de Cia que aparecem grudados no número do voo (ex: G31234, LA3456/12)
+PREFIXOS_VOO = ['G3', 'JJ', 'LA', 'AD', 'TP', 'QR', 'H2', 'CM', 'AC', 'AF', 'UX']
+
+def LimparNumeroVoo(NumeroVoo):
+    """
+    Reduz o número do voo aos dígitos: remove sufixo '/..', prefixos de Cia e caracteres não numéricos.
+    Ex: 'G3 1234/15' -> '1234'
+    """
+    if not NumeroVoo: return ""
+    Base = NumeroVoo.split('/')[0].upper().strip()
+    for Prefixo in PREFIXOS_VOO:
+        Base = Base.replace(Prefixo, '')
+    return "".join(filter(str.isdigit, Base))
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 # Método HARVERSINE para cálculo de distância entre dois pontos geográficos
 def Haversine(lat1, lon1, lat2, lon2):
     """
@@ -34,4 +35,41 @@ def Haversine(lat1, lon1, lat2, lon2):
     
     # c = 2 ⋅ atan2( √a, √(1−a) )
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
\ No newline at end of file
+    return R * c
+
+DISTANCIA_INVALIDA = 999999
+
+def _ArrayCoordenadas(Valores):
+    """None vira NaN para que o NumPy trate como coordenada inválida."""
+    return np.asarray(np.where(np.equal(Valores, None), np.nan, Valores), dtype=np.float64)
+
+def HaversineVetorizado(lat1, lon1, lat2, lon2):
+    """
+    Versão NumPy do Haversine: aceita escalares ou arrays e segue as regras de broadcasting
+    (um ponto contra N pontos, ou N pares elemento a elemento).
+    Mesma regra do escalar: coordenada vazia, NaN ou 0 resulta em 999999.
+    """
+    Lat1, Lon1, Lat2, Lon2 = (_ArrayCoordenadas(v) for v in (lat1, lon1, lat2, lon2))
+    R = 6371
+
+    dLat = np.radians(Lat2 - Lat1)
+    dLon = np.radians(Lon2 - Lon1)
+    a = np.sin(dLat / 2) ** 2 + np.cos(np.radians(Lat1)) * np.cos(np.radians(Lat2)) * np.sin(dLon / 2) ** 2
+    Distancias = R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    Invalido = np.zeros(np.shape(Distancias), dtype=bool)
+    for Coordenada in (Lat1, Lon1, Lat2, Lon2):
+        Invalido |= np.isnan(Coordenada) | (Coordenada == 0)
+    return np.where(Invalido, DISTANCIA_INVALIDA, Distancias)
+
+def MatrizDistancias(Lats1, Lons1, Lats2=None, Lons2=None):
+    """
+    Matriz N x M de distâncias (Km) entre duas listas de pontos.
+    Sem a segunda lista, calcula a matriz N x N da primeira contra ela mesma.
+    """
+    Lats1, Lons1 = _ArrayCoordenadas(Lats1), _ArrayCoordenadas(Lons1)
+    if Lats2 is None:
+        Lats2, Lons2 = Lats1, Lons1
+    else:
+        Lats2, Lons2 = _ArrayCoordenadas(Lats2), _ArrayCoordenadas(Lons2)
+    return HaversineVetorizado(Lats1[:, None], Lons1[:, None], Lats2[None, :], Lons2[None, :])
@@ -0,0 +1,85 @@
+import os
+import json
+from uuid import uuid4
+from datetime import date, time, datetime
+import numpy as np
+import pandas as pd
+from werkzeug.utils import secure_filename
+
+# Extensão do snapshot gravado ao lado do arquivo temporário do upload
+EXTENSAO_SNAPSHOT = '.snapshot.json'
+
+# Tipos que o JSON não representa: gravados como {'$t': tipo, 'v': isoformat}
+_DECODIFICADORES = {'datetime': datetime.fromisoformat, 'date': date.fromisoformat, 'time': time.fromisoformat}
+
+def SalvarUpload(FileStorage, DirTemp):
+    """
+    Grava o upload em DirTemp com nome gerado pelo servidor; do nome enviado só aproveita a extensão.
+    Retorna o caminho gravado.
+    """
+    Extensao = os.path.splitext(secure_filename(FileStorage.filename or ''))[1].lower()
+    Caminho = os.path.join(DirTemp, uuid4().hex + Extensao)
+    FileStorage.save(Caminho)
+    return Caminho
+
+def ResolverUpload(DirTemp, NomeTemp):
+    """
+    Caminho do upload a partir do nome guardado na sessão do usuário.
+    Retorna None se o nome não apontar para um arquivo existente diretamente dentro de DirTemp.
+    """
+    if not NomeTemp:
+        return None
+    Base = os.path.realpath(DirTemp)
+    Caminho = os.path.realpath(os.path.join(Base, NomeTemp))
+    if os.path.dirname(Caminho) != Base or not os.path.isfile(Caminho):
+        return None
+    return Caminho
+
+def CaminhoSnapshot(CaminhoArquivo):
+    return CaminhoArquivo + EXTENSAO_SNAPSHOT
+
+def _Codificar(Valor):
+    if Valor is pd.NaT:
+        return None
+    if isinstance(Valor, datetime):
+        return {'$t': 'datetime', 'v': Valor.isoformat()}
+    if isinstance(Valor, date):
+        return {'$t': 'date', 'v': Valor.isoformat()}
+    if isinstance(Valor, time):
+        return {'$t': 'time', 'v': Valor.isoformat()}
+    if isinstance(Valor, np.generic):
+        return Valor.item()
+    raise TypeError(f"Tipo não suportado no snapshot: {type(Valor).__name__}")
+
+def _Decodificar(Objeto):
+    if '$t' in Objeto:
+        return _DECODIFICADORES[Objeto['$t']](Objeto['v'])
+    return Objeto
+
+def SalvarSnapshot(Df, CaminhoArquivo):
+    """
+    Grava o DataFrame já normalizado (colunas tipadas) ao lado do upload, em JSON com os dtypes.
+    A etapa de análise lê a planilha uma única vez; o processamento final carrega este snapshot.
+    """
+    Conteudo = Df.to_dict(orient='split', index=False)
+    Conteudo['tipos'] = {Coluna: str(Tipo) for Coluna, Tipo in Df.dtypes.items()}
+    with open(CaminhoSnapshot(CaminhoArquivo), 'w', encoding='utf-8') as Arquivo:
+        json.dump(Conteudo, Arquivo, default=_Codificar)
+
+def CarregarSnapshot(CaminhoArquivo):
+    """Retorna o DataFrame do snapshot ou None se ele não existir / não puder ser lido."""
+    Caminho = CaminhoSnapshot(CaminhoArquivo)
+    if not os.path.exists(Caminho):
+        return None
+    try:
+        with open(Caminho, encoding='utf-8') as Arquivo:
+            Conteudo = json.load(Arquivo, object_hook=_Decodificar)
+        return pd.DataFrame(Conteudo['data'], columns=Conteudo['columns'], dtype=object).astype(Conteudo['tipos'])
+    except Exception:
+        return None
+
+def RemoverArquivoESnapshot(CaminhoArquivo):
+    """Apaga o upload temporário e o snapshot associado."""
+    for Caminho in (CaminhoArquivo, CaminhoSnapshot(CaminhoArquivo)):
+        if Caminho and os.path.exists(Caminho):
+            os.remove(Caminho)